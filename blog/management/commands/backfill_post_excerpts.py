@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post, reading_stats
+
+
+class Command(BaseCommand):
+    help = "Compute the excerpt, word count and reading time of posts saved before they were precomputed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Posts updated per query.")
+        parser.add_argument('--all', action='store_true', help="Recompute every post, not only the missing ones.")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('pk', 'content_body').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(excerpt__isnull=True)
+
+        batch = []
+        updated = 0
+        for post in posts.iterator(chunk_size=options['batch_size']):
+            post.excerpt, post.word_count, post.reading_time = reading_stats(post.content_body)
+            batch.append(post)
+            if len(batch) >= options['batch_size']:
+                updated += self.flush(batch)
+        updated += self.flush(batch)
+
+        self.stdout.write(self.style.SUCCESS("Updated %d posts." % updated))
+
+    def flush(self, batch):
+        # bulk_update() skips Post.save(), nothing else about the posts changes
+        Post.objects.bulk_update(batch, ['excerpt', 'word_count', 'reading_time'])
+        count = len(batch)
+        batch.clear()
+        return count
@@ -1,6 +1,32 @@
 from django.db import models
 from django.contrib.auth.models import User
 from ckeditor.fields import RichTextField
+from html2text import HTML2Text
+
+EXCERPT_LENGTH = 300
+WORDS_PER_MINUTE = 200
+
+
+def reading_stats(html):
+    """Plain text excerpt, word count and reading time in minutes of a rich text body"""
+    converter = HTML2Text()
+    converter.ignore_links = True
+    converter.ignore_images = True
+    converter.ignore_emphasis = True
+    converter.body_width = 0
+    # Drop the markdown heading, list and quote markers html2text leaves behind
+    words = [word for word in converter.handle(html or '').split() if word.strip('#*->')]
+
+    excerpt = ''
+    for word in words:
+        if len(excerpt) + len(word) + 1 > EXCERPT_LENGTH:
+            excerpt += '...'
+            break
+        excerpt = '%s %s' % (excerpt, word) if excerpt else word
+
+    reading_time = -(-len(words) // WORDS_PER_MINUTE)
+    return excerpt, len(words), reading_time
+
 
 
 class Post(models.Model):
@@ -15,6 +41,10 @@ class Post(models.Model):
     thumbnail_image = models.ImageField(
         upload_to='blog_tumbnails/', blank=True, null=True)
     content_body = RichTextField()
+    # Precomputed from content_body on save, for the post list
+    excerpt = models.TextField(blank=True, null=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=0, editable=False, help_text="In minutes.")
 
     pub_date = models.DateTimeField(auto_now_add=True)
     date_to_show = models.DateTimeField(blank=True, null=True)
@@ -29,6 +59,7 @@ class Post(models.Model):
             self.author_name = self.author_user.username
         if not self.date_to_show:
             self.date_to_show = self.pub_date
+        self.excerpt, self.word_count, self.reading_time = reading_stats(self.content_body)
 
         super().save(*args, **kwargs)
 
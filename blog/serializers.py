@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from blog import models
+from main.serializers import DynamicFieldsModelSerializer
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = models.Comment
@@ -10,10 +11,9 @@ class CommentSerializer(serializers.ModelSerializer):
                   'user_social_name', 'data')
 
 
-class PostSerializers(serializers.ModelSerializer):
+class PostListSerializer(DynamicFieldsModelSerializer):
+    """Slim post representation for listings, without the body and comments"""
     show_bool = serializers.SerializerMethodField('check_show')
-    # related_name argument is used in model
-    comments = CommentSerializer(many=True, read_only=True)
 
     def check_show(self, obj):
         if obj.show == False:
@@ -23,6 +23,9 @@ class PostSerializers(serializers.ModelSerializer):
             obj.author_name = None
             obj.featured = None
             obj.content_body = None
+            obj.excerpt = None
+            obj.word_count = None
+            obj.reading_time = None
             obj.thumbnail_image = None
             obj.date_to_show = None
             obj.featured = None
@@ -31,7 +34,30 @@ class PostSerializers(serializers.ModelSerializer):
         elif obj.show == True:
             return True
 
+    def to_representation(self, obj):
+        # Hidden posts are blanked even when show_bool isn't requested
+        self.check_show(obj)
+        return super().to_representation(obj)
+
+    class Meta:
+        model = models.Post
+        fields = ('show_bool', 'id', 'title', 'author_name', 'thumbnail_image', 'excerpt', 'word_count',
+                  'reading_time', 'date_to_show', 'featured')
+        always_load = ('show', )
+        field_sources = {'show_bool': ('show', )}
+        expandable_fields = {
+            'comments': (CommentSerializer, {'many': True, 'read_only': True}),
+        }
+
+
+class PostSerializers(PostListSerializer):
+    # related_name argument is used in model
+    comments = CommentSerializer(many=True, read_only=True)
+
     class Meta:
         model = models.Post
         fields = ('show_bool', 'id', 'title', 'author_name',
-                  'thumbnail_image', 'content_body', 'date_to_show', 'comments', 'featured')
+                  'thumbnail_image', 'content_body', 'excerpt', 'word_count', 'reading_time', 'date_to_show',
+                  'comments', 'featured')
+        always_load = PostListSerializer.Meta.always_load
+        field_sources = PostListSerializer.Meta.field_sources
@@ -2,17 +2,30 @@ from django.shortcuts import render
 from rest_framework import viewsets, generics
 from blog import serializers
 from blog import models
+from main.mixins import SparseFieldsetMixin
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.Post.objects.all()
     serializer_class = serializers.PostSerializers
     lookup_field = 'id'
     http_method_names = ['get']
 
+    # The listing only needs the precomputed excerpt, the body and comments are sent on detail
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.queryset.defer('content_body')
+        return self.queryset.prefetch_related('comments')
 
-class CommentViewSet(viewsets.ModelViewSet):
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return serializers.PostListSerializer
+        return self.serializer_class
+
+
+class CommentViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.Comment.objects.all()
     serializer_class = serializers.CommentSerializer
     lookup_field = 'id'
     http_method_names = ['get', 'post']
+    throttle_scope = 'comments'
@@ -0,0 +1,23 @@
+"""
+ASGI config for glug_website project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, with the
+public read endpoints served asynchronously by main.async_views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "glug_website.settings")
+
+# What get_asgi_application() does, with a handler that streams responses from a thread
+django.setup(set_prefix=False)
+
+# Imported once the apps are loaded
+from main.async_views import PublicReadApplication, StreamingASGIHandler  # noqa: E402
+
+application = PublicReadApplication(StreamingASGIHandler())
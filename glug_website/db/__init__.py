@@ -0,0 +1 @@
+"""Database backends with connection health checks and pooling, see glug_website/db/pool.py"""
@@ -0,0 +1,237 @@
+"""Connection reuse for the database backends of this package.
+
+Django keeps one connection per thread and, with CONN_MAX_AGE, can keep it open between
+requests. These backends add, through optional keys of the DATABASES entry:
+
+- HEALTH_CHECKS: check a kept connection with `SELECT 1` before its first use in a
+  request, so a connection the server dropped is replaced instead of failing the request.
+- POOL_SIZE: share up to this many connections between all threads of a worker process.
+  Connections are returned to the pool when Django closes them at the end of a request
+  (use CONN_MAX_AGE 0), waiting at most POOL_TIMEOUT seconds for a free one, and are
+  replaced once they are older than POOL_MAX_AGE seconds. 0 disables the pool.
+
+Connection counts and pool waits are exported on `/metrics` through `samples()`.
+"""
+import collections
+import os
+import threading
+import time
+
+STAT_NAMES = ('opened', 'closed', 'reused', 'health_check_failures', 'waits', 'wait_seconds')
+
+_pools = {}
+_pools_lock = threading.Lock()
+_stats = collections.defaultdict(lambda: dict.fromkeys(STAT_NAMES, 0))
+_stats_lock = threading.Lock()
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def count(alias, name, value=1):
+    with _stats_lock:
+        _stats[alias][name] += value
+
+
+def check(raw_connection):
+    """Whether a raw DB-API connection still answers"""
+    try:
+        cursor = raw_connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+def discard(alias, raw_connection):
+    count(alias, 'closed')
+    try:
+        raw_connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Up to `size` raw connections of one alias, shared by the threads of a process"""
+
+    def __init__(self, alias, size, max_age, timeout):
+        self.alias = alias
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        # (connection, opened at), the most recently used last
+        self.idle = []
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, connect, health_checks=True):
+        """An idle connection that still works, or a new one from `connect()` while the pool isn't full"""
+        deadline = None
+        with self.condition:
+            while True:
+                while self.idle:
+                    raw_connection, opened = self.idle.pop()
+                    if time.monotonic() - opened >= self.max_age:
+                        discard(self.alias, raw_connection)
+                        continue
+                    if health_checks and not check(raw_connection):
+                        count(self.alias, 'health_check_failures')
+                        discard(self.alias, raw_connection)
+                        continue
+                    self.in_use += 1
+                    count(self.alias, 'reused')
+                    return raw_connection, opened
+
+                if self.in_use < self.size:
+                    # Counted as in use while connecting so other threads don't overshoot the size
+                    self.in_use += 1
+                    break
+
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    count(self.alias, 'waits')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted("No free connection for %r after %ss" % (self.alias, self.timeout))
+                started = time.monotonic()
+                self.condition.wait(remaining)
+                count(self.alias, 'wait_seconds', time.monotonic() - started)
+
+        try:
+            raw_connection = connect()
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        count(self.alias, 'opened')
+        return raw_connection, time.monotonic()
+
+    def release(self, raw_connection, opened, reusable=True):
+        with self.condition:
+            self.in_use -= 1
+            if reusable and time.monotonic() - opened < self.max_age:
+                self.idle.append((raw_connection, opened))
+            else:
+                discard(self.alias, raw_connection)
+            self.condition.notify()
+
+    def close_idle(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for raw_connection, opened in idle:
+            discard(self.alias, raw_connection)
+
+
+def get_pool(alias, settings_dict):
+    """The pool of `alias` in this process, None when pooling is off"""
+    size = settings_dict.get('POOL_SIZE') or 0
+    if size <= 0:
+        return None
+    # Keyed by pid as well, a forked worker must not use its parent's sockets
+    key = (alias, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(alias, size, settings_dict.get('POOL_MAX_AGE') or 300,
+                                         settings_dict.get('POOL_TIMEOUT') or 10)
+        return _pools[key]
+
+
+def close_idle_pools():
+    """Close the idle pooled connections of this process, e.g. before forking workers"""
+    with _pools_lock:
+        pools = [pool for (alias, pid), pool in _pools.items() if pid == os.getpid()]
+    for pool in pools:
+        pool.close_idle()
+
+
+def samples():
+    """Connection metrics of this process as (name, type, help, labels, value)"""
+    with _stats_lock:
+        stats = {alias: dict(values) for alias, values in _stats.items()}
+    for alias, values in sorted(stats.items()):
+        labels = {'alias': alias}
+        yield ('glug_db_connections_opened_total', 'counter', 'Database connections opened.', labels,
+               values['opened'])
+        yield ('glug_db_connections_closed_total', 'counter', 'Database connections closed.', labels,
+               values['closed'])
+        yield ('glug_db_connections_reused_total', 'counter', 'Connections handed out again by the pool.', labels,
+               values['reused'])
+        yield ('glug_db_health_check_failures_total', 'counter', 'Kept connections that failed their health check.',
+               labels, values['health_check_failures'])
+        yield ('glug_db_pool_waits_total', 'counter', 'Connection requests that had to wait for a full pool.', labels,
+               values['waits'])
+        yield ('glug_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.', labels,
+               values['wait_seconds'])
+    with _pools_lock:
+        pools = [pool for (alias, pid), pool in _pools.items() if pid == os.getpid()]
+    for pool in pools:
+        labels = {'alias': pool.alias}
+        yield ('glug_db_pool_connections_in_use', 'gauge', 'Pooled connections handed out.', labels, pool.in_use)
+        yield ('glug_db_pool_connections_idle', 'gauge', 'Pooled connections waiting to be reused.', labels,
+               len(pool.idle))
+
+
+class PooledDatabaseWrapperMixin:
+    """Health checks and pooling for a backend's DatabaseWrapper, see the module docstring"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool_opened_at = None
+
+    @property
+    def health_checks(self):
+        return self.settings_dict.get('HEALTH_CHECKS', False)
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+        if pool is None:
+            raw_connection = super().get_new_connection(conn_params)
+            count(self.alias, 'opened')
+        else:
+            try:
+                raw_connection, self.pool_opened_at = pool.acquire(
+                    lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+                    self.health_checks)
+            except PoolExhausted as e:
+                raise self.Database.OperationalError(str(e)) from e
+        # Just opened or checked by the pool
+        self.health_check_done = True
+        return raw_connection
+
+    def _close(self):
+        pool = get_pool(self.alias, self.settings_dict)
+        if self.connection is None:
+            return None
+        if pool is None:
+            count(self.alias, 'closed')
+            return super()._close()
+
+        reusable = (not self.in_atomic_block and self.get_autocommit() == self.settings_dict['AUTOCOMMIT']
+                    and (not self.errors_occurred or self.is_usable()))
+        if reusable:
+            try:
+                # Don't hand a half finished transaction to the next thread
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        pool.release(self.connection, self.pool_opened_at, reusable)
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and self.health_checks
+                and not self.in_atomic_block):
+            if not self.is_usable():
+                count(self.alias, 'health_check_failures')
+                self.close()
+        self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs when a request starts and ends, check the kept connection again before its next use
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
@@ -0,0 +1,104 @@
+"""Sends the reads of public API requests to a read replica.
+
+`main.middleware.ReplicaMiddleware` decides per request: safe requests to DRF viewsets
+read from the DB_REPLICA_ALIAS database, everything else (writes, the admin, management
+commands, the mailer worker) uses the primary. Clients that wrote something keep reading
+from the primary for DB_REPLICA_STICKY_SECONDS so they see their own writes, and a
+replica that fails is left alone for DB_REPLICA_RETRY_SECONDS.
+
+Writers are pinned to the primary by an entry in the shared cache keyed by what the client
+sends with every request anyway: its Authorization header, else its session cookie, else
+its address. A cookie of our own would not do, the frontend is on another origin and
+doesn't send credentials.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+_down_until = {}
+
+
+def replica_alias():
+    alias = getattr(settings, 'DB_REPLICA_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def start_request(use_replica):
+    _state.use_replica = use_replica
+    _state.wrote = False
+
+
+def end_request():
+    """Whether the request wrote to the primary"""
+    wrote = getattr(_state, 'wrote', False)
+    _state.use_replica = False
+    _state.wrote = False
+    return wrote
+
+
+def reading_from_replica():
+    return getattr(_state, 'use_replica', False) and not getattr(_state, 'wrote', False)
+
+
+def use_primary():
+    _state.use_replica = False
+
+
+def sticky_seconds():
+    return getattr(settings, 'DB_REPLICA_STICKY_SECONDS', 10)
+
+
+def pin_key(identity):
+    # Hashed, the identity holds tokens and session keys
+    return 'replica-pin:%s' % hashlib.sha256(identity.encode()).hexdigest()
+
+
+def pin(identity):
+    """Send the reads of `identity` to the primary for DB_REPLICA_STICKY_SECONDS"""
+    cache.set(pin_key(identity), 1, sticky_seconds())
+
+
+def is_pinned(identity):
+    return cache.get(pin_key(identity)) is not None
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + getattr(settings, 'DB_REPLICA_RETRY_SECONDS', 30)
+    try:
+        connections[alias].close()
+    except Exception:
+        pass
+
+
+def available(alias):
+    """Whether the replica takes connections, it is left alone for a while after a failure"""
+    if time.monotonic() < _down_until.get(alias, 0):
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except Exception:
+        mark_down(alias)
+        return False
+    return True
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return replica_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Later reads of the same request have to see this write
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
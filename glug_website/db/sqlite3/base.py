@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from glug_website.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite stand-in for the PostgreSQL backend, to try health checks and the pool locally"""
@@ -0,0 +1,136 @@
+"""Gunicorn settings of the production server.
+
+    gunicorn -c python:glug_website.gunicorn_conf
+
+Workers follow the CPUs and memory given to the container: 2 x CPUs + 1 of them when they
+fit in memory, otherwise as many as fit with threads making up the difference. The app is
+loaded and warmed up once in the master (see main/warmup.py) and the workers are forked
+from it, sharing its memory copy-on-write. Workers are replaced after a jittered number of
+requests so leaks don't build up and they don't all restart at once. The SERVER_*
+variables override every choice.
+"""
+import gc
+import math
+import os
+import time
+
+# Not `from decouple import config`, gunicorn would take that for its own `config` setting
+import decouple
+
+
+# Loading the config is the first thing gunicorn does
+boot_started = time.monotonic()
+
+
+def read(path):
+    try:
+        with open(path) as value:
+            return value.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota():
+    """CPUs allowed by the cgroup CPU quota, None without a quota"""
+    # cgroup v2 has "<quota> <period>", or "max <period>" without a quota
+    limit = read('/sys/fs/cgroup/cpu.max')
+    if limit:
+        quota, period = limit.split()
+        return None if quota == 'max' else int(quota) / int(period)
+    quota, period = read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cpu_count():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def memory_bytes():
+    """Memory of the machine, or the cgroup memory limit when that is lower"""
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limit = read(path)
+        if limit and limit.isdigit():
+            return min(memory, int(limit))
+    return memory
+
+
+MB = 1024 * 1024
+
+# Resident memory of one worker, and what the master, the OS and the rest of the container need
+worker_memory = decouple.config('SERVER_WORKER_MEMORY_MB', default=150, cast=int) * MB
+reserved_memory = decouple.config('SERVER_RESERVED_MEMORY_MB', default=256, cast=int) * MB
+
+wanted_workers = 2 * cpu_count() + 1
+fitting_workers = max(1, (memory_bytes() - reserved_memory) // worker_memory)
+workers = decouple.config('SERVER_WORKERS', default=min(wanted_workers, fitting_workers), cast=int)
+
+# wsgi, or asgi for glug_website.asgi, see main/async_views.py
+mode = decouple.config('SERVER_MODE', default='wsgi')
+if mode == 'asgi':
+    wsgi_app = 'glug_website.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'glug_website.wsgi:application'
+    threads = decouple.config('SERVER_THREADS', default=math.ceil(wanted_workers / workers), cast=int)
+    worker_class = 'gthread' if threads > 1 else 'sync'
+
+bind = decouple.config('SERVER_BIND', default='0.0.0.0:8000')
+preload_app = decouple.config('SERVER_PRELOAD', default=True, cast=bool)
+max_requests = decouple.config('SERVER_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = decouple.config('SERVER_MAX_REQUESTS_JITTER', default=max_requests // 10, cast=int)
+timeout = decouple.config('SERVER_TIMEOUT', default=30, cast=int)
+graceful_timeout = decouple.config('SERVER_GRACEFUL_TIMEOUT', default=30, cast=int)
+# Heartbeat files on a disk backed overlay filesystem can stall workers
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    from glug_website.db.pool import close_idle_pools
+    from main import warmup
+
+    started = time.monotonic()
+    warmup.warm_up()
+    server.log.info("Warmed up in %.2fs, %.2fs after starting", time.monotonic() - started,
+                    time.monotonic() - boot_started)
+    # Forked workers must not share the master's sockets
+    connections.close_all()
+    close_idle_pools()
+    # Objects created so far are left alone by the collector, which would otherwise copy their pages
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from main import warmup
+        started = time.monotonic()
+        warmup.warm_up()
+        worker.log.info("Worker %s warmed up in %.2fs", worker.pid, time.monotonic() - started)
+
+
+def child_exit(server, worker):
+    # Counters of the exited worker move to a shared file before its pid can be reused
+    directory = decouple.config('METRICS_DIR', default='')
+    if directory:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'glug_website.settings')
+        from main import metrics
+        metrics.retire_worker(worker.pid, directory)
+
+
+def on_starting(server):
+    server.log.info("%d %s workers%s, max %d requests (+%d jitter)", workers, worker_class,
+                    ' with %d threads' % threads if worker_class == 'gthread' else '', max_requests,
+                    max_requests_jitter)
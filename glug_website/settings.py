@@ -47,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.MetricsMiddleware',
+    'main.middleware.QueryLogMiddleware',
+    'main.middleware.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,17 +93,45 @@ WSGI_APPLICATION = 'glug_website.wsgi.application'
 #         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
 #     }
 # }
+# Database connections, see glug_website/db/pool.py
+# DB_CONN_MODE 'close' opens a connection per request, 'persistent' keeps one per worker thread for
+# DB_CONN_MAX_AGE seconds and 'pool' shares up to DB_POOL_SIZE connections between the threads of a worker.
+DB_CONN_MODE = config('DB_CONN_MODE', default='persistent')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'glug_website.db.postgresql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE if DB_CONN_MODE == 'persistent' else 0,
+        # Check kept connections before their first use in a request
+        'HEALTH_CHECKS': config('DB_HEALTH_CHECKS', default=True, cast=bool),
+        'POOL_SIZE': config('DB_POOL_SIZE', default=4, cast=int) if DB_CONN_MODE == 'pool' else 0,
+        'POOL_MAX_AGE': DB_CONN_MAX_AGE,
+        # Seconds to wait for a free pooled connection
+        'POOL_TIMEOUT': config('DB_POOL_TIMEOUT', default=10, cast=float),
     }
 }
 
+# Read replica for the public API, see glug_website/db/router.py. Set DB_REPLICA_HOST to enable it.
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                HOST=config('DB_REPLICA_HOST'),
+                                PORT=config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+                                NAME=config('DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+                                USER=config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+                                PASSWORD=config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+                                TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['glug_website.db.router.ReplicaRouter']
+DB_REPLICA_ALIAS = 'replica'
+# Seconds a client reads from the primary after writing something
+DB_REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=10, cast=int)
+# Seconds the replica is left alone after it failed
+DB_REPLICA_RETRY_SECONDS = config('DB_REPLICA_RETRY_SECONDS', default=30, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -128,9 +159,47 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
+    # Views opt in by setting `throttle_scope`, see main/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'main.throttling.IPBucketThrottle',
+        'main.throttling.SocialIdBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'comments.read': config('THROTTLE_COMMENTS_READ', default='120/min'),
+        'comments.write': config('THROTTLE_COMMENTS_WRITE', default='5/min'),
+        'register.write': config('THROTTLE_REGISTER_WRITE', default='10/hour'),
+    },
 }
 
+# Cache
+# Throttle buckets have to be shared by all gunicorn workers to be enforced site wide, use memcached
+# (CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache, CACHE_LOCATION=host:11211) in production.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# ASGI mode (glug_website.asgi), see main/async_views.py
+# wsgi or asgi, also read by glug_website/gunicorn_conf.py
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+# Threads per process running the views of uncached public reads, and so its most database connections
+ASYNC_ORM_THREADS = config('ASYNC_ORM_THREADS', default=8, cast=int)
+# Seconds a public read response stays cached, changes to the models it shows invalidate it earlier
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+# Public reads are only cached in a cache the workers share, unless there is one process using locmem anyway
+API_CACHE_LOCAL = config('API_CACHE_LOCAL', default=False, cast=bool)
+# Public URL of the API, the warm-up and the snapshots render the public reads as requested through it
+WARMUP_URL = config('WARMUP_URL', default='http://localhost:8000')
+
+# Static JSON snapshots of the public API for the front proxy, see main/snapshot.py and `manage.py snapshot_api`
+SNAPSHOT_ROOT = config('SNAPSHOT_ROOT', default=os.path.join(BASE_DIR, 'snapshot/'))
+# Update the snapshots of changed objects SNAPSHOT_DELAY seconds after they are saved
+SNAPSHOT_ENABLED = config('SNAPSHOT_ENABLED', default=False, cast=bool)
+SNAPSHOT_DELAY = config('SNAPSHOT_DELAY', default=5, cast=int)
+
 # CKEDITOR_CONFIGS = {
 #     'full_toolbar': {
 #         'toolbar': 'full',
@@ -158,14 +227,75 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Uploads with the same content share one file, see main/storage.py
+DEFAULT_FILE_STORAGE = ('main.storage.ContentAddressedStorage' if config('MEDIA_DEDUPE', default=True, cast=bool)
+                        else 'django.core.files.storage.FileSystemStorage')
+# Unreferenced media files younger than this are kept by `manage.py gc_media`, and where it moves them
+MEDIA_GC_GRACE_HOURS = config('MEDIA_GC_GRACE_HOURS', default=24, cast=float)
+MEDIA_GC_QUARANTINE_DIR = config('MEDIA_GC_QUARANTINE_DIR', default=os.path.join(BASE_DIR, 'media_quarantine/'))
+# Pages of Linit editions uploaded as a ZIP or PDF, see main/linit.py
+LINIT_PAGE_WIDTH = config('LINIT_PAGE_WIDTH', default=1600, cast=int)
+LINIT_PAGE_QUALITY = config('LINIT_PAGE_QUALITY', default=82, cast=int)
+LINIT_PDF_DPI = config('LINIT_PDF_DPI', default=150, cast=int)
+LINIT_INGEST_WORKERS = config('LINIT_INGEST_WORKERS', default=0, cast=int)
+LINIT_INGEST_TIMEOUT = config('LINIT_INGEST_TIMEOUT', default=600, cast=int)
+LINIT_UPLOAD_DIR = config('LINIT_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'linit_uploads/'))
+# Largest side in pixels of the low quality image placeholders sent with the images
+PLACEHOLDER_SIZE = config('PLACEHOLDER_SIZE', default=16, cast=int)
 
 LOGIN_URL = '/admin/login/'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Sessions
+# Cache-first sessions read from the cache and only fall back to the database on a miss.
+SESSION_ENGINE = ('django.contrib.sessions.backends.cached_db' if config('SESSION_CACHE_FIRST', default=False, cast=bool)
+                  else 'django.contrib.sessions.backends.db')
+# Number of expired sessions deleted per statement by `manage.py purge_sessions`
+SESSION_PURGE_CHUNK_SIZE = config('SESSION_PURGE_CHUNK_SIZE', default=1000, cast=int)
+
+# Metrics
+# `/metrics` answers only requests with `Authorization: Bearer <METRICS_TOKEN>`, and is disabled without a token.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Shared directory the gunicorn workers flush their counters to every METRICS_FLUSH_INTERVAL seconds,
+# so `/metrics` reports the whole server instead of the worker that answers. Empty to keep them per process.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+
+# Slow-query log, see main/querylog.py and `manage.py querylog_top`
+QUERYLOG_ENABLED = config('QUERYLOG_ENABLED', default=False, cast=bool)
+# Statements slower than this are logged on their own with their EXPLAIN output
+QUERYLOG_SLOW_MS = config('QUERYLOG_SLOW_MS', default=100, cast=int)
+QUERYLOG_FLUSH_INTERVAL = config('QUERYLOG_FLUSH_INTERVAL', default=60, cast=int)
+QUERYLOG_FILE = config('QUERYLOG_FILE', default=os.path.join(BASE_DIR, 'logs/querylog.jsonl'))
+QUERYLOG_MAX_BYTES = config('QUERYLOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+QUERYLOG_BACKUP_COUNT = config('QUERYLOG_BACKUP_COUNT', default=5, cast=int)
+
+# Rows fetched per query by the CSV/JSON-lines exports, see main/exports.py
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Rows validated and written per transaction by the bulk imports, see main/imports.py
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=500, cast=int)
+
+# Admin log entries moved out by `manage.py archive_logentries`
+LOG_ARCHIVE_DIR = config('LOG_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'log_archive/'))
+
+# Use django.core.mail.backends.locmem.EmailBackend or .filebased.EmailBackend for local testing
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=os.path.join(BASE_DIR, 'sent_mails/'))
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.sendgrid.net')
-EMAIL_PORT = config('EMAIL_PORT', default=587)
+EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='None')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='None')
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
+
+# Mailer outbox, see mailer/outbox.py for what these do
+MAILER_CONCURRENCY = config('MAILER_CONCURRENCY', default=2, cast=int)
+MAILER_CHUNK_SIZE = config('MAILER_CHUNK_SIZE', default=50, cast=int)
+MAILER_BATCH_SIZE = config('MAILER_BATCH_SIZE', default=5, cast=int)
+MAILER_RATE_PER_MINUTE = config('MAILER_RATE_PER_MINUTE', default=60, cast=int)
+MAILER_MAX_ATTEMPTS = config('MAILER_MAX_ATTEMPTS', default=5, cast=int)
+MAILER_RETRY_BACKOFF = config('MAILER_RETRY_BACKOFF', default=60, cast=int)
+MAILER_SPOOL_DIR = config('MAILER_SPOOL_DIR', default=os.path.join(BASE_DIR, 'mail_spool/'))
+MAILER_ATTACHMENT_MAX_SIZE = config('MAILER_ATTACHMENT_MAX_SIZE', default=20 * 1024 * 1024, cast=int)
+MAILER_HISTORY_PAGE_SIZE = config('MAILER_HISTORY_PAGE_SIZE', default=25, cast=int)
 
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
\ No newline at end of file
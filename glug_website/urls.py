@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.conf import settings
 from django.urls import path, include
 from rest_framework.authtoken import views
+from main.views import metrics, ready
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,6 +25,8 @@ urlpatterns = [
     path('blog/', include('blog.urls', namespace='blog')),
     path('mail/', include('mailer.urls', namespace='mailer')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics, name='metrics'),
+    path('ready', ready, name='ready'),
 ]
 
 if settings.DEBUG:
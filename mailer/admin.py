@@ -1,8 +1,13 @@
-from django.contrib import admin
-from mailer.models import MailSent
+from django.contrib import admin, messages
+from mailer.models import MailSent, OutboxMail
+from mailer import outbox
 
 class MailSentAdmin(admin.ModelAdmin):
-    readonly_fields = [f.name for f in MailSent._meta.get_fields()]
+    list_display = ['subject', 'status', 'recipient_count', 'sent_count', 'failed_count', 'time', 'finished',
+                    'sent_by']
+    list_filter = ['status']
+    list_select_related = ['sent_by']
+    readonly_fields = [f.name for f in MailSent._meta.fields]
 
     def has_add_permission(self, request):
         return False
@@ -10,4 +15,29 @@ class MailSentAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return request.user.is_superuser and request.method != 'POST'
 
-admin.site.register(MailSent, MailSentAdmin)
\ No newline at end of file
+
+class OutboxMailAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'campaign', 'status', 'message_count', 'attempts', 'next_attempt', 'sent_at']
+    list_filter = ['status']
+    list_select_related = ['campaign']
+    readonly_fields = [f.name for f in OutboxMail._meta.fields]
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser and request.method != 'POST'
+
+    def requeue(self, request, queryset):
+        batches = queryset.exclude(status='SENT')
+        queued = outbox.requeue(batches)
+        if queued < batches.count():
+            self.message_user(request, "%d batches were not queued again, their campaign is finished and its "
+                              "attachment has been removed." % (batches.count() - queued), messages.WARNING)
+
+    requeue.short_description = "Queue again for delivery"
+
+
+admin.site.register(MailSent, MailSentAdmin)
+admin.site.register(OutboxMail, OutboxMailAdmin)
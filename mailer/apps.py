@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def fill_search_keys(sender, **kwargs):
+    """Give campaigns saved before the history search existed their search keys"""
+    from mailer.models import MailSent
+    missing = MailSent.objects.filter(subject_key='')
+    for mail in missing.only('pk', 'subject', 'to').iterator():
+        mail.update_search_keys()
+        MailSent.objects.filter(pk=mail.pk).update(subject_key=mail.subject_key, to_key=mail.to_key)
 
 
 class MailerConfig(AppConfig):
     name = 'mailer'
+
+    def ready(self):
+        post_migrate.connect(fill_search_keys, sender=self)
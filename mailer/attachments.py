@@ -0,0 +1,72 @@
+"""Campaign attachments, spooled to disk and base64 encoded once per campaign.
+
+The upload is streamed chunk by chunk into an already encoded spool file. A worker builds
+the MIME part from that file once per round of claimed batches, attaches the same part to
+every mail of the round and drops it with `clear()` afterwards. The spool file is removed
+once the campaign is finished, whether it was delivered or not.
+"""
+import base64
+import functools
+import mimetypes
+import os
+import uuid
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+
+# base64 turns 57 bytes into one 76 character line, the longest MIME allows
+LINE_BYTES = 57
+READ_SIZE = LINE_BYTES * 1024
+
+
+def spool_dir():
+    return getattr(settings, 'MAILER_SPOOL_DIR', None) or os.path.join(settings.BASE_DIR, 'mail_spool/')
+
+
+def max_size():
+    return getattr(settings, 'MAILER_ATTACHMENT_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def spool(uploaded_file):
+    """Write an uploaded file base64 encoded to the spool directory, returns the spool file path"""
+    os.makedirs(spool_dir(), exist_ok=True)
+    path = os.path.join(spool_dir(), '%s.b64' % uuid.uuid4().hex)
+    pending = b''
+    with open(path, 'w', encoding='ascii') as spool_file:
+        for chunk in uploaded_file.chunks(READ_SIZE):
+            pending += chunk
+            # Only encode whole lines so the output doesn't depend on the upload's chunking
+            cut = len(pending) - len(pending) % LINE_BYTES
+            for start in range(0, cut, LINE_BYTES):
+                spool_file.write(base64.b64encode(pending[start:start + LINE_BYTES]).decode('ascii') + '\n')
+            pending = pending[cut:]
+        if pending:
+            spool_file.write(base64.b64encode(pending).decode('ascii') + '\n')
+    return path
+
+
+def content_type(name, fallback=None):
+    return mimetypes.guess_type(name)[0] or fallback or 'application/octet-stream'
+
+
+@functools.lru_cache(maxsize=2)
+def mime_part(path, name, mimetype):
+    """The MIME part for a spooled attachment, built once and shared by all mails until `clear()`"""
+    maintype, subtype = mimetype.split('/', 1)
+    part = MIMEBase(maintype, subtype)
+    with open(path, encoding='ascii') as spool_file:
+        # Already encoded, the email package won't touch it again
+        part.set_payload(spool_file.read())
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=name)
+    return part
+
+
+def clear():
+    """Drop the cached MIME parts, they hold whole attachments in memory"""
+    mime_part.cache_clear()
+
+
+def discard(path):
+    if path and os.path.exists(path):
+        os.remove(path)
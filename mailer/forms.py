@@ -1,11 +1,38 @@
 from django import forms
 from ckeditor.widgets import CKEditorWidget
+from mailer import attachments, recipients
+from mailer.models import MailSent
 
 class MailComposeForm(forms.Form):
     subject = forms.CharField(label="Subject", max_length=1024)
-    to = forms.CharField(label="To", max_length=1024,
-        widget=forms.TextInput(attrs={'placeholder' : "Use comma(,) separated addresses for multiple recipients."}))
+    groups = forms.MultipleChoiceField(label="Recipient groups", choices=recipients.GROUPS, required=False,
+        widget=forms.CheckboxSelectMultiple)
+    passout_years = forms.TypedMultipleChoiceField(label="Alumni of passout years", coerce=int, required=False)
+    to = forms.CharField(label="To", required=False,
+        widget=forms.Textarea(attrs={'placeholder' : "Use comma(,) separated addresses for multiple recipients.",
+                                     'class': 'materialize-textarea'}))
+    delivery = forms.ChoiceField(label="Delivery", choices=MailSent.DELIVERY, initial='INDIVIDUAL')
     body = forms.CharField(label="Message", max_length=4096,
         widget=forms.Textarea(attrs={'id':'editor'}),
         required=False)
     attachment = forms.FileField(required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(MailComposeForm, self).__init__(*args, **kwargs)
+        self.fields['passout_years'].choices = [(year, year) for year in recipients.alumni_years()]
+
+    def clean_attachment(self):
+        attachment = self.cleaned_data['attachment']
+        if attachment and attachment.size > attachments.max_size():
+            raise forms.ValidationError('File too large. Size should not exceed %d MiB.' %
+                                        (attachments.max_size() // (1024 * 1024)))
+        return attachment
+
+    def clean_to(self):
+        return [address.strip() for address in self.cleaned_data['to'].split(",") if address.strip()]
+
+    def clean(self):
+        cleaned_data = super(MailComposeForm, self).clean()
+        if not (cleaned_data.get('groups') or cleaned_data.get('passout_years') or cleaned_data.get('to')):
+            raise forms.ValidationError("Choose a recipient group or enter at least one address.")
+        return cleaned_data
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from mailer import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver mails queued in the mailer outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency',
+                            type=int,
+                            help="Delivery threads, each with its own SMTP connection. "
+                            "Defaults to MAILER_CONCURRENCY.")
+        parser.add_argument('--batch-size',
+                            type=int,
+                            help="Mails sent over one connection per round. Defaults to MAILER_BATCH_SIZE.")
+        parser.add_argument('--poll-interval',
+                            type=float,
+                            default=5,
+                            help="Seconds to wait when the outbox is empty or the rate limit is reached.")
+        parser.add_argument('--once', action='store_true', help="Exit once nothing is due instead of polling.")
+
+    def handle(self, *args, **options):
+        try:
+            delivered = outbox.run_worker(concurrency=options['concurrency'],
+                                          batch_size=options['batch_size'],
+                                          once=options['once'],
+                                          poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS("Delivered %d mails." % delivered))
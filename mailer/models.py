@@ -1,16 +1,103 @@
 from django.db import models
 from django.core.mail.message import EmailMessage
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class MailSent(models.Model):
+    """One mail campaign, delivered in batches through the outbox"""
+    # Choices of delivery
+    DELIVERY = (
+        ('INDIVIDUAL', 'One mail per recipient'),
+        ('BCC', 'Recipients in Bcc'),
+    )
+    # Choices of status
+    STATUS = (
+        ('QUEUED', 'Queued'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('PARTIAL', 'Partially sent'),
+        ('FAILED', 'Failed'),
+    )
+
     subject = models.CharField(max_length=1024)
     body = models.TextField(blank=True, null=True)
+    html_body = models.TextField(blank=True, null=True)
     from_email = models.CharField(max_length=512)
-    to = models.CharField(max_length=1024)
+    to = models.CharField(max_length=1024, help_text="Summary of the recipient groups and addresses.")
     attachment = models.BooleanField(default=False)
+    attachment_name = models.CharField(max_length=255, blank=True, null=True)
+    attachment_type = models.CharField(max_length=255, blank=True, null=True)
+    # Base64 encoded copy of the attachment, removed once the campaign is finished
+    attachment_spool = models.CharField(max_length=512, blank=True, null=True)
+    delivery = models.CharField(max_length=16, choices=DELIVERY, default='INDIVIDUAL')
+
+    status = models.CharField(max_length=16, choices=STATUS, default='QUEUED')
+    recipient_count = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    batch_count = models.PositiveIntegerField(default=0)
+    batches_done = models.PositiveIntegerField(default=0)
 
     sent_by = models.ForeignKey(User, on_delete=models.CASCADE)
     time = models.DateTimeField(blank=True, null=True)
+    # Set once every batch has been delivered or given up on
+    finished = models.DateTimeField(blank=True, null=True)
+
+    # Lowercased prefixes for the history search, LIKE 'prefix%' can use their indexes
+    subject_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+    to_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+
+    class Meta:
+        verbose_name = "Mail campaign"
+        indexes = [
+            # Keyset pagination of the history goes newest first by (time, id)
+            models.Index(fields=['-time', '-id'], name='mailer_mailsent_history_idx'),
+        ]
 
     def __str__(self):
         return self.subject
+
+    def update_search_keys(self):
+        self.subject_key = self.subject.lower()[:255]
+        self.to_key = self.to.lower()[:255]
+
+    def save(self, *args, **kwargs):
+        self.update_search_keys()
+        super().save(*args, **kwargs)
+
+
+class OutboxMail(models.Model):
+    """A batch of a campaign's recipients waiting for `manage.py mailer_worker` to deliver it"""
+    STATUS = (
+        ('QUEUED', 'Queued'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+
+    campaign = models.ForeignKey(MailSent, on_delete=models.CASCADE, related_name='batches')
+    to = models.TextField(help_text="Comma separated addresses still to be delivered.")
+    # Mails this batch puts on the wire, what the per-minute rate limit counts
+    message_count = models.PositiveIntegerField(default=1)
+
+    status = models.CharField(max_length=16, choices=STATUS, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # For QUEUED batches the earliest retry time, for SENDING batches the time the worker's claim expires
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Outbox batch"
+        verbose_name_plural = "Outbox batches"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt']),
+            models.Index(fields=['sent_at']),
+        ]
+
+    def __str__(self):
+        return "%s (batch %s)" % (self.campaign_id, self.pk)
+
+    def recipients(self):
+        return [address.strip() for address in self.to.split(",") if address.strip()]
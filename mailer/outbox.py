@@ -0,0 +1,316 @@
+"""Persistent outbox for the mailer app.
+
+A campaign is split into batches of recipients when it is queued, and the batches are
+delivered by `manage.py mailer_worker`, so a slow or failing SMTP server never blocks a
+request. All settings are optional, see `DEFAULTS`.
+"""
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from mailer import attachments
+from mailer.models import MailSent, OutboxMail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Threads delivering mails, each with its own SMTP connection
+    'MAILER_CONCURRENCY': 2,
+    # Recipients per outbox batch, i.e. per Bcc mail
+    'MAILER_CHUNK_SIZE': 50,
+    # Batches claimed by one thread and sent over one connection
+    'MAILER_BATCH_SIZE': 5,
+    # Mails put on the wire per minute across all workers, 0 for no limit
+    'MAILER_RATE_PER_MINUTE': 60,
+    'MAILER_MAX_ATTEMPTS': 5,
+    # Seconds before the first retry, doubled on every further attempt
+    'MAILER_RETRY_BACKOFF': 60,
+    'MAILER_MAX_BACKOFF': 6 * 60 * 60,
+    # Seconds after which batches claimed by a dead worker are picked up again
+    'MAILER_CLAIM_TIMEOUT': 10 * 60,
+}
+
+
+def mailer_setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def enqueue(subject,
+            text_body,
+            html_body,
+            from_email,
+            recipients,
+            user,
+            delivery='INDIVIDUAL',
+            summary=None,
+            attachment=None):
+    """Create a campaign for a list of addresses and queue it in batches of MAILER_CHUNK_SIZE.
+
+    An uploaded `attachment` is spooled to disk here, once for the whole campaign.
+    """
+    chunk_size = mailer_setting('MAILER_CHUNK_SIZE')
+    chunks = [recipients[i:i + chunk_size] for i in range(0, len(recipients), chunk_size)]
+    spool_path = attachments.spool(attachment) if attachment else None
+
+    with transaction.atomic():
+        campaign = MailSent.objects.create(subject=subject,
+                                           body=text_body,
+                                           html_body=html_body,
+                                           from_email=from_email,
+                                           to=summary or ", ".join(recipients)[:1024],
+                                           attachment=bool(attachment),
+                                           attachment_name=attachment.name if attachment else None,
+                                           attachment_type=attachments.content_type(
+                                               attachment.name, attachment.content_type) if attachment else None,
+                                           attachment_spool=spool_path,
+                                           delivery=delivery,
+                                           recipient_count=len(recipients),
+                                           batch_count=len(chunks),
+                                           sent_by=user,
+                                           time=timezone.now())
+        OutboxMail.objects.bulk_create([
+            OutboxMail(campaign=campaign,
+                       to=",".join(chunk),
+                       message_count=1 if delivery == 'BCC' else len(chunk)) for chunk in chunks
+        ])
+    return campaign
+
+
+def sent_last_minute():
+    recent = OutboxMail.objects.filter(status='SENT', sent_at__gte=timezone.now() - datetime.timedelta(minutes=1))
+    return recent.aggregate(total=Sum('message_count'))['total'] or 0
+
+
+def allowance():
+    """How many more mails may go out right now without going over the per-minute rate, None for no limit"""
+    rate = mailer_setting('MAILER_RATE_PER_MINUTE')
+    if not rate:
+        return None
+    return max(0, rate - sent_last_minute())
+
+
+def claim(limit, budget=None):
+    """Mark up to `limit` due batches holding at most `budget` mails as SENDING and return them.
+
+    A batch larger than the whole budget is still handed out on its own so it can't starve.
+    Rows are locked with SKIP LOCKED where the database supports it, so several workers
+    can poll the same outbox without handing out a batch twice.
+    """
+    if limit <= 0 or budget == 0:
+        return []
+    now = timezone.now()
+    due = OutboxMail.objects.filter(status__in=['QUEUED', 'SENDING'],
+                                    next_attempt__lte=now).select_related('campaign').order_by('next_attempt')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            # Don't lock the campaign rows other threads keep counters on
+            of = ('self', ) if connection.features.has_select_for_update_of else ()
+            due = due.select_for_update(skip_locked=True, of=of)
+        batches = []
+        for batch in due[:limit]:
+            if budget is not None and batches and batch.message_count > budget:
+                break
+            batches.append(batch)
+            if budget is not None:
+                budget -= batch.message_count
+                if budget <= 0:
+                    break
+        OutboxMail.objects.filter(pk__in=[batch.pk for batch in batches]).update(
+            status='SENDING', next_attempt=now + datetime.timedelta(seconds=mailer_setting('MAILER_CLAIM_TIMEOUT')))
+        MailSent.objects.filter(pk__in={batch.campaign_id
+                                        for batch in batches}, status='QUEUED').update(status='SENDING')
+    return batches
+
+
+def build_messages(batch, smtp_connection):
+    """Mails for the remaining recipients of a batch, paired with the recipients each one covers"""
+    campaign = batch.campaign
+    recipients = batch.recipients()
+    part = attachments.mime_part(campaign.attachment_spool, campaign.attachment_name,
+                                 campaign.attachment_type) if campaign.attachment else None
+    if campaign.delivery == 'BCC':
+        groups = [recipients]
+    else:
+        groups = [[address] for address in recipients]
+
+    for group in groups:
+        if campaign.delivery == 'BCC':
+            msg = EmailMultiAlternatives(campaign.subject, campaign.body, campaign.from_email, bcc=group,
+                                         connection=smtp_connection)
+        else:
+            msg = EmailMultiAlternatives(campaign.subject, campaign.body, campaign.from_email, group,
+                                         connection=smtp_connection)
+        if campaign.html_body:
+            msg.attach_alternative(campaign.html_body, "text/html")
+        if part is not None:
+            msg.attach(part)
+        yield msg, group
+
+
+def finish_batch(batch, sent, failed):
+    """Add a finished batch to its campaign's counters and close the campaign after its last batch"""
+    MailSent.objects.filter(pk=batch.campaign_id).update(sent_count=F('sent_count') + sent,
+                                                         failed_count=F('failed_count') + failed,
+                                                         batches_done=F('batches_done') + 1)
+    campaign = MailSent.objects.get(pk=batch.campaign_id)
+    if campaign.batches_done >= campaign.batch_count:
+        if not campaign.failed_count:
+            status = 'SENT'
+        elif campaign.sent_count:
+            status = 'PARTIAL'
+        else:
+            status = 'FAILED'
+        closed = MailSent.objects.filter(pk=campaign.pk, finished__isnull=True).update(
+            status=status, finished=timezone.now(), attachment_spool=None)
+        if closed:
+            attachments.discard(campaign.attachment_spool)
+
+
+def mark_sent(batch, sent):
+    """Record a delivered batch.
+
+    The batch row is written first and on its own, it is what keeps the batch from being
+    claimed and sent again. Failing to update the campaign afterwards is only logged.
+    """
+    batch.status = 'SENT'
+    batch.sent_at = timezone.now()
+    batch.attempts += 1
+    batch.last_error = None
+    batch.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+    try:
+        finish_batch(batch, sent, 0)
+    except Exception:
+        logger.exception("Outbox batch %s was sent but the counters of campaign %s were not updated", batch.pk,
+                         batch.campaign_id)
+
+
+def mark_failed(batch, error, sent=0, remaining=None):
+    """Record a failed attempt, keeping only the recipients that did not get the mail yet"""
+    if remaining is not None:
+        batch.to = ",".join(remaining)
+        if batch.campaign.delivery != 'BCC':
+            batch.message_count = len(remaining)
+    if sent:
+        MailSent.objects.filter(pk=batch.campaign_id).update(sent_count=F('sent_count') + sent)
+
+    batch.attempts += 1
+    batch.last_error = str(error)
+    if batch.attempts >= mailer_setting('MAILER_MAX_ATTEMPTS'):
+        batch.status = 'FAILED'
+        logger.error("Giving up on outbox batch %s after %d attempts: %s", batch.pk, batch.attempts, error)
+    else:
+        backoff = min(
+            mailer_setting('MAILER_RETRY_BACKOFF') * 2**(batch.attempts - 1), mailer_setting('MAILER_MAX_BACKOFF'))
+        batch.status = 'QUEUED'
+        batch.next_attempt = timezone.now() + datetime.timedelta(seconds=backoff)
+        logger.warning("Outbox batch %s failed, retrying in %ds: %s", batch.pk, backoff, error)
+    batch.save(update_fields=['to', 'message_count', 'status', 'attempts', 'last_error', 'next_attempt'])
+
+    if batch.status == 'FAILED':
+        finish_batch(batch, 0, len(batch.recipients()))
+
+
+def requeue(batches):
+    """Queue batches again, taking given up batches back out of their campaign's counters.
+
+    Batches of finished campaigns whose attachment has been removed are left alone.
+    Returns the number of batches queued again.
+    """
+    queued = 0
+    with transaction.atomic():
+        for batch in batches.select_related('campaign').select_for_update(of=('self', )):
+            if batch.campaign.attachment and not batch.campaign.attachment_spool:
+                continue
+            if batch.status == 'FAILED':
+                MailSent.objects.filter(pk=batch.campaign_id).update(
+                    failed_count=F('failed_count') - len(batch.recipients()),
+                    batches_done=F('batches_done') - 1,
+                    status='SENDING',
+                    finished=None)
+            batch.status = 'QUEUED'
+            batch.attempts = 0
+            batch.next_attempt = timezone.now()
+            batch.save(update_fields=['status', 'attempts', 'next_attempt'])
+            queued += 1
+    return queued
+
+
+def deliver_batch(batch, smtp_connection):
+    """Send one batch over an open connection, returns the number of recipients reached"""
+    recipients = batch.recipients()
+    sent = 0
+    try:
+        for msg, group in build_messages(batch, smtp_connection):
+            # send_messages() leaves a connection it did not open itself untouched
+            smtp_connection.send_messages([msg])
+            sent += len(group)
+    except Exception as e:
+        mark_failed(batch, e, sent=sent, remaining=recipients[sent:])
+        return sent
+    try:
+        mark_sent(batch, sent)
+    except Exception:
+        # The mails are out whatever happened here, never fall back to mark_failed() and send them again
+        logger.exception("Outbox batch %s was sent but could not be marked as sent", batch.pk)
+    return sent
+
+
+def deliver(batches):
+    """Send batches one after the other over a single SMTP connection, returns the number of recipients reached"""
+    delivered = 0
+    smtp_connection = get_connection()
+    try:
+        try:
+            smtp_connection.open()
+        except Exception as e:
+            for batch in batches:
+                mark_failed(batch, e)
+            return 0
+
+        for batch in batches:
+            try:
+                delivered += deliver_batch(batch, smtp_connection)
+            except Exception:
+                # Keep the worker running, the batch is picked up again once its claim expires
+                logger.exception("Delivering outbox batch %s failed", batch.pk)
+    finally:
+        smtp_connection.close()
+        # Worker threads get their own database connections, don't leak them
+        connections.close_all()
+    return delivered
+
+
+def run_worker(concurrency=None, batch_size=None, once=False, poll_interval=5):
+    """Claim due batches and deliver them from a pool of threads until stopped.
+
+    With `once` the worker returns as soon as the outbox has nothing due.
+    Returns the number of recipients reached.
+    """
+    concurrency = concurrency or mailer_setting('MAILER_CONCURRENCY')
+    batch_size = batch_size or mailer_setting('MAILER_BATCH_SIZE')
+    delivered = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            budget = allowance()
+            batches = claim(concurrency * batch_size, budget)
+            if batches:
+                # Spread the batches over the threads, one connection per thread
+                rounds = [batches[i::concurrency] for i in range(concurrency) if batches[i::concurrency]]
+                try:
+                    delivered += sum(pool.map(deliver, rounds))
+                finally:
+                    attachments.clear()
+                continue
+
+            if once and budget != 0:
+                return delivered
+            # Either nothing is due or the rate limit is used up for now
+            time.sleep(poll_interval)
@@ -0,0 +1,57 @@
+"""Expansion of recipient groups into a de-duplicated address list"""
+from main.models import Alumni, Facad, Profile
+
+# Choices of recipient group
+GROUPS = (
+    ('members', 'All members'),
+    ('alumni', 'All alumni'),
+    ('facads', 'Faculty advisors'),
+)
+
+GROUP_QUERYSETS = {
+    'members': lambda: Profile.objects.all(),
+    'alumni': lambda: Alumni.objects.all(),
+    'facads': lambda: Facad.objects.all(),
+}
+
+
+def alumni_years():
+    """Passout years that have alumni, newest first"""
+    return list(Alumni.objects.order_by('-passout_year').values_list('passout_year', flat=True).distinct())
+
+
+def _emails(queryset):
+    return queryset.exclude(email__isnull=True).exclude(email='').values_list('email', flat=True).iterator()
+
+
+def expand(groups=(), passout_years=(), addresses=()):
+    """Return the addresses of the given groups, alumni of the given passout years and extra addresses.
+
+    Addresses are compared case-insensitively and keep the order they were first seen in.
+    """
+    sources = [_emails(GROUP_QUERYSETS[group]()) for group in groups]
+    if passout_years and 'alumni' not in groups:
+        sources.append(_emails(Alumni.objects.filter(passout_year__in=passout_years)))
+    sources.append(addresses)
+
+    seen = set()
+    recipients = []
+    for source in sources:
+        for address in source:
+            address = address.strip()
+            if address and address.lower() not in seen:
+                seen.add(address.lower())
+                recipients.append(address)
+    return recipients
+
+
+def describe(groups=(), passout_years=(), addresses=()):
+    """Short human readable summary of a recipient selection, stored on the campaign"""
+    labels = dict(GROUPS)
+    parts = [labels[group] for group in groups]
+    if passout_years and 'alumni' not in groups:
+        parts.append("Alumni of %s" % ", ".join(str(year) for year in sorted(passout_years)))
+    if addresses:
+        parts.append(", ".join(addresses))
+    summary = "; ".join(parts)
+    return summary if len(summary) <= 1024 else summary[:1021] + "..."
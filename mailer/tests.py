@@ -1,3 +1,164 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mailer import attachments, outbox
+from mailer.models import MailSent, OutboxMail
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   MAILER_CHUNK_SIZE=2,
+                   MAILER_RATE_PER_MINUTE=0,
+                   MAILER_MAX_ATTEMPTS=2,
+                   MAILER_RETRY_BACKOFF=60,
+                   MAILER_CLAIM_TIMEOUT=600)
+class OutboxTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='admin')
+        self.recipients = ['a@example.com', 'b@example.com', 'c@example.com']
+
+    def enqueue(self, delivery='INDIVIDUAL'):
+        return outbox.enqueue("Subject", "Text", "<p>Text</p>", 'from@example.com', self.recipients, self.user,
+                              delivery=delivery)
+
+    def test_enqueue_splits_recipients_in_batches(self):
+        campaign = self.enqueue()
+        self.assertEqual(campaign.status, 'QUEUED')
+        self.assertEqual(campaign.batch_count, 2)
+        self.assertEqual(campaign.recipient_count, 3)
+        self.assertEqual([batch.recipients() for batch in campaign.batches.order_by('pk')],
+                         [['a@example.com', 'b@example.com'], ['c@example.com']])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claim_hands_out_a_batch_once(self):
+        self.enqueue()
+        claimed = outbox.claim(10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(set(OutboxMail.objects.values_list('status', flat=True)), {'SENDING'})
+        self.assertEqual(MailSent.objects.get().status, 'SENDING')
+        self.assertEqual(outbox.claim(10), [])
+
+    def test_claim_respects_the_budget(self):
+        self.enqueue()
+        self.assertEqual([batch.message_count for batch in outbox.claim(10, budget=2)], [2])
+
+    def test_expired_claim_is_handed_out_again(self):
+        self.enqueue()
+        outbox.claim(10)
+        OutboxMail.objects.update(next_attempt=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(len(outbox.claim(10)), 2)
+
+    def test_deliver_sends_every_batch(self):
+        campaign = self.enqueue()
+        self.assertEqual(outbox.run_worker(concurrency=1, once=True), 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), self.recipients)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent_count, campaign.batches_done), ('SENT', 3, 2))
+        self.assertIsNotNone(campaign.finished)
+        self.assertEqual(set(OutboxMail.objects.values_list('status', flat=True)), {'SENT'})
+
+    def test_bcc_delivery_sends_one_mail_per_batch(self):
+        self.enqueue(delivery='BCC')
+        outbox.run_worker(concurrency=1, once=True)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].bcc, ['a@example.com', 'b@example.com'])
+
+    def test_failed_send_is_retried_with_the_remaining_recipients(self):
+        self.enqueue()
+        sent = []
+
+        def send_messages(backend, messages):
+            if messages[0].to == ['b@example.com']:
+                raise ConnectionError("connection reset")
+            sent.extend(messages)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', send_messages):
+            outbox.deliver(outbox.claim(10))
+
+        batch = OutboxMail.objects.order_by('pk').first()
+        self.assertEqual((batch.status, batch.attempts, batch.recipients()), ('QUEUED', 1, ['b@example.com']))
+        self.assertIn("connection reset", batch.last_error)
+        self.assertGreater(batch.next_attempt, timezone.now())
+        self.assertEqual(MailSent.objects.get().sent_count, 2)
+
+        # Not due before its backoff is over, then delivered to the one recipient left
+        self.assertEqual(outbox.claim(10), [])
+        OutboxMail.objects.filter(pk=batch.pk).update(next_attempt=timezone.now())
+        outbox.deliver(outbox.claim(10))
+        self.assertEqual([message.to for message in mail.outbox], [['b@example.com']])
+        self.assertEqual(MailSent.objects.get().status, 'SENT')
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.attempts), ('SENT', 2))
+
+    def test_batch_is_given_up_after_max_attempts(self):
+        self.enqueue()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError("down")):
+            for attempt in range(2):
+                OutboxMail.objects.update(next_attempt=timezone.now())
+                outbox.deliver(outbox.claim(10))
+        campaign = MailSent.objects.get()
+        self.assertEqual((campaign.status, campaign.failed_count), ('FAILED', 3))
+        self.assertEqual(set(OutboxMail.objects.values_list('status', flat=True)), {'FAILED'})
+
+    def test_spooled_attachment_is_removed_when_the_campaign_fails(self):
+        with tempfile.TemporaryDirectory() as spool_dir, self.settings(MAILER_SPOOL_DIR=spool_dir):
+            campaign = outbox.enqueue("Subject", "Text", "", 'from@example.com', self.recipients, self.user,
+                                      attachment=SimpleUploadedFile('notes.txt', b'notes'))
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                            side_effect=OSError("down")):
+                for attempt in range(2):
+                    OutboxMail.objects.update(next_attempt=timezone.now())
+                    outbox.run_worker(concurrency=1, once=True)
+            campaign.refresh_from_db()
+            self.assertEqual((campaign.status, campaign.attachment_spool), ('FAILED', None))
+            self.assertEqual(os.listdir(spool_dir), [])
+            self.assertEqual(attachments.mime_part.cache_info().currsize, 0)
+            # Without the attachment the batches can't be sent again
+            self.assertEqual(outbox.requeue(OutboxMail.objects.all()), 0)
+            self.assertEqual(set(OutboxMail.objects.values_list('status', flat=True)), {'FAILED'})
+
+    def test_bookkeeping_failure_after_send_does_not_send_again(self):
+        self.enqueue()
+        with mock.patch('mailer.outbox.finish_batch', side_effect=RuntimeError("database went away")):
+            self.assertEqual(outbox.run_worker(concurrency=1, once=True), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(set(OutboxMail.objects.values_list('status', flat=True)), {'SENT'})
+
+        OutboxMail.objects.update(next_attempt=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(outbox.claim(10), [])
+
+
+@override_settings(MAILER_HISTORY_PAGE_SIZE=2)
+class HistoryTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_pages_reach_mails_without_a_time(self):
+        now = timezone.now()
+        times = [now, None, now - datetime.timedelta(days=1), None, now, None]
+        mails = [MailSent.objects.create(subject="Mail %d" % i, to='a@example.com', body="Text", time=time,
+                                         sent_by=self.user) for i, time in enumerate(times)]
+
+        seen, url = [], reverse('mailer:index')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [mail.pk for mail in response.context['history']]
+            cursor = response.context['next_cursor']
+            url = cursor and '%s?before=%s' % (reverse('mailer:index'), cursor)
+        timed = [mails[4].pk, mails[0].pk, mails[2].pk]
+        untimed = [mails[5].pk, mails[3].pk, mails[1].pk]
+        self.assertEqual(seen, timed + untimed)
@@ -4,6 +4,7 @@ app_name = 'mailer'
 
 urlpatterns = [
     path('', views.index, name="index"),
+    path('<int:pk>/', views.mail_detail, name="mail_detail"),
     path('compose/', views.compose_mail, name="compose_mail"),
     path('send/', views.send_mail, name="send_mail"),
 ]
\ No newline at end of file
@@ -1,16 +1,22 @@
-from django.shortcuts import render
+import datetime
+
+from django.shortcuts import render, get_object_or_404
 from mailer.forms import MailComposeForm
 from mailer.models import MailSent
+from mailer import outbox, recipients
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponseRedirect, HttpResponse
-from django.core.mail import EmailMultiAlternatives
 from django.contrib import messages
 from django.urls import reverse
-from django.utils import timezone
 from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.utils import timezone
 
 from html2text import html2text
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 def check_mail_config():
     if hasattr(settings, 'EMAIL_HOST_USER') and hasattr(settings, 'EMAIL_HOST_PASSWORD'):
         if settings.EMAIL_HOST_USER != 'None' and settings.EMAIL_HOST_PASSWORD != 'None':
@@ -18,11 +24,74 @@ def check_mail_config():
     return False
 
 
+def encode_cursor(mail):
+    """Position of a campaign in the history as `<microseconds since epoch>-<id>`, `none-<id>` without a time"""
+    if mail.time is None:
+        return 'none-%d' % mail.pk
+    delta = mail.time - EPOCH
+    return '%d-%d' % ((delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds, mail.pk)
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split('-')
+        if micros == 'none':
+            return None, int(pk)
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+def history_page(history, position, size):
+    """Up to `size` campaigns after `position`, newest first.
+
+    Campaigns stored without a time come last, by id. They are read with a query of their own
+    so both queries follow the (time, id) index, NULLs sort first on a descending PostgreSQL index.
+    """
+    page = []
+    if position is None or position[0] is not None:
+        timed = history.filter(time__isnull=False)
+        if position:
+            time, pk = position
+            timed = timed.filter(Q(time__lt=time) | Q(time=time, pk__lt=pk))
+        page = list(timed[:size])
+    if len(page) < size:
+        untimed = history.filter(time__isnull=True)
+        if position and position[0] is None:
+            untimed = untimed.filter(pk__lt=position[1])
+        page += list(untimed[:size - len(page)])
+    return page
+
+
 @user_passes_test(lambda u: u.is_superuser)
 def index(req):
     conf_check = check_mail_config()
-    history = MailSent.objects.all()
-    return render(req, 'mailer/index.html',{'history':history, 'check':conf_check})
+    page_size = getattr(settings, 'MAILER_HISTORY_PAGE_SIZE', 25)
+    query = req.GET.get('q', '').strip().lower()
+
+    # Bodies are only loaded when a single mail is opened
+    history = MailSent.objects.select_related('sent_by').defer('body', 'html_body').annotate(
+        excerpt=Substr('body', 1, 80)).order_by('-time', '-id')
+    if query:
+        history = history.filter(Q(subject_key__startswith=query) | Q(to_key__startswith=query))
+
+    # Keyset pagination, the cost of a page doesn't grow with the history
+    position = decode_cursor(req.GET.get('before', ''))
+    page = history_page(history, position, page_size + 1)
+    next_cursor = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return render(req, 'mailer/index.html', {
+        'history': page[:page_size],
+        'check': conf_check,
+        'query': query,
+        'next_cursor': next_cursor,
+        'paged': bool(position),
+    })
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def mail_detail(req, pk):
+    mail = get_object_or_404(MailSent.objects.select_related('sent_by'), pk=pk)
+    return render(req, 'mailer/detail.html', {'mail': mail})
 
 
 @user_passes_test(lambda u: u.is_superuser)
@@ -34,34 +103,31 @@ def compose_mail(req):
 @user_passes_test(lambda u: u.is_superuser)
 def send_mail(req):
     if req.method == "POST":
-        subject = req.POST['subject']
-        body = req.POST['body']
-        to = req.POST['to']
-        # attachment = req.POST['attachment']
+        form = MailComposeForm(req.POST, req.FILES)
+        if not form.is_valid():
+            return render(req, 'mailer/compose.html', {'form': form})
+
+        subject = form.cleaned_data['subject']
+        body = form.cleaned_data['body']
+        groups = form.cleaned_data['groups']
+        passout_years = form.cleaned_data['passout_years']
+        to = form.cleaned_data['to']
+        attachment = form.cleaned_data['attachment']
 
         # Use multipart for low bounce rates
         html_msg = body
         text_msg = html2text(body)
         from_email = "GNU/Linux Users' Group <no-reply@nitdgplug.org>"
-        to = to.split(",")
-
-        msg = EmailMultiAlternatives(subject, text_msg, from_email, to)
-        msg.attach_alternative(html_msg, "text/html")
-
-        try:
-            msg.send()
+        addresses = recipients.expand(groups, passout_years, to)
 
-            # log the sent email
-            m = MailSent(subject= subject, body=text_msg, from_email=from_email, to=str(to), sent_by=req.user, time=timezone.now())
-            m.save()
+        # Delivery happens in batches in `manage.py mailer_worker`, outside of this request
+        outbox.enqueue(subject, text_msg, html_msg, from_email, addresses, req.user,
+                       delivery=form.cleaned_data['delivery'],
+                       summary=recipients.describe(groups, passout_years, to),
+                       attachment=attachment)
+        messages.add_message(
+            req, messages.SUCCESS, 'Email queued for delivery to %d recipients' % len(addresses))
 
-            messages.add_message(
-                req, messages.SUCCESS, 'Email successfully sent')
-        except Exception as e:
-            print("ERROR in SMTP :: ", e)
-            messages.add_message(
-                req, messages.ERROR, 'An error occured. Check configuration again.')
-        
         return HttpResponseRedirect('/mail/compose/')
 
     else:
@@ -1,8 +1,11 @@
+import os
+
 from django.contrib import admin
 from django.utils.html import format_html
-from django.http import HttpResponseRedirect
-from main import models
+from django.http import Http404, HttpResponseRedirect
+from main import models, archive, imports, linit
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
+from django.contrib.admin.views.main import ChangeList
 from django.utils.html import escape
 from django.urls import reverse, NoReverseMatch, path
 from django.contrib.auth.models import User
@@ -10,6 +13,12 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.sessions.models import Session
 from django.contrib.contenttypes.models import ContentType
 from django.utils.crypto import get_random_string
+from django.utils.functional import cached_property
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connection
+from django.template.response import TemplateResponse
 
 admin.site.site_header = "GLUG Backend | Admin Panel"
 admin.site.site_url = "http://nitdgplug.org/"
@@ -31,6 +40,45 @@ class LinitAdmin(admin.ModelAdmin):
         'year_edition',
     )
     inlines = [LinitImageInline]
+    change_form_template = 'admin/linit_change_form.html'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:linit_id>/ingest/', self.admin_site.admin_view(self.ingest_view), name='linit-ingest'),
+        ]
+        return custom_urls + urls
+
+    # Upload of a whole edition, queued for the ingest worker, the page shows the progress of the last one
+    def ingest_view(self, request, linit_id):
+        edition = self.get_object(request, linit_id)
+        if edition is None:
+            raise Http404
+        if not self.has_change_permission(request, edition) or not request.user.has_perm('main.add_linitimage'):
+            raise PermissionDenied
+
+        job = linit.latest_job(edition)
+        error = None
+        if request.method == 'POST' and not linit.is_active(job):
+            upload = request.FILES.get('file')
+            extension = os.path.splitext(upload.name)[1].lower() if upload else ''
+            if extension not in ('.zip', '.pdf'):
+                error = "Upload a .zip of page images or a .pdf"
+            else:
+                linit.queue(edition, upload, replace=bool(request.POST.get('replace')))
+                return HttpResponseRedirect(request.path)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Upload pages of %s' % edition,
+            opts=self.model._meta,
+            original=edition,
+            progress=job,
+            running=linit.is_active(job),
+            error=error,
+            pages=edition.linitimage_set.count(),
+        )
+        return TemplateResponse(request, 'admin/linit_ingest.html', context)
 
 
 admin.site.register(models.Linit, LinitAdmin)
@@ -46,7 +94,50 @@ admin.site.register(models.LinitImage, LinitImageAdmin)
 #Linit Section End
 
 
-class EventAdmin(admin.ModelAdmin):
+class ImportMixin:
+    """Import page on the changelist for `import_dataset` of main/imports.py"""
+    import_dataset = None
+    change_list_template = 'admin/import_change_list.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        custom_urls = [
+            path('import/',
+                 self.admin_site.admin_view(self.import_view),
+                 name='%s_%s_import' % (opts.app_label, opts.model_name)),
+        ]
+        return custom_urls + super().get_urls()
+
+    def import_view(self, request):
+        dataset = imports.get_dataset(self.import_dataset)
+        if not dataset.allowed(request.user):
+            raise PermissionDenied
+
+        report = error = None
+        if request.method == 'POST':
+            upload = request.FILES.get('file')
+            try:
+                if upload is None:
+                    raise imports.ImportDataError("Choose a file to import.")
+                report = imports.import_rows(self.import_dataset, imports.guess_format(upload.name),
+                                             imports.text(upload.file), dry_run=bool(request.POST.get('dry_run')))
+            except (imports.ImportDataError, UnicodeDecodeError) as e:
+                error = str(e)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Import %s' % self.model._meta.verbose_name_plural,
+            opts=self.model._meta,
+            dataset=dataset,
+            formats=', '.join(ext for extensions in imports.FORMATS.values() for ext in extensions),
+            report=report,
+            error=error,
+        )
+        return TemplateResponse(request, 'admin/import_form.html', context)
+
+
+class EventAdmin(ImportMixin, admin.ModelAdmin):
+    import_dataset = 'events'
     list_display = ['identifier', 'status', 'show', 'action_show']
     readonly_fields = ['event_image_preview']
     actions = ['mark_draft', 'mark_final']
@@ -104,6 +195,10 @@ class SpecialTokenAdmin(admin.ModelAdmin):
 
 # This Section Handels the Log Entry
 
+LOG_USERS_CACHE_KEY = 'admin:logentry:users'
+LOG_USERS_CACHE_TIMEOUT = 10 * 60
+LOG_ARCHIVE_SEARCH_LIMIT = 200
+
 action_names = {
     ADDITION: 'Addition',
     CHANGE: 'Change',
@@ -132,8 +227,10 @@ class UserFilter(FilterBase):
     parameter_name = 'user_id'
 
     def lookups(self, request, model_admin):
-        return tuple(
-            (u.id, u.username) for u in User.objects.filter(pk__in=LogEntry.objects.values_list('user_id').distinct()))
+        # The distinct subquery walks the whole log, so its result is cached for a while
+        return cache.get_or_set(
+            LOG_USERS_CACHE_KEY, lambda: tuple((u.id, u.username) for u in User.objects.filter(
+                pk__in=LogEntry.objects.values_list('user_id').distinct())), LOG_USERS_CACHE_TIMEOUT)
 
 
 class AdminFilter(UserFilter):
@@ -152,9 +249,24 @@ class StaffFilter(UserFilter):
         return tuple((u.id, u.username) for u in User.objects.filter(is_staff=True))
 
 
-class LogEntryAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's row estimate instead of COUNT(*) for unfiltered querysets on PostgreSQL"""
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                               [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is 0 or -1 until the table has been analyzed
+            if row and row[0] > 0:
+                return row[0]
+        return super().count
 
-    date_hierarchy = 'action_time'
+
+class LogEntryAdmin(admin.ModelAdmin):
 
     readonly_fields = [f.name for f in LogEntry._meta.get_fields()]
 
@@ -162,9 +274,14 @@ class LogEntryAdmin(admin.ModelAdmin):
         UserFilter,
         ActionFilter,
         'content_type',
+        ('action_time', admin.DateFieldListFilter),
         # 'user',
     ]
 
+    list_select_related = ['user', 'content_type']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     search_fields = ['object_repr', 'change_message']
 
     list_display = [
@@ -199,15 +316,46 @@ class LogEntryAdmin(admin.ModelAdmin):
     object_link.admin_order_field = 'object_repr'
     object_link.short_description = 'object'
 
-    def queryset(self, request):
-        return super(LogEntryAdmin, self).queryset(request) \
-            .prefetch_related('content_type')
+    def get_queryset(self, request):
+        return super(LogEntryAdmin, self).get_queryset(request).select_related('user', 'content_type')
 
     def action_description(self, obj):
         return action_names[obj.action_flag]
 
     action_description.short_description = 'Action'
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('archive/', self.admin_site.admin_view(self.archive_view), name='logentry-archive'),
+        ]
+        return custom_urls + urls
+
+    # Read-only search over entries moved out by `manage.py archive_logentries`
+    def archive_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        months = archive.archive_months()
+        query = request.GET.get('q', '').strip()
+        month = request.GET.get('month', '')
+        selected = [month] if month in months else months
+        results = archive.search(query, selected, limit=LOG_ARCHIVE_SEARCH_LIMIT) if (query or month) else []
+        for record in results:
+            record['action'] = action_names.get(record['action_flag'], record['action_flag'])
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Archived log entries',
+            opts=self.model._meta,
+            months=months,
+            month=month,
+            query=query,
+            results=results,
+            limit=LOG_ARCHIVE_SEARCH_LIMIT,
+        )
+        return TemplateResponse(request, 'admin/logentry_archive.html', context)
+
 
 admin.site.register(LogEntry, LogEntryAdmin)
 # Logentry code Ends
@@ -215,17 +363,37 @@ admin.site.register(LogEntry, LogEntryAdmin)
 # Session Admin code starts
 
 
+class SessionChangeList(ChangeList):
+    """Decodes a whole page of sessions in one pass and resolves their users with a single query"""
+
+    def get_results(self, request):
+        super().get_results(request)
+        store = Session.get_session_store_class()()
+        user_pks = {}
+        for session in self.result_list:
+            session.decoded_data = store.decode(session.session_data)
+            uid = session.decoded_data.get('_auth_user_id', None)
+            if uid is not None:
+                user_pks[session.pk] = User._meta.pk.to_python(uid)
+
+        users = User.objects.in_bulk(set(user_pks.values()))
+        for session in self.result_list:
+            session.session_user = users.get(user_pks.get(session.pk))
+
+
 class SessionAdmin(admin.ModelAdmin):
     def _session_data(self, obj):
+        # Already decoded by SessionChangeList on the change list
+        if hasattr(obj, 'decoded_data'):
+            return obj.decoded_data
         return obj.get_decoded()
 
+    def get_changelist(self, request, **kwargs):
+        return SessionChangeList
+
     def get_username(self, obj):
-        session_data = obj.get_decoded()
-        uid = session_data.get('_auth_user_id', None)
-        try:
-            user_obj = User.objects.get(pk=uid)
-        except Exception:
-            user_obj = None
+        # Filled in by SessionChangeList for every row on the page
+        user_obj = getattr(obj, 'session_user', None)
 
         if user_obj:
             return user_obj
@@ -286,10 +454,15 @@ class CTFAdmin(admin.ModelAdmin):
 class FacadAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'post', 'email','image']
 
-class AlumniAdmin(admin.ModelAdmin):
+class AlumniAdmin(ImportMixin, admin.ModelAdmin):
+    import_dataset = 'alumni'
     list_display = ['first_name', 'last_name', 'passout_year']
 
 
+class TimelineAdmin(ImportMixin, admin.ModelAdmin):
+    import_dataset = 'timeline'
+
+
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
@@ -302,7 +475,7 @@ admin.site.register(models.CarouselImage)
 admin.site.register(models.About)
 admin.site.register(models.Contact)
 admin.site.register(models.Activity)
-admin.site.register(models.Timeline)
+admin.site.register(models.Timeline, TimelineAdmin)
 admin.site.register(models.SpecialToken, SpecialTokenAdmin)
 admin.site.register(models.TechBytes)
 admin.site.register(models.DevPost)
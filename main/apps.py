@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from main import cache, placeholders, snapshot
+        cache.connect_signals()
+        placeholders.connect_signals()
+        snapshot.connect_signals()
@@ -0,0 +1,138 @@
+"""Compressed JSON-lines archive of old admin LogEntry rows"""
+import gzip
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+
+ARCHIVE_PREFIX = 'logentries-'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+PENDING_NAME = 'pending.jsonl'
+
+
+def archive_path(month):
+    """Path of the archive file for a `YYYY-MM` month"""
+    return os.path.join(settings.LOG_ARCHIVE_DIR, '%s%s%s' % (ARCHIVE_PREFIX, month, ARCHIVE_SUFFIX))
+
+
+def archive_months():
+    """All archived months, newest first"""
+    if not os.path.isdir(settings.LOG_ARCHIVE_DIR):
+        return []
+    months = [
+        name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)] for name in os.listdir(settings.LOG_ARCHIVE_DIR)
+        if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+    ]
+    return sorted(months, reverse=True)
+
+
+def entry_to_record(entry):
+    """Serialize a LogEntry (with user and content_type selected) to a plain dict"""
+    ct = entry.content_type
+    return {
+        'id': entry.pk,
+        'action_time': entry.action_time.isoformat(),
+        'user_id': entry.user_id,
+        'username': entry.user.username,
+        'content_type': '%s.%s' % (ct.app_label, ct.model) if ct else None,
+        'object_id': entry.object_id,
+        'object_repr': entry.object_repr,
+        'action_flag': entry.action_flag,
+        'change_message': entry.change_message,
+    }
+
+
+def dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def append_records(records_by_month):
+    """Append records to their monthly archive files.
+
+    Every call adds a new gzip member to the file, which gzip readers treat as one stream.
+    """
+    os.makedirs(settings.LOG_ARCHIVE_DIR, exist_ok=True)
+    for month, records in records_by_month.items():
+        with gzip.open(archive_path(month), 'at', encoding='utf-8') as archive:
+            for record in records:
+                archive.write(dumps(record))
+
+
+def pending_path():
+    """Batch written out before its rows are deleted, moved into the archive files once they are"""
+    return os.path.join(settings.LOG_ARCHIVE_DIR, PENDING_NAME)
+
+
+def write_pending(records_by_month):
+    """Write a batch to the pending file, replacing it atomically and syncing it to disk"""
+    os.makedirs(settings.LOG_ARCHIVE_DIR, exist_ok=True)
+    temporary = pending_path() + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as pending:
+        for month, records in records_by_month.items():
+            for record in records:
+                pending.write(dumps({'month': month, 'record': record}))
+        pending.flush()
+        os.fsync(pending.fileno())
+    os.replace(temporary, pending_path())
+
+
+def read_pending():
+    """Records of the pending batch by month, None without one"""
+    try:
+        with open(pending_path(), encoding='utf-8') as pending:
+            lines = [json.loads(line) for line in pending if line.strip()]
+    except FileNotFoundError:
+        return None
+    records_by_month = defaultdict(list)
+    for line in lines:
+        records_by_month[line['month']].append(line['record'])
+    return records_by_month
+
+
+def archived_ids(month):
+    """Ids of the entries in the archive file of `month`"""
+    if not os.path.exists(archive_path(month)):
+        return set()
+    with gzip.open(archive_path(month), 'rt', encoding='utf-8') as archive:
+        return {json.loads(line)['id'] for line in archive}
+
+
+def flush_pending(records_by_month=None, skip_archived=False):
+    """Append the pending batch to the archive files and remove it.
+
+    `skip_archived` leaves out the entries the archive files already have, for a batch left
+    over by a run that stopped between appending and removing it.
+    """
+    if records_by_month is None:
+        records_by_month = read_pending() or {}
+    if skip_archived:
+        for month, records in records_by_month.items():
+            archived = archived_ids(month)
+            records_by_month[month] = [record for record in records if record['id'] not in archived]
+    append_records(records_by_month)
+    os.remove(pending_path())
+
+
+def search(query='', months=None, limit=200):
+    """Stream through archive files and return up to `limit` matching records, newest files first.
+
+    The query is matched case-insensitively against the object representation,
+    the change message and the username.
+    """
+    query = query.lower()
+    results = []
+    for month in months or archive_months():
+        with gzip.open(archive_path(month), 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                # Cheap check on the raw line before paying for json.loads
+                if query and query not in line.lower():
+                    continue
+                record = json.loads(line)
+                haystack = ' '.join(
+                    str(record.get(key) or '') for key in ('object_repr', 'change_message', 'username')).lower()
+                if query in haystack:
+                    results.append(record)
+                    if len(results) >= limit:
+                        return results
+    return results
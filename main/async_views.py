@@ -0,0 +1,211 @@
+"""Async serving of the public read endpoints for the ASGI deployment.
+
+Django 3.0 has no async views and its ASGI handler runs every view on one shared thread,
+so `PublicReadApplication` sits in front of it. Anonymous GET requests to the endpoints of
+`main.cache.PUBLIC_READS` are answered from the cache on the event loop, and on a miss (or
+without a shared cache, see `main.cache.enabled()`) the usual middleware and view run in
+a pool of ASYNC_ORM_THREADS threads, which also bounds the database connections of the
+process. A slow client only holds a coroutine while its
+response is sent. Everything else is handed to Django's handler unchanged, except that
+`StreamingASGIHandler` reads streaming responses, e.g. the exports, outside the event loop.
+"""
+import asyncio
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signals
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+from django.http import parse_cookie
+from django.urls import set_script_prefix
+
+from main import cache as api_cache
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def executor():
+    """The ORM thread pool of this process, created on first use so forked workers get their own"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_ORM_THREADS', 8),
+                                           thread_name_prefix='orm')
+        return _executor
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def samples():
+    """Response cache metrics of this process as (name, type, help, labels, value)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    yield ('glug_asgi_cache_hits_total', 'counter', 'Public reads answered from the response cache.', {},
+           stats['hits'])
+    yield ('glug_asgi_cache_misses_total', 'counter', 'Public reads rendered by a view.', {}, stats['misses'])
+
+
+def header_values(scope):
+    headers = {}
+    for name, value in scope.get('headers', ()):
+        headers[name.decode('latin1').lower()] = value.decode('latin1')
+    return headers
+
+
+def is_anonymous(headers):
+    if 'authorization' in headers:
+        return False
+    return settings.SESSION_COOKIE_NAME not in parse_cookie(headers.get('cookie', ''))
+
+
+def is_cacheable(status, headers):
+    if status != 200:
+        return False
+    for name, value in headers:
+        name = name.lower()
+        if name == b'set-cookie' or (name == b'cache-control' and (b'private' in value or b'no-store' in value)):
+            return False
+    return True
+
+
+def response_key(scope, group, headers):
+    query_string = scope.get('query_string', b'').decode('latin1')
+    return api_cache.response_key(group, scope['path'], query_string,
+                                  api_cache.request_variant(scope.get('scheme', 'http'), headers))
+
+
+def response_headers(response):
+    """ASGI headers of a Django response, its cookies included"""
+    headers = [(name.encode('ascii'), value.encode('latin1')) for name, value in response.items()]
+    for cookie in response.cookies.values():
+        headers.append((b'Set-Cookie', cookie.output(header='').strip().encode('ascii')))
+    return headers
+
+
+def close_streamed(response):
+    response.close()
+    # The thread reading the response goes away with it, and so would its connections
+    connections.close_all()
+
+
+def http_scope(path, query_string='', headers=()):
+    """Scope of a GET request, for requests that don't come from a server"""
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': list(headers),
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+
+
+class PublicReadApplication:
+    """ASGI application serving the public reads itself and passing everything else to `handler`"""
+
+    def __init__(self, handler):
+        # An `ASGIHandler`, whose middleware chain renders the cache misses
+        self.handler = handler
+
+    async def __call__(self, scope, receive, send):
+        group = None
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            group = api_cache.group_for_path(scope['path'])
+        headers = header_values(scope) if group else {}
+        if group is None or not is_anonymous(headers):
+            await self.handler(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        if not api_cache.enabled():
+            status, response_headers, body = await loop.run_in_executor(executor(), self.render, scope)
+            await self.send(send, status, response_headers, body)
+            return
+
+        # Cache clients block, the default executor keeps them off the loop without taking an ORM thread
+        key = await loop.run_in_executor(None, response_key, scope, group, headers)
+        cached = await loop.run_in_executor(None, cache.get, key)
+        if cached is not None:
+            count('hits')
+            await self.send(send, *cached)
+            return
+
+        count('misses')
+        status, response_headers, body = await loop.run_in_executor(executor(), self.render, scope)
+        if is_cacheable(status, response_headers):
+            await loop.run_in_executor(None, cache.set, key, (status, response_headers, body), api_cache.timeout())
+        await self.send(send, status, response_headers, body)
+
+    def prime(self, scope):
+        """Render and cache a public read ahead of its first request, False when it can't be cached"""
+        if not api_cache.enabled():
+            return False
+        key = response_key(scope, api_cache.group_for_path(scope['path']), header_values(scope))
+        status, headers, body = self.render(scope)
+        if not is_cacheable(status, headers):
+            return False
+        cache.set(key, (status, headers, body), api_cache.timeout())
+        return True
+
+    def render(self, scope):
+        """Status, headers and body of the response of Django's middleware and view, in an ORM thread"""
+        set_script_prefix(self.handler.get_script_prefix(scope))
+        # Closes expired connections like a regular request, response.close() sends request_finished
+        signals.request_started.send(sender=self.handler.__class__, scope=scope)
+        request, response = self.handler.create_request(scope, io.BytesIO())
+        if request is not None:
+            response = self.handler.get_response(request)
+        try:
+            body = b''.join(response) if response.streaming else response.content
+            return response.status_code, response_headers(response), body
+        finally:
+            response.close()
+
+    async def send(self, send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        for chunk, last in self.handler.chunk_bytes(body):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': not last})
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """Django's ASGI handler, reading streaming responses in a thread of their own.
+
+    Django 3.0 iterates them on the event loop, where the first query of a generator like
+    `main.exports.rows()` raises SynchronousOnlyOperation after the status went out. One thread
+    per response keeps a chunked query on the connection that started it.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': response_headers(response)})
+        loop = asyncio.get_running_loop()
+        parts = iter(response)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream') as reader:
+            try:
+                while True:
+                    part = await loop.run_in_executor(reader, next, parts, None)
+                    if part is None:
+                        break
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body'})
+            finally:
+                await loop.run_in_executor(reader, close_streamed, response)
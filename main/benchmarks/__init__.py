@@ -0,0 +1,219 @@
+"""In-process benchmarks of every route of the main, blog and mailer apps.
+
+`manage.py benchmark` seeds a throwaway test database through `main.seed`, requests
+each route with the test client and records latency percentiles, queries per request
+and peak Python memory. Results are compared with `baseline.json` next to this file.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from django.utils.regex_helper import normalize
+
+from mailer.models import MailSent
+from main.models import Linit, Profile
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+NAMESPACES = ('main', 'blog', 'mailer')
+
+# Differences this small are noise whatever the tolerance
+MIN_LATENCY_DIFF_MS = 10
+MIN_MEMORY_DIFF_KB = 64
+
+
+def first_value(queryset, field):
+    obj = queryset.order_by('pk').first()
+    return getattr(obj, field) if obj is not None else None
+
+
+# Values for URL kwargs and query strings of views that are not viewsets
+ROUTE_KWARGS = {
+    'mailer:mail_detail': lambda: {'pk': first_value(MailSent.objects.all(), 'pk')},
+    'main:export': lambda: {'dataset': 'alumni'},
+}
+ROUTE_QUERY = {
+    'main:linit-pages': lambda: {'year': first_value(Linit.objects.all(), 'year_edition')},
+}
+
+
+def view_class(callback):
+    # Viewsets keep their class on `cls`, other class based views on `view_class`
+    return getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+
+
+def sample_kwargs(route, pattern):
+    """URL kwargs naming an existing object, None when there is nothing to point at"""
+    names = list(pattern.pattern.regex.groupindex)
+    if not names:
+        return {}
+    if route in ROUTE_KWARGS:
+        kwargs = ROUTE_KWARGS[route]()
+        return kwargs if None not in kwargs.values() else None
+
+    cls = view_class(pattern.callback)
+    queryset = getattr(cls, 'queryset', None)
+    if queryset is None:
+        return None
+    lookup_field = getattr(cls, 'lookup_field', 'pk')
+    value = first_value(queryset.all(), lookup_field)
+    if value is None:
+        return None
+    return {getattr(cls, 'lookup_url_kwarg', None) or lookup_field: value}
+
+
+def url_template(*patterns):
+    """'/api/events/%(identifier)s/' for the patterns leading to a view"""
+    return '/' + ''.join(normalize(pattern.pattern.regex.pattern)[0][0] for pattern in patterns)
+
+
+def routes():
+    """(route, url, None) for every GET route of NAMESPACES, (route, None, reason) for the skipped ones.
+
+    Routes are named after their url name, or their url where two share a name.
+    """
+    seen = set()
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver) or resolver.namespace not in NAMESPACES:
+            continue
+        for pattern in resolver.url_patterns:
+            route = '%s:%s' % (resolver.namespace, pattern.name)
+            template = url_template(resolver, pattern)
+            if 'format' in pattern.pattern.regex.groupindex:
+                # The router's `.json` variants of the same views
+                continue
+            actions = getattr(pattern.callback, 'actions', None)
+            if actions is not None and 'get' not in actions:
+                continue
+
+            # DefaultRouter names both timeline viewsets `timeline`
+            name = route if route not in seen else '%s %s' % (route, template)
+            seen.add(route)
+
+            kwargs = sample_kwargs(route, pattern)
+            if kwargs is None:
+                yield name, None, "no object to request"
+                continue
+            url = template % kwargs
+            if route in ROUTE_QUERY:
+                query = ROUTE_QUERY[route]()
+                if None in query.values():
+                    yield name, None, "no object to request"
+                    continue
+                url += '?' + '&'.join('%s=%s' % item for item in query.items())
+            yield name, url, None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def admin_client():
+    user, created = User.objects.get_or_create(username='benchmark-admin',
+                                               defaults={
+                                                   'is_staff': True,
+                                                   'is_superuser': True
+                                               })
+    Profile.objects.get_or_create(user=user, defaults={'first_name': 'Bench', 'last_name': 'Admin'})
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    return client
+
+
+def measure(client, url, repeat):
+    """Latency percentiles in ms, queries per request and peak memory in KiB of requesting `url`"""
+    timings = []
+    queries = 0
+    # Collections triggered by earlier routes would land on this one
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(captured))
+    finally:
+        gc.enable()
+
+    # Tracing slows everything down, so memory gets a request of its own
+    tracemalloc.start()
+    try:
+        client.get(url)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'queries': queries,
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def run(repeat, log=None):
+    """Benchmark every route, returns the results and the skipped routes by route name"""
+    anonymous = Client(raise_request_exception=False)
+    staff = admin_client()
+    login_url = settings.LOGIN_URL
+    results, skipped = {}, {}
+
+    for route, url, reason in routes():
+        if url is None:
+            skipped[route] = reason
+            continue
+        client = anonymous
+        response = client.get(url)
+        if response.status_code == 302 and response['Location'].startswith(login_url):
+            client = staff
+            client.get(url)
+        results[route] = measure(client, url, repeat)
+        if log:
+            log(route, url, results[route])
+    return results, skipped
+
+
+def load_baseline(path=BASELINE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(baseline, path=BASELINE):
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def regressions(results, baseline, tolerance):
+    """Descriptions of every measurement that got worse than `baseline` allows"""
+    found = []
+    for route, base in sorted(baseline.items()):
+        current = results.get(route)
+        if current is None:
+            continue
+        if current['status'] != base['status']:
+            found.append("%s: status %s, was %s" % (route, current['status'], base['status']))
+        if current['queries'] > base['queries']:
+            found.append("%s: %d queries, was %d" % (route, current['queries'], base['queries']))
+        # The median, the tail of a handful of requests is mostly noise
+        if (current['p50_ms'] > base['p50_ms'] * (1 + tolerance)
+                and current['p50_ms'] - base['p50_ms'] > MIN_LATENCY_DIFF_MS):
+            found.append("%s: p50 %.1fms, was %.1fms" % (route, current['p50_ms'], base['p50_ms']))
+        if (current['peak_kb'] > base['peak_kb'] * (1 + tolerance)
+                and current['peak_kb'] - base['peak_kb'] > MIN_MEMORY_DIFF_KB):
+            found.append("%s: peak memory %dKiB, was %dKiB" % (route, current['peak_kb'], base['peak_kb']))
+    return found
@@ -0,0 +1,116 @@
+"""Concurrency benchmark of the WSGI and the ASGI deployment.
+
+Both serve the same number of concurrent clients, each requesting public reads one after
+the other and taking `client_delay` seconds to read every response, like clients on a slow
+network. WSGI is modelled after `gunicorn --workers N` with sync workers: a worker is busy
+until its client has read the whole response. ASGI runs `glug_website.asgi.application` on
+one event loop, where a slow client only holds its coroutine.
+"""
+import asyncio
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from main.async_views import http_scope
+from main.benchmarks import percentile
+
+# The public reads served by main.async_views
+PATHS = (
+    '/api/events/',
+    '/api/upcoming-events/',
+    '/api/timeline/',
+    '/api/timeline_monthly/',
+    '/api/alumni/',
+    '/api/alumni-by-year/',
+    '/api/configs/',
+    '/api/get_count/',
+)
+HOST = 'testserver'
+
+
+def summary(latencies, statuses, wall_seconds):
+    latencies = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'seconds': round(wall_seconds, 2),
+        'throughput': round(len(latencies) / wall_seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'p99_ms': round(percentile(latencies, 0.99), 1),
+        'max_ms': round(max(latencies), 1),
+    }
+
+
+def wsgi_environ(url):
+    path, _, query = url.partition('?')
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': HOST, 'HTTP_ACCEPT': 'application/json'}
+    setup_testing_defaults(environ)
+    return environ
+
+
+def run_wsgi(application, paths, workers, clients, requests, client_delay):
+    """Clients taking turns on `workers` sync workers"""
+    free_workers = threading.Semaphore(workers)
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    def client(number):
+        for i in range(requests):
+            url = paths[(number + i) % len(paths)]
+            start = time.perf_counter()
+            with free_workers:
+                response = application(wsgi_environ(url), start_response)
+                try:
+                    for chunk in response:
+                        pass
+                finally:
+                    response.close()
+                # The worker only moves on once the client has everything
+                time.sleep(client_delay)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(number, )) for number in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summary(latencies, statuses, time.perf_counter() - start)
+
+
+def asgi_scope(url):
+    path, _, query = url.partition('?')
+    return http_scope(path, query, [(b'host', HOST.encode()), (b'accept', b'application/json')])
+
+
+def run_asgi(application, paths, clients, requests, client_delay):
+    """Clients served concurrently by one event loop"""
+    latencies, statuses = [], []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body'):
+            await asyncio.sleep(client_delay)
+
+    async def client(number):
+        for i in range(requests):
+            url = paths[(number + i) % len(paths)]
+            start = time.perf_counter()
+            await application(asgi_scope(url), receive, send)
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        await asyncio.gather(*(client(number) for number in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return summary(latencies, statuses, time.perf_counter() - start)
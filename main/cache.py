@@ -0,0 +1,142 @@
+"""Cache of the public read endpoints.
+
+Every group of endpoints has a version in the shared cache that is bumped whenever one of
+the models it shows is saved or deleted. Cached responses are keyed by that version, so a
+change makes the old entries unreachable and they expire on their own after
+RESPONSE_CACHE_TIMEOUT. The rows behind the configs and counts endpoints are cached the same
+way for the views themselves, whichever server runs them. Writes that skip the model signals (`QuerySet.update()`,
+`bulk_create()`) have to call `bump()` themselves.
+
+All of this needs a cache the server processes share (memcached, Redis, the database cache).
+With a per-process cache such as the default locmem one a bump only reaches the worker that
+saved, and the others would serve stale entries until they expire, so nothing is cached
+unless API_CACHE_LOCAL says there is only the one process.
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db.models.signals import post_delete, post_save
+
+# URL prefix and group of the public read endpoints
+PUBLIC_READS = (
+    ('/api/events/', 'events'),
+    ('/api/upcoming-events/', 'events'),
+    ('/api/timeline/', 'timeline'),
+    ('/api/timeline_monthly/', 'timeline'),
+    ('/api/alumni/', 'alumni'),
+    ('/api/alumni-by-year/', 'alumni'),
+    ('/api/configs/', 'configs'),
+    ('/api/get_count/', 'counts'),
+)
+
+# Backends keeping entries per process
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+# Models shown by each group, saving an event can add it to the timeline
+GROUP_MODELS = {
+    'events': ('main.Event', ),
+    'timeline': ('main.Timeline', 'main.Event'),
+    'alumni': ('main.Alumni', ),
+    'configs': ('main.Config', ),
+    'counts': ('main.Alumni', 'main.Profile', 'main.Event', 'main.Project'),
+}
+
+
+def enabled():
+    """Whether public reads are cached, see the module docstring"""
+    if settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'] not in LOCAL_BACKENDS:
+        return True
+    return getattr(settings, 'API_CACHE_LOCAL', False)
+
+
+def group_for_path(path):
+    for prefix, group in PUBLIC_READS:
+        if path.startswith(prefix):
+            return group
+    return None
+
+
+def version_key(group):
+    return 'api-version:%s' % group
+
+
+def version(group):
+    # A fresh version is unique, so entries cached before the key was evicted are never served
+    return cache.get_or_set(version_key(group), time.time_ns, None)
+
+
+def bump(*groups):
+    """Invalidate the cached responses of `groups`"""
+    for group in groups:
+        try:
+            cache.incr(version_key(group))
+        except ValueError:
+            cache.set(version_key(group), time.time_ns(), None)
+
+
+def groups_for_model(model):
+    label = model._meta.label
+    return [group for group, labels in GROUP_MODELS.items() if label in labels]
+
+
+def invalidate(sender, **kwargs):
+    bump(*groups_for_model(sender))
+
+
+def connect_signals():
+    for label in {label for labels in GROUP_MODELS.values() for label in labels}:
+        model = apps.get_model(label)
+        post_save.connect(invalidate, sender=model, dispatch_uid='main.cache.save.%s' % label)
+        post_delete.connect(invalidate, sender=model, dispatch_uid='main.cache.delete.%s' % label)
+
+
+def request_variant(scheme, headers):
+    """What a public read depends on besides its URL, `headers` by lower case name.
+
+    Media URLs are absolute, so built from the host and scheme, DRF picks the renderer by
+    Accept and CORS looks at Origin.
+    """
+    origin = headers.get('origin', '')
+    if origin and getattr(settings, 'CORS_ORIGIN_ALLOW_ALL', False) and not getattr(
+            settings, 'CORS_ALLOW_CREDENTIALS', False):
+        # Answered with `Access-Control-Allow-Origin: *` whatever the origin
+        origin = '*'
+    return [headers.get('host', ''), headers.get('x-forwarded-proto', scheme), headers.get('accept', ''), origin]
+
+
+def response_key(group, path, query_string, variant):
+    """Cache key of a response, `variant` from `request_variant()`"""
+    request = '\n'.join([path, query_string] + variant)
+    return 'api-response:%s:%s:%s' % (group, version(group), hashlib.md5(request.encode()).hexdigest())
+
+
+def timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def cached(group, name, compute):
+    """`compute()` cached until the models of `group` change"""
+    if not enabled():
+        return compute()
+    key = 'api-data:%s:%s:%s' % (group, version(group), name)
+    return cache.get_or_set(key, compute, timeout())
+
+
+def counts():
+    Alumni, Event, Profile, Project = (apps.get_model('main', name)
+                                       for name in ('Alumni', 'Event', 'Profile', 'Project'))
+    return cached(
+        'counts', 'counts', lambda: {
+            'members': Profile.objects.count(),
+            'alumni': Alumni.objects.count(),
+            'events': Event.objects.count(),
+            'projects': Project.objects.count(),
+        })
+
+
+def configs():
+    Config = apps.get_model('main', 'Config')
+    return cached('configs', 'configs', lambda: list(Config.objects.all()))
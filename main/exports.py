@@ -0,0 +1,193 @@
+"""Streaming exports of the alumni, members, events and sent mails.
+
+Rows are read with `QuerySet.iterator()` in chunks of EXPORT_CHUNK_SIZE as plain value tuples
+and written out as CSV or JSON lines while they come in, so memory stays flat however many
+rows there are. Used by the `/api/export/<dataset>/` view and `manage.py export`.
+
+Columns are the dataset's fields, the defaults leave out the bulky ones. Rows are filtered
+with Django style lookups on the columns, e.g. `passout_year__gte=2015`.
+"""
+import csv
+import datetime
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+LOOKUPS = ('exact', 'iexact', 'contains', 'icontains', 'gt', 'gte', 'lt', 'lte', 'in', 'isnull')
+# Bytes collected before a chunk of the output is handed on
+BUFFER_SIZE = 64 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+class Dataset:
+    """Exportable rows of `model`, a label like 'main.Alumni'"""
+
+    def __init__(self, model, ordering, exclude=(), related=None, superuser_only=False):
+        self.label = model
+        self.ordering = ordering
+        # Columns left out unless asked for
+        self.exclude = exclude
+        # Extra columns from related models, name: lookup
+        self.related = related or {}
+        self.superuser_only = superuser_only
+
+    @property
+    def model(self):
+        return apps.get_model(self.label)
+
+    def is_installed(self):
+        return apps.is_installed(self.label.split('.')[0])
+
+    def allowed(self, user):
+        if self.superuser_only:
+            return user.is_active and user.is_superuser
+        opts = self.model._meta
+        return user.is_active and user.is_staff and user.has_perm('%s.view_%s' % (opts.app_label, opts.model_name))
+
+    def lookups(self):
+        """Lookup of every column by column name"""
+        found = {field.name: field.name for field in self.model._meta.concrete_fields}
+        found.update(self.related)
+        return found
+
+    def default_columns(self):
+        return [name for name in self.lookups() if name not in self.exclude]
+
+    def field(self, lookup):
+        model = self.model
+        *relations, name = lookup.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+
+DATASETS = {
+    'alumni': Dataset('main.Alumni', ('-passout_year', 'first_name'), exclude=('bio', 'image_placeholder')),
+    'members': Dataset('main.Profile', ('passout_year', 'first_name'), exclude=('bio', ),
+                       related={
+                           'username': 'user__username',
+                           'user_email': 'user__email',
+                       }),
+    'events': Dataset('main.Event', ('-event_timing', ), exclude=('description', 'event_image_placeholder')),
+    'mails': Dataset('mailer.MailSent', ('-time', ), exclude=('body', 'html_body', 'attachment_spool'),
+                     related={'sent_by_username': 'sent_by__username'}, superuser_only=True),
+}
+
+
+def get_dataset(name):
+    dataset = DATASETS.get(name)
+    if dataset is None or not dataset.is_installed():
+        raise ExportError("Unknown dataset %r" % name)
+    return dataset
+
+
+def parse_columns(dataset, value):
+    if not value:
+        return dataset.default_columns()
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in dataset.lookups()]
+    if unknown:
+        raise ExportError("Unknown columns: %s" % ', '.join(unknown))
+    return columns
+
+
+def truthy(value):
+    return value.lower() in ('1', 't', 'true', 'yes')
+
+
+def parse_value(field, lookup, value):
+    if lookup == 'isnull' or (lookup == 'exact' and field.get_internal_type() == 'BooleanField'):
+        return truthy(value)
+    if lookup in ('contains', 'icontains', 'iexact'):
+        return value
+    if lookup == 'in':
+        return [parse_value(field, 'exact', item) for item in value.split(',')]
+    try:
+        value = field.to_python(value)
+    except ValidationError as e:
+        raise ExportError("Invalid value for %s: %s" % (field.name, ' '.join(e.messages)))
+    if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def parse_filters(dataset, params):
+    """`QuerySet.filter()` kwargs for (key, value) pairs like ('passout_year__gte', '2015')"""
+    lookups = dataset.lookups()
+    filters = {}
+    for key, value in params:
+        column, _, lookup = key.partition('__')
+        lookup = lookup or 'exact'
+        if column not in lookups:
+            raise ExportError("Unknown column %r" % column)
+        if lookup not in LOOKUPS:
+            raise ExportError("Unsupported lookup %r, use one of %s" % (lookup, ', '.join(LOOKUPS)))
+        filters['%s__%s' % (lookups[column], lookup)] = parse_value(dataset.field(lookups[column]), lookup, value)
+    return filters
+
+
+def rows(dataset, columns, filters):
+    lookups = dataset.lookups()
+    queryset = dataset.model._default_manager.filter(**filters).order_by(*dataset.ordering)
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    return queryset.values_list(*[lookups[column] for column in columns]).iterator(chunk_size=chunk_size)
+
+
+def plain(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+class Echo:
+    """File-like object handing back what `csv.writer` writes instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, values):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in values:
+        yield writer.writerow(['' if value is None else plain(value) for value in row])
+
+
+def jsonl_lines(columns, values):
+    for row in values:
+        yield json.dumps(dict(zip(columns, (plain(value) for value in row))), ensure_ascii=False, default=str) + '\n'
+
+
+def buffered(lines):
+    """Lines joined into chunks of about BUFFER_SIZE bytes, a write per row would be slow"""
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(chunk).encode()
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+def export(name, output_format, columns=None, params=()):
+    """Content type, file name and the byte chunks of an export, all arguments as given by the user"""
+    dataset = get_dataset(name)
+    if output_format not in FORMATS:
+        raise ExportError("Unknown format %r, use one of %s" % (output_format, ', '.join(FORMATS)))
+    columns = parse_columns(dataset, columns)
+    filters = parse_filters(dataset, params)
+    lines = (csv_lines if output_format == 'csv' else jsonl_lines)(columns, rows(dataset, columns, filters))
+    filename = '%s-%s.%s' % (name, timezone.localdate().isoformat(), output_format)
+    return FORMATS[output_format], filename, buffered(lines)
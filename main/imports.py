@@ -0,0 +1,330 @@
+"""Bulk imports of alumni, events and timeline entries from CSV or JSON lines.
+
+Files are read row by row and handled in batches of IMPORT_BATCH_SIZE rows: every row is
+checked with the model's field validation, then the batch is written with `bulk_create()` and
+`bulk_update()` in one transaction, a few queries per batch instead of a `save()` per row.
+The columns are the ones of the exports, those that can't be imported (ids, files, automatic
+dates and image placeholders) are ignored, so an export can be imported again.
+
+Events are matched on `identifier`, an existing event only gets the columns the file has.
+`Event.save()`'s rules and timeline entries are applied to the whole batch. Timeline entries
+whose name is already on the timeline are skipped, as `Event.save()` does. Alumni are always
+added. Rows that don't validate are skipped and reported by line, a dry run reports what an
+import would do without writing anything. Used by `manage.py import_data` and the import page
+of the alumni, event and timeline admins.
+"""
+import csv
+import datetime
+import io
+import json
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from main import cache as api_cache
+from main import snapshot
+
+FORMATS = {
+    'csv': ('.csv', ),
+    'jsonl': ('.jsonl', '.ndjson'),
+}
+TRUE = ('1', 't', 'true', 'yes')
+FALSE = ('0', 'f', 'false', 'no')
+# Invalid rows reported by line, further ones are only counted
+MAX_ERRORS = 100
+
+
+class ImportDataError(Exception):
+    pass
+
+
+class Dataset:
+    """Importable rows of `model`, a label like 'main.Alumni'"""
+
+    def __init__(self, model, key=None, skip_existing=None, rule_fields=(), timeline=False):
+        self.label = model
+        # Unique column rows are matched on, matching rows update the existing object
+        self.key = key
+        # Column whose taken values are skipped instead of added again
+        self.skip_existing = skip_existing
+        # Columns `apply_rules()` may change on an update
+        self.rule_fields = rule_fields
+        # Rows can add themselves to the timeline like `Event.save()`
+        self.timeline = timeline
+
+    @property
+    def model(self):
+        return apps.get_model(self.label)
+
+    def allowed(self, user):
+        opts = self.model._meta
+        perms = ['%s.add_%s' % (opts.app_label, opts.model_name)]
+        if self.key:
+            perms.append('%s.change_%s' % (opts.app_label, opts.model_name))
+        return user.is_active and user.is_staff and user.has_perms(perms)
+
+    def columns(self):
+        """Importable fields by column name"""
+        return {
+            field.name: field
+            for field in self.model._meta.concrete_fields
+            if field.editable and not field.primary_key and not isinstance(field, models.FileField) and not getattr(
+                field, 'auto_now', False) and not getattr(field, 'auto_now_add', False)
+        }
+
+    def ignored(self):
+        """Columns of the exports that are not imported"""
+        return {field.name for field in self.model._meta.concrete_fields} - set(self.columns())
+
+
+DATASETS = {
+    'alumni': Dataset('main.Alumni'),
+    'events': Dataset('main.Event', key='identifier', rule_fields=('show', 'venue', 'bts_uploaded_at'), timeline=True),
+    'timeline': Dataset('main.Timeline', skip_existing='event_name'),
+}
+
+
+def get_dataset(name):
+    dataset = DATASETS.get(name)
+    if dataset is None:
+        raise ImportDataError("Unknown dataset %r" % name)
+    return dataset
+
+
+def guess_format(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    for name, extensions in FORMATS.items():
+        if extension in extensions:
+            return name
+    raise ImportDataError("Can't tell the format of %r, use one of %s" % (filename, ', '.join(FORMATS)))
+
+
+def text(binary_file):
+    """Text stream over an uploaded or opened binary file, a byte order mark is dropped"""
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+def csv_rows(dataset, stream):
+    """(line, row, error) of every row of a CSV file with a header line"""
+    reader = csv.DictReader(stream)
+    known = set(dataset.columns()) | dataset.ignored()
+    unknown = [name for name in reader.fieldnames or () if name not in known]
+    if unknown:
+        raise ImportDataError("Unknown columns: %s" % ', '.join(unknown))
+    for row in reader:
+        if None in row:
+            yield reader.line_num, None, "More cells than columns"
+        else:
+            # Cells missing at the end of a short row are left out
+            yield reader.line_num, {name: value for name, value in row.items() if value is not None}, None
+
+
+def jsonl_rows(dataset, stream):
+    """(line, row, error) of every object of a JSON lines file"""
+    known = set(dataset.columns()) | dataset.ignored()
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, "Invalid JSON: %s" % e
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Expected an object"
+            continue
+        unknown = [name for name in row if name not in known]
+        if unknown:
+            yield number, None, "Unknown columns: %s" % ', '.join(unknown)
+        else:
+            yield number, row, None
+
+
+def convert(field, value):
+    """`value` as read from a file, the rest is left to the field's own validation"""
+    if value is None or value == '':
+        if field.has_default():
+            return field.get_default()
+        return None if field.null else ''
+    if isinstance(value, str) and isinstance(field, models.BooleanField):
+        if value.lower() in TRUE:
+            return True
+        if value.lower() in FALSE:
+            return False
+    return value
+
+
+def messages(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join('%s: %s' % (name, ' '.join(found)) for name, found in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+class Report:
+    def __init__(self, dataset, dry_run):
+        self.dry_run = dry_run
+        self.counts = {'read': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'invalid': 0}
+        if dataset.timeline:
+            self.counts['timeline'] = 0
+        self.ignored = set()
+        self.errors = []
+
+    def error(self, line, message):
+        self.counts['invalid'] += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+class Importer:
+    def __init__(self, dataset, dry_run=False, batch_size=None):
+        self.dataset = dataset
+        self.model = dataset.model
+        self.columns = dataset.columns()
+        self.ignored = dataset.ignored()
+        self.dry_run = dry_run
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 500)
+        self.report = Report(dataset, dry_run)
+        # Keys and skip_existing values already seen, a repeated key would update its own row
+        self.seen = set()
+        self.timeline_seen = set()
+
+    def run(self, rows):
+        batch = []
+        for line, row, error in rows:
+            self.report.counts['read'] += 1
+            if error:
+                self.report.error(line, error)
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.load(batch)
+                batch = []
+        if batch:
+            self.load(batch)
+        # Rows failing in a batch are only reported once it is loaded
+        self.report.errors.sort()
+        if not self.dry_run and (self.report.counts['created'] or self.report.counts['updated']):
+            # Bulk writes send no signals
+            api_cache.bump(*api_cache.groups_for_model(self.model))
+        return self.report
+
+    def existing(self, batch):
+        """Objects matching the keys of `batch`, or the taken skip_existing values"""
+        if self.dataset.key:
+            keys = {row[self.dataset.key] for line, row in batch if row.get(self.dataset.key)}
+            return self.model._default_manager.in_bulk(keys, field_name=self.dataset.key)
+        if self.dataset.skip_existing:
+            values = {row[self.dataset.skip_existing] for line, row in batch if row.get(self.dataset.skip_existing)}
+            return set(self.model._default_manager.filter(**{
+                '%s__in' % self.dataset.skip_existing: values
+            }).values_list(self.dataset.skip_existing, flat=True))
+        return {}
+
+    def load(self, batch):
+        existing = self.existing(batch)
+        created, updated = [], []
+        for line, row in batch:
+            self.report.ignored.update(name for name in row if name not in self.columns)
+            row = {name: value for name, value in row.items() if name in self.columns}
+            instance = self.build(line, row, existing)
+            if instance is None:
+                continue
+            if instance.pk is None:
+                created.append(instance)
+            else:
+                updated.append((instance, row))
+        entries = []
+        if self.dataset.timeline:
+            entries = self.timeline_entries(created + [instance for instance, row in updated])
+
+        self.report.counts['created'] += len(created)
+        self.report.counts['updated'] += len(updated)
+        if self.dataset.timeline:
+            self.report.counts['timeline'] += len(entries)
+        if self.dry_run:
+            return
+        with transaction.atomic():
+            self.model._default_manager.bulk_create(created)
+            # Each update writes the columns its row had
+            by_fields = {}
+            for instance, row in updated:
+                fields = tuple(sorted(set(row) | set(self.dataset.rule_fields)))
+                by_fields.setdefault(fields, []).append(instance)
+            for fields, instances in by_fields.items():
+                self.model._default_manager.bulk_update(instances, fields)
+            if entries:
+                apps.get_model('main', 'Timeline').objects.bulk_create(entries)
+            # Bulk writes send no signals, the snapshots are updated once this commits
+            snapshot.bulk_changed(self.model, [instance.pk for instance in created] +
+                                  [instance.pk for instance, row in updated])
+            if entries:
+                snapshot.bulk_changed(apps.get_model('main', 'Timeline'), [entry.pk for entry in entries])
+
+    def build(self, line, row, existing):
+        """Validated object for `row`, None when it is reported or skipped"""
+        key, skip = self.dataset.key, self.dataset.skip_existing
+        if key:
+            value = row.get(key)
+            if value and value in self.seen:
+                self.report.error(line, "%s %r is repeated in the file" % (key, value))
+                return None
+            self.seen.add(value)
+        if skip:
+            value = row.get(skip)
+            if value and (value in existing or value in self.seen):
+                self.report.counts['skipped'] += 1
+                return None
+            self.seen.add(value)
+
+        instance = existing.get(row.get(key)) if key else None
+        if instance is None:
+            instance = self.model()
+            exclude = set(self.ignored)
+        else:
+            # An existing object is only checked on the columns that change
+            exclude = self.ignored | (set(self.columns) - set(row))
+        for name, value in row.items():
+            setattr(instance, name, convert(self.columns[name], value))
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            self.report.error(line, messages(e))
+            return None
+
+        for name in row:
+            value = getattr(instance, name)
+            if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_naive(value):
+                setattr(instance, name, timezone.make_aware(value))
+        if self.dataset.timeline and instance.add_to_timeline and not instance.event_timing:
+            self.report.error(line, "event_timing: Needed to add the event to the timeline.")
+            return None
+        if hasattr(instance, 'apply_rules'):
+            instance.apply_rules()
+        return instance
+
+    def timeline_entries(self, events):
+        """Timeline entries `Event.save()` would add for `events`"""
+        Timeline = apps.get_model('main', 'Timeline')
+        wanted = {}
+        for event in events:
+            if event.add_to_timeline and event.title not in self.timeline_seen:
+                wanted.setdefault(event.title, event)
+        taken = set(Timeline.objects.filter(event_name__in=wanted).values_list('event_name', flat=True))
+        self.timeline_seen.update(wanted)
+        return [
+            Timeline(event_name=title, detail=event.description, event_time=event.event_timing.date())
+            for title, event in wanted.items() if title not in taken
+        ]
+
+
+def import_rows(name, input_format, stream, dry_run=False, batch_size=None):
+    """Import the rows of a text `stream`, returns the `Report`"""
+    dataset = get_dataset(name)
+    if input_format not in FORMATS:
+        raise ImportDataError("Unknown format %r, use one of %s" % (input_format, ', '.join(FORMATS)))
+    rows = (csv_rows if input_format == 'csv' else jsonl_rows)(dataset, stream)
+    return Importer(dataset, dry_run, batch_size).run(rows)
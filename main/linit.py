@@ -0,0 +1,298 @@
+"""Ingestion of a whole Linit edition from a ZIP of page images or a PDF.
+
+Pages are prepared in a process pool: PDF pages are rasterized one by one with `pdftoppm`
+from poppler-utils, then every page is turned upright, scaled down to LINIT_PAGE_WIDTH pixels
+and saved as a progressive JPEG. The pages are stored and added to the edition as
+`LinitImage`s with one `bulk_create()` in page order. ZIP members are ordered by name, with
+numbers compared as numbers, so `page2.jpg` comes before `page10.jpg`.
+
+The admin queues an upload as a `LinitIngest` job and shows its progress from that row,
+`manage.py ingest_linit --worker` claims the jobs and runs them outside the web workers, so
+a recycled or restarted worker loses nothing. A job whose worker stops renewing its heartbeat
+for LINIT_INGEST_TIMEOUT seconds is taken over by the next claim. `manage.py ingest_linit`
+with an edition and a file runs one ingestion in the foreground.
+"""
+import datetime
+import io
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+# Largest uncompressed page taken from a ZIP, against archives that unpack to far more than they weigh
+MAX_PAGE_BYTES = 64 * 1024 * 1024
+# Claims of a job, a file that keeps killing its worker is given up after that
+MAX_ATTEMPTS = 3
+UPLOAD_TO = 'linit_magzine_images'
+
+DEFAULTS = {
+    # Widest page stored, larger pages are scaled down
+    'LINIT_PAGE_WIDTH': 1600,
+    'LINIT_PAGE_QUALITY': 82,
+    # Resolution PDF pages are rasterized at
+    'LINIT_PDF_DPI': 150,
+    # Processes preparing pages, 0 for one per CPU
+    'LINIT_INGEST_WORKERS': 0,
+    # Seconds without progress after which a running job is taken over
+    'LINIT_INGEST_TIMEOUT': 600,
+}
+
+
+class IngestError(Exception):
+    pass
+
+
+def natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def zip_pages(path):
+    """Names of the page images of a ZIP in page order"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = [
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS and
+                not os.path.basename(info.filename).startswith('.') and not info.filename.startswith('__MACOSX/')
+            ]
+    except zipfile.BadZipFile as e:
+        raise IngestError("Not a ZIP file: %s" % e)
+    return sorted(names, key=natural_key)
+
+
+def pdf_page_count(path):
+    try:
+        result = subprocess.run(['pdfinfo', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except FileNotFoundError:
+        raise IngestError("Rasterizing PDFs needs poppler-utils (pdfinfo and pdftoppm) installed.")
+    except subprocess.CalledProcessError as e:
+        raise IngestError("Could not read the PDF: %s" % e.stderr.decode(errors='replace').strip())
+    match = re.search(r'^Pages:\s+(\d+)', result.stdout.decode(errors='replace'), re.MULTILINE)
+    if not match:
+        raise IngestError("Could not read the page count of the PDF.")
+    return int(match.group(1))
+
+
+def open_page(source, page, workdir, dpi):
+    """Image of a page, `page` is a ZIP member name or a PDF page number"""
+    if isinstance(page, str):
+        with zipfile.ZipFile(source) as archive:
+            info = archive.getinfo(page)
+            if info.file_size > MAX_PAGE_BYTES:
+                raise IngestError("%s is larger than %d MiB unpacked" % (page, MAX_PAGE_BYTES // 1024 // 1024))
+            return Image.open(io.BytesIO(archive.read(info)))
+    prefix = os.path.join(workdir, 'raster-%d' % page)
+    command = ['pdftoppm', '-f', str(page), '-l', str(page), '-r', str(dpi), '-png', '-singlefile', source, prefix]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode:
+        raise IngestError(result.stderr.decode(errors='replace').strip() or "pdftoppm failed")
+    image = Image.open(prefix + '.png')
+    image.load()
+    os.remove(prefix + '.png')
+    return image
+
+
+def prepare_page(source, page, target, width, quality, dpi):
+    """Write `page` of `source` to `target` as an upright JPEG at most `width` pixels wide.
+
+    Runs in the pool processes, which have no Django settings, everything comes as arguments.
+    """
+    image = ImageOps.exif_transpose(open_page(source, page, os.path.dirname(target), dpi))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.width > width:
+        # Scans of three times the width and more are shrunk by whole factors first, much quicker
+        image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS,
+                             reducing_gap=3.0)
+    image.save(target, 'JPEG', quality=quality, progressive=True)
+    return target
+
+
+def settings_value(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def pages_of(path, filename):
+    """ZIP member names or PDF page numbers of an uploaded edition, in page order"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.zip':
+        pages = zip_pages(path)
+    elif extension == '.pdf':
+        pages = list(range(1, pdf_page_count(path) + 1))
+    else:
+        raise IngestError("Upload a .zip of page images or a .pdf")
+    if not pages:
+        raise IngestError("No pages found in %s" % filename)
+    return pages
+
+
+def ingest(linit, path, filename, replace=False, workers=None, log=None):
+    """Add the pages of the ZIP or PDF at `path` to `linit`, returns the new `LinitImage`s.
+
+    `replace` removes the pages the edition had. `log(done, total)` is called as pages get ready.
+    """
+    from main.models import LinitImage
+
+    started = time.monotonic()
+    pages = pages_of(path, filename)
+    total = len(pages)
+    workers = workers or settings_value('LINIT_INGEST_WORKERS') or os.cpu_count() or 1
+    options = settings_value('LINIT_PAGE_WIDTH'), settings_value('LINIT_PAGE_QUALITY'), settings_value('LINIT_PDF_DPI')
+    workdir = tempfile.mkdtemp(prefix='linit-')
+    try:
+        # Spawned rather than forked, the server process has threads and open connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, total), mp_context=context) as pool:
+            futures = {
+                pool.submit(prepare_page, path, page, os.path.join(workdir, 'page-%04d.jpg' % number), *options): number
+                for number, page in enumerate(pages, 1)
+            }
+            prepared = {}
+            for future in as_completed(futures):
+                number = futures[future]
+                try:
+                    prepared[number] = future.result()
+                except Exception as e:
+                    for pending in futures:
+                        pending.cancel()
+                    raise IngestError("Page %d: %s" % (number, e))
+                if log:
+                    log(len(prepared), total)
+
+        names = []
+        for number in range(1, total + 1):
+            with open(prepared[number], 'rb') as page_file:
+                names.append(
+                    default_storage.save('%s/linit-%s-%03d.jpg' % (UPLOAD_TO, linit.year_edition, number),
+                                         File(page_file)))
+        with transaction.atomic():
+            if replace:
+                LinitImage.objects.filter(linit_year=linit).delete()
+            images = LinitImage.objects.bulk_create([LinitImage(linit_year=linit, image=name) for name in names])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    logger.info("Ingested %d pages of %s in %.2fs", total, linit, time.monotonic() - started)
+    return images
+
+
+def upload_dir():
+    return getattr(settings, 'LINIT_UPLOAD_DIR', None) or os.path.join(settings.BASE_DIR, 'linit_uploads/')
+
+
+def latest_job(linit):
+    return linit.ingests.order_by('-created', '-pk').first()
+
+
+def is_active(job):
+    return job is not None and job.status in ('QUEUED', 'RUNNING')
+
+
+def queue(linit, upload, replace=False):
+    """Queue an ingestion of the uploaded file, None when the edition has one queued or running already"""
+    from main.models import Linit, LinitIngest
+
+    # Uploads are gone after the request, the worker reads its own copy
+    os.makedirs(upload_dir(), exist_ok=True)
+    path = os.path.join(upload_dir(), '%s%s' % (uuid.uuid4().hex, os.path.splitext(upload.name)[1].lower()))
+    with open(path, 'wb') as copy:
+        for chunk in upload.chunks():
+            copy.write(chunk)
+    with transaction.atomic():
+        # Two uploads of one edition at once queue one job
+        Linit.objects.select_for_update().filter(pk=linit.pk).first()
+        if is_active(latest_job(linit)):
+            os.remove(path)
+            return None
+        return LinitIngest.objects.create(linit=linit, filename=upload.name, path=path, replace=replace)
+
+
+def claim():
+    """Mark the oldest queued job, or a running one whose worker went silent, as RUNNING and return it"""
+    from main.models import LinitIngest
+
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings_value('LINIT_INGEST_TIMEOUT'))
+    due = LinitIngest.objects.filter(Q(status='QUEUED') | Q(status='RUNNING', heartbeat__lt=stale)).order_by('created')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job = due.select_related('linit').first()
+        if job is None:
+            return None
+        if job.attempts >= MAX_ATTEMPTS:
+            finish(job, 'FAILED', error="Given up after %d attempts, the worker stopped each time" % job.attempts)
+            return claim()
+        job.status, job.attempts, job.done, job.total = 'RUNNING', job.attempts + 1, 0, None
+        job.started = job.heartbeat = now
+        job.save(update_fields=['status', 'attempts', 'done', 'total', 'started', 'heartbeat'])
+    return job
+
+
+def report(job, done, total):
+    from main.models import LinitIngest
+
+    LinitIngest.objects.filter(pk=job.pk).update(done=done, total=total, heartbeat=timezone.now())
+
+
+def finish(job, status, error=None):
+    job.status, job.error, job.finished = status, error, timezone.now()
+    job.save(update_fields=['status', 'error', 'finished'])
+    try:
+        os.remove(job.path)
+    except FileNotFoundError:
+        pass
+
+
+def run_job(job, workers=None):
+    """Ingest a claimed job, recording its progress and outcome on the job"""
+    try:
+        images = ingest(job.linit, job.path, job.filename, job.replace, workers,
+                        log=lambda done, total: report(job, done, total))
+    except Exception as e:
+        logger.exception("Ingesting %s failed", job)
+        finish(job, 'FAILED', error=str(e))
+        return False
+    job.done = job.total = len(images)
+    report(job, job.done, job.total)
+    finish(job, 'DONE')
+    return True
+
+
+def run_worker(once=False, poll_interval=5, workers=None):
+    """Claim queued jobs and run them one at a time until stopped, returns the number of jobs run.
+
+    With `once` the worker returns as soon as nothing is queued.
+    """
+    count = 0
+    while True:
+        job = claim()
+        if job is not None:
+            run_job(job, workers)
+            count += 1
+            continue
+        if once:
+            return count
+        time.sleep(poll_interval)
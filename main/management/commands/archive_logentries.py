@@ -0,0 +1,79 @@
+import datetime
+from collections import defaultdict
+
+from django.contrib.admin.models import LogEntry
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main import archive
+
+
+def months_ago(moment, months):
+    """Same day and time `months` calendar months before `moment`, clamped to the end of shorter months"""
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - datetime.timedelta(days=1)).day
+    return moment.replace(year=year, month=month, day=min(moment.day, last_day))
+
+
+class Command(BaseCommand):
+    help = "Move admin log entries older than N months into compressed JSON-lines files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help="Archive entries older than this many months.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Entries written and deleted per batch.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many entries would be archived.")
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError("--months should be at least 1.")
+
+        cutoff = months_ago(timezone.now(), options['months'])
+        old_entries = LogEntry.objects.filter(action_time__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write("%d entries older than %s would be archived." % (old_entries.count(), cutoff.date()))
+            return
+
+        self.recover()
+        archived = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                old_entries.filter(pk__gt=last_pk).select_related('user', 'content_type').order_by('pk')
+                [:options['batch_size']])
+            if not batch:
+                break
+
+            records_by_month = defaultdict(list)
+            for entry in batch:
+                month = timezone.localtime(entry.action_time).strftime('%Y-%m')
+                records_by_month[month].append(archive.entry_to_record(entry))
+
+            # Rows are only deleted once the batch made it to disk, and the batch only joins the
+            # archive files once they are, a failed delete leaves nothing behind to archive twice
+            archive.write_pending(records_by_month)
+            with transaction.atomic():
+                LogEntry.objects.filter(pk__in=[entry.pk for entry in batch]).delete()
+            archive.flush_pending(records_by_month)
+
+            archived += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS("Archived %d entries older than %s." % (archived, cutoff.date())))
+
+    def recover(self):
+        """Finish the batch an interrupted run left pending"""
+        records_by_month = archive.read_pending()
+        if records_by_month is None:
+            return
+        ids = [record['id'] for records in records_by_month.values() for record in records]
+        # Rows still there were not deleted, they are archived again by this run
+        kept = set(LogEntry.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for month, records in records_by_month.items():
+            records_by_month[month] = [record for record in records if record['id'] not in kept]
+        archive.flush_pending(records_by_month, skip_archived=True)
+        self.stdout.write("Archived %d entries left pending by an earlier run." % (len(ids) - len(kept)))
@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main import cache as api_cache
+from main import placeholders, snapshot
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ("Work out the low quality placeholders, width and height of the images that have none, "
+            "e.g. those stored before placeholders or by bulk writes, in a process pool.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Work out every placeholder again, e.g. after changing PLACEHOLDER_SIZE.")
+        parser.add_argument('--workers', type=int, help="Processes reading images, one per CPU by default.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        workers = options['workers'] or os.cpu_count() or 1
+        # Spawned rather than forked, like the Linit ingestion
+        context = multiprocessing.get_context('spawn')
+        updated = failed = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for label, names in placeholders.FIELDS.items():
+                model = apps.get_model(label)
+                changed = 0
+                for name in names:
+                    done, errors = self.backfill(pool, workers, model, name, options['force'])
+                    changed += done
+                    failed += errors
+                if changed:
+                    api_cache.bump(*api_cache.groups_for_model(model))
+                updated += changed
+
+        message = "Updated %d placeholders in %.2fs." % (updated, time.monotonic() - started)
+        if failed:
+            self.stderr.write("%d images could not be read." % failed)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def backfill(self, pool, workers, model, name, force):
+        """Placeholders of image field `name` of `model`, returns (rows updated, unreadable images)"""
+        placeholder_column, width_column, height_column = placeholders.columns(name)
+        rows = model._default_manager.exclude(**{name: ''}).exclude(**{'%s__isnull' % name: True})
+        if not force:
+            rows = rows.filter(**{placeholder_column: ''})
+        pks_by_name = {}
+        for pk, stored_name in rows.values_list('pk', name).iterator(chunk_size=5000):
+            pks_by_name.setdefault(stored_name, []).append(pk)
+        if not pks_by_name:
+            return 0, 0
+
+        # An image used by several rows is read once
+        stored_names = list(pks_by_name)
+        paths = [default_storage.path(stored_name) for stored_name in stored_names]
+        chunksize = max(len(paths) // (workers * 4), 1)
+        results = pool.map(placeholders.compute_path, paths, [placeholders.size()] * len(paths), chunksize=chunksize)
+
+        instances = []
+        errors = 0
+        for stored_name, (values, error) in zip(stored_names, results):
+            if error:
+                errors += 1
+                self.stderr.write("%s %s: %s" % (model._meta.verbose_name, stored_name, error))
+                continue
+            for pk in pks_by_name[stored_name]:
+                instance = model(pk=pk)
+                for column, value in zip((placeholder_column, width_column, height_column), values):
+                    setattr(instance, column, value)
+                instances.append(instance)
+        model._default_manager.bulk_update(instances, [placeholder_column, width_column, height_column],
+                                           batch_size=BATCH_SIZE)
+        snapshot.bulk_changed(model, [instance.pk for instance in instances])
+        if self.verbosity >= 2:
+            self.stdout.write("%s.%s: %d rows" % (model._meta.label, name, len(instances)))
+        return len(instances), errors
@@ -0,0 +1,75 @@
+import random
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from main import benchmarks, seed
+
+# Requests per route, fewer for the larger datasets
+REPEAT = {
+    'small': 20,
+    'medium': 5,
+    'large': 2,
+}
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every route of the main, blog and mailer apps against a seeded test database "
+            "and fail on regressions against the checked-in baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small', help="Size of the dataset.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated data.")
+        parser.add_argument('--repeat', type=int, help="Requests per route, depends on --scale by default.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed slowdown and memory growth as a fraction of the baseline.")
+        parser.add_argument('--baseline', default=benchmarks.BASELINE, help="Baseline file to compare with.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store the results as the new baseline of this scale instead of comparing.")
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            # Throttling would turn repeated requests into 429s
+            rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={})
+            # The placeholder images of the seeded rows go with the test database
+            with tempfile.TemporaryDirectory() as media_root, override_settings(REST_FRAMEWORK=rest_framework,
+                                                                                MEDIA_ROOT=media_root):
+                self.stdout.write("Seeding the %s dataset..." % scale)
+                seed.seed(random.Random(options['seed']), seed.counts_for(scale), log=self.stdout.write)
+                results, skipped = benchmarks.run(options['repeat'] or REPEAT[scale], log=self.log)
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        for route, reason in sorted(skipped.items()):
+            self.stdout.write(self.style.WARNING("%s skipped, %s" % (route, reason)))
+
+        baseline = benchmarks.load_baseline(options['baseline'])
+        if options['update_baseline']:
+            baseline[scale] = results
+            benchmarks.save_baseline(baseline, options['baseline'])
+            self.stdout.write(self.style.SUCCESS("Baseline of the %s scale updated." % scale))
+            return
+
+        if scale not in baseline:
+            raise CommandError("No baseline for the %s scale, create one with --update-baseline." % scale)
+        for route in sorted(set(results) - set(baseline[scale])):
+            self.stdout.write(self.style.WARNING("%s has no baseline yet" % route))
+        found = benchmarks.regressions(results, baseline[scale], options['tolerance'])
+        if found:
+            for regression in found:
+                self.stderr.write(regression)
+            raise CommandError("%d regressions against the baseline." % len(found))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def log(self, route, url, result):
+        self.stdout.write("%-32s %4d  p50 %8.1fms  p95 %8.1fms  p99 %8.1fms  %4d queries  %7d KiB  %s" %
+                          (route, result['status'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                           result['queries'], result['peak_kb'], url))
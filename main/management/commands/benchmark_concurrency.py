@@ -0,0 +1,73 @@
+import random
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from main import seed
+from main.benchmarks import concurrency
+
+
+class Command(BaseCommand):
+    help = ("Compare the WSGI and the ASGI deployment serving many concurrent slow clients "
+            "the public read endpoints of a seeded test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small', help="Size of the dataset.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated data.")
+        parser.add_argument('--clients', type=int, default=50, help="Concurrent clients.")
+        parser.add_argument('--requests', type=int, default=10, help="Requests per client.")
+        parser.add_argument('--client-delay', type=float, default=0.2,
+                            help="Seconds every client takes to read a response.")
+        parser.add_argument('--wsgi-workers', type=int, default=3, help="Sync workers of the WSGI deployment.")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Path to request, repeat for several. All public reads by default.")
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Render every ASGI request instead of serving it from the response cache.")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or concurrency.PATHS
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            # Throttling would turn repeated requests into 429s
+            rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={})
+            with tempfile.TemporaryDirectory() as media_root, override_settings(REST_FRAMEWORK=rest_framework,
+                                                                                MEDIA_ROOT=media_root):
+                self.stdout.write("Seeding the %s dataset..." % options['scale'])
+                seed.seed(random.Random(options['seed']), seed.counts_for(options['scale']), log=self.stdout.write)
+                results = self.run(paths, options)
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        self.stdout.write("%d clients x %d requests, %.2fs to read each response" %
+                          (options['clients'], options['requests'], options['client_delay']))
+        for mode, result in results:
+            self.stdout.write("%-34s %5.1f req/s  p50 %8.1fms  p95 %8.1fms  p99 %8.1fms  max %8.1fms  %d errors" %
+                              (mode, result['throughput'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                               result['max_ms'], result['errors']))
+
+    def run(self, paths, options):
+        from django.core.wsgi import get_wsgi_application
+        from glug_website.asgi import application
+
+        self.stdout.write("Running the WSGI deployment...")
+        wsgi = concurrency.run_wsgi(get_wsgi_application(), paths, options['wsgi_workers'], options['clients'],
+                                    options['requests'], options['client_delay'])
+
+        self.stdout.write("Running the ASGI deployment...")
+        cache.clear()
+        timeout = 0 if options['no_cache'] else settings.RESPONSE_CACHE_TIMEOUT
+        with override_settings(RESPONSE_CACHE_TIMEOUT=timeout, API_CACHE_LOCAL=True):
+            asgi = concurrency.run_asgi(application, paths, options['clients'], options['requests'],
+                                        options['client_delay'])
+        return [
+            ('WSGI (%d sync workers)' % options['wsgi_workers'], wsgi),
+            ('ASGI (%d ORM threads%s)' % (settings.ASYNC_ORM_THREADS, ', no cache' if options['no_cache'] else ''),
+             asgi),
+        ]
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.questioner import NonInteractiveMigrationQuestioner
+from django.db.migrations.state import ProjectState
+
+# Hash of the collected static files, kept next to them
+STATIC_HASH_FILE = '.static-hash'
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def model_changes():
+    """Apps whose models changed since their last migration"""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    autodetector = MigrationAutodetector(loader.project_state(), ProjectState.from_apps(apps),
+                                         NonInteractiveMigrationQuestioner(dry_run=True))
+    return sorted(autodetector.changes(graph=loader.graph))
+
+
+def pending_migrations(connection):
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def missing_tables(connection):
+    """Tables of apps without migrations that `migrate --run-syncdb` would create"""
+    migrated = MigrationLoader(connection, ignore_no_migrations=True).migrated_apps
+    existing = set(connection.introspection.table_names())
+    return sorted(model._meta.db_table for app_config in apps.get_app_configs()
+                  if app_config.label not in migrated for model in app_config.get_models()
+                  if model._meta.managed and not model._meta.proxy and model._meta.db_table not in existing)
+
+
+def static_hash():
+    """Hash of every file collectstatic would copy, with its path"""
+    found = []
+    for finder in get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            found.append((os.path.join(getattr(storage, 'prefix', None) or '', path), storage, path))
+    digest = hashlib.sha1(settings.STATICFILES_STORAGE.encode())
+    for prefixed_path, storage, path in sorted(found, key=lambda item: item[0]):
+        digest.update(prefixed_path.encode() + b'\0')
+        with storage.open(path) as static_file:
+            for chunk in iter(lambda: static_file.read(64 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_static_hash():
+    try:
+        with open(os.path.join(settings.STATIC_ROOT, STATIC_HASH_FILE)) as hash_file:
+            return hash_file.read().strip()
+    except OSError:
+        return None
+
+
+def write_static_hash(value):
+    with open(os.path.join(settings.STATIC_ROOT, STATIC_HASH_FILE), 'w') as hash_file:
+        hash_file.write(value + '\n')
+
+
+class Command(BaseCommand):
+    help = ("Prepare the database and static files for the server, making migrations, migrating and "
+            "collecting static files only when something changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Run every step, changed or not.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database to migrate.")
+
+    def handle(self, *args, **options):
+        force = options['force']
+        started = time.monotonic()
+        self.step("makemigrations", self.makemigrations, force)
+        self.step("migrate", self.migrate, force, connections[options['database']])
+        self.step("collectstatic", self.collectstatic, force)
+        self.stdout.write(self.style.SUCCESS("Booted in %.2fs." % (time.monotonic() - started)))
+
+    def step(self, name, run, *args):
+        started = time.monotonic()
+        outcome = run(*args)
+        self.stdout.write("%s: %s (%.2fs)" % (name, outcome, time.monotonic() - started))
+
+    def makemigrations(self, force):
+        changed = model_changes()
+        if not changed and not force:
+            return "skipped, no model changes"
+        call_command('makemigrations', interactive=False, verbosity=0)
+        return "made migrations for %s" % (', '.join(changed) or "no app")
+
+    def migrate(self, force, connection):
+        pending = pending_migrations(connection)
+        missing = missing_tables(connection)
+        if not pending and not missing and not force:
+            return "skipped, nothing to apply"
+        call_command('migrate', database=connection.alias, run_syncdb=True, interactive=False, verbosity=0)
+        return "applied %d migrations, created %d tables" % (len(pending), len(missing))
+
+    def collectstatic(self, force):
+        current = static_hash()
+        if current == read_static_hash() and not force:
+            return "skipped, static files unchanged"
+        call_command('collectstatic', interactive=False, verbosity=0)
+        write_static_hash(current)
+        return "collected"
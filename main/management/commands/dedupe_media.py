@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main import storage
+
+
+def blob_files(root):
+    """(digest, path) of every stored blob"""
+    blobs = os.path.join(root, storage.BLOB_DIR)
+    if not os.path.isdir(blobs):
+        return
+    for directory, dirnames, filenames in os.walk(blobs):
+        for filename in filenames:
+            if not filename.endswith('.tmp'):
+                yield filename, os.path.join(directory, filename)
+
+
+class Command(BaseCommand):
+    help = ("Hash every file in MEDIA_ROOT and turn files with the same content into hard links to one blob, "
+            "the way the content addressed storage stores new uploads. Paths don't change.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Files hashed in parallel.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what linking would save.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        root = settings.MEDIA_ROOT
+        dry_run = options['dry_run']
+        paths = [entry.path for entry in storage.media_files(root)]
+        # hashlib lets go of the GIL on large buffers, threads hash side by side
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            digests = list(pool.map(self.digest, paths))
+
+        groups = {}
+        for path, found in zip(paths, digests):
+            if found:
+                groups.setdefault(found, []).append(path)
+        linked = saved = 0
+        for (digest, size), group in groups.items():
+            blob_path = os.path.join(root, storage.blob_name(digest))
+            inodes = {os.stat(path).st_ino for path in group}
+            if os.path.exists(blob_path):
+                inodes.add(os.stat(blob_path).st_ino)
+            saved += size * (len(inodes) - 1)
+            if dry_run:
+                continue
+            linked += self.link_group(blob_path, group)
+            storage.record(digest, size, storage.references(blob_path))
+
+        removed = 0
+        if not dry_run:
+            for digest, blob_path in blob_files(root):
+                if storage.references(blob_path) == 0:
+                    # No name is linked to it any more, e.g. deleted without the storage
+                    os.remove(blob_path)
+                    storage.record(digest, 0, 0)
+                    removed += 1
+
+        self.stdout.write("%d files, %d distinct contents, %.1f MiB %s by linking duplicates." %
+                          (len(paths), len(groups), saved / 1024 / 1024, "to save" if dry_run else "saved"))
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS("Linked %d files and removed %d unused blobs in %.2fs." %
+                                   (linked, removed, time.monotonic() - started)))
+
+    def digest(self, path):
+        try:
+            return storage.file_digest(path)
+        except OSError as e:
+            self.stderr.write("Skipping %s: %s" % (path, e))
+            return None
+
+    def link_group(self, blob_path, group):
+        """Link every file of `group` to the blob, returns how many were copies before"""
+        linked = 0
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if not os.path.exists(blob_path):
+            os.link(group[0], blob_path)
+        for path in group:
+            if not os.path.samefile(path, blob_path):
+                try:
+                    storage.link(blob_path, path)
+                    linked += 1
+                except OSError as e:
+                    self.stderr.write("Could not link %s: %s" % (path, e))
+        return linked
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import exports
+
+
+class Command(BaseCommand):
+    help = "Export alumni, members, events or sent mails as CSV or JSON lines, streaming rows as they are read."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv', dest='output_format')
+        parser.add_argument('--columns', help="Comma separated columns, the dataset's usual ones by default.")
+        parser.add_argument('--filter', action='append', default=[], dest='filters', metavar='LOOKUP=VALUE',
+                            help="Filter on a column, e.g. passout_year__gte=2015. Repeat for several.")
+        parser.add_argument('--output', help="File to write to, stdout by default.")
+
+    def handle(self, *args, **options):
+        params = []
+        for item in options['filters']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError("Filters look like LOOKUP=VALUE, got %r" % item)
+            params.append((key, value))
+        try:
+            content_type, filename, chunks = exports.export(options['dataset'], options['output_format'],
+                                                            options['columns'], params)
+        except exports.ExportError as e:
+            raise CommandError(e)
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
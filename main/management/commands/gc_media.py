@@ -0,0 +1,104 @@
+import datetime
+import os
+import shutil
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from main import storage
+from main.models import MediaBlob
+
+
+def file_fields():
+    """(model, file field column names) of every model with files"""
+    for model in apps.get_models():
+        opts = model._meta
+        if not opts.managed or opts.proxy:
+            continue
+        columns = [field.attname for field in opts.concrete_fields if isinstance(field, models.FileField)]
+        if columns:
+            yield model, columns
+
+
+def referenced_names():
+    """Storage names of every file a row points at, one streamed query per model"""
+    found = set()
+    for model, columns in file_fields():
+        for row in model._default_manager.values_list(*columns).iterator(chunk_size=5000):
+            found.update(os.path.normpath(name) for name in row if name)
+    return found
+
+
+def recently_linked(root, cutoff):
+    """(device, inode) of the blobs a name was linked to or unlinked from after `cutoff`"""
+    found = set()
+    since = datetime.datetime.fromtimestamp(cutoff, tz=datetime.timezone.utc)
+    for name in MediaBlob.objects.filter(linked_at__gt=since).values_list('name', flat=True).iterator():
+        try:
+            stat = os.stat(os.path.join(root, name))
+        except FileNotFoundError:
+            continue
+        found.add((stat.st_dev, stat.st_ino))
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Delete, or move to MEDIA_GC_QUARANTINE_DIR, the files in MEDIA_ROOT that no file or image field "
+            "points at and that are older than the grace period.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24),
+                            help="Keep files changed or linked this recently, they may belong to a row being saved.")
+        parser.add_argument('--quarantine', action='store_true',
+                            help="Copy unreferenced files to MEDIA_GC_QUARANTINE_DIR before deleting them.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report the unreferenced files and their size.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        root = settings.MEDIA_ROOT
+        # Names are collected first, a file uploaded after this is younger than the grace period
+        referenced = referenced_names()
+        cutoff = time.time() - options['grace_hours'] * 3600
+        # A name linked to an old blob has the blob's mtime, the blob row knows when it was linked
+        linked = recently_linked(root, cutoff)
+
+        orphans = []
+        kept = 0
+        for entry in storage.media_files(root):
+            name = os.path.relpath(entry.path, root)
+            if name in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff or (stat.st_dev, stat.st_ino) in linked:
+                kept += 1
+                continue
+            orphans.append((name, stat.st_size))
+
+        size = sum(file_size for name, file_size in orphans)
+        for name, file_size in orphans:
+            if options['verbosity'] >= 2 or options['dry_run']:
+                self.stdout.write("%s (%d bytes)" % (name, file_size))
+            if not options['dry_run']:
+                if options['quarantine']:
+                    self.quarantine(root, name)
+                # Through the storage, which drops the blob with its last name and keeps the counts right
+                default_storage.delete(name)
+
+        summary = "%d unreferenced files of %.1f MiB (%d newer ones kept)" % (len(orphans), size / 1024 / 1024, kept)
+        if options['dry_run']:
+            self.stdout.write("Dry run, %s." % summary)
+        else:
+            action = "Quarantined" if options['quarantine'] else "Deleted"
+            self.stdout.write(self.style.SUCCESS("%s %s in %.2fs." % (action, summary, time.monotonic() - started)))
+
+    def quarantine(self, root, name):
+        """Copy the file to the quarantine, the caller deletes it from the storage"""
+        quarantine_dir = getattr(settings, 'MEDIA_GC_QUARANTINE_DIR',
+                                 os.path.join(settings.BASE_DIR, 'media_quarantine/'))
+        target = os.path.join(quarantine_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(os.path.join(root, name), target)
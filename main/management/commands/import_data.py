@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import imports
+
+
+class Command(BaseCommand):
+    help = ("Import alumni, events or timeline entries from a CSV or JSON lines file, in batches of bulk writes. "
+            "Events are matched on their identifier.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(imports.DATASETS))
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=list(imports.FORMATS), dest='input_format',
+                            help="Format of the file, guessed from its extension by default.")
+        parser.add_argument('--dry-run', action='store_true', help="Check the file and report, without writing.")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows written per transaction, IMPORT_BATCH_SIZE by default.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            input_format = options['input_format'] or imports.guess_format(options['file'])
+            with open(options['file'], 'rb') as binary_file:
+                report = imports.import_rows(options['dataset'], input_format, imports.text(binary_file),
+                                             options['dry_run'], options['batch_size'])
+        except (imports.ImportDataError, OSError, UnicodeDecodeError) as e:
+            raise CommandError(e)
+
+        for line, message in report.errors:
+            self.stderr.write("line %d: %s" % (line, message))
+        if report.counts['invalid'] > len(report.errors):
+            self.stderr.write("... and %d more invalid rows" % (report.counts['invalid'] - len(report.errors)))
+        if report.ignored:
+            self.stdout.write("Ignored columns: %s" % ', '.join(sorted(report.ignored)))
+        summary = ', '.join('%d %s' % (count, name) for name, count in report.counts.items())
+        if report.dry_run:
+            self.stdout.write("Dry run, nothing written: %s." % summary)
+        else:
+            self.stdout.write(self.style.SUCCESS("Imported in %.2fs: %s." % (time.monotonic() - started, summary)))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import linit
+from main.models import Linit
+
+
+class Command(BaseCommand):
+    help = ("Add the pages of a Linit edition from a ZIP of page images or a PDF, preparing pages in parallel. "
+            "With --worker, run the uploads queued from the admin instead.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('year_edition', type=int, nargs='?')
+        parser.add_argument('file', nargs='?')
+        parser.add_argument('--replace', action='store_true', help="Remove the pages the edition has first.")
+        parser.add_argument('--workers', type=int, help="Processes preparing pages, one per CPU by default.")
+        parser.add_argument('--worker', action='store_true', help="Run the queued uploads of the admin.")
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help="Seconds to wait when nothing is queued, with --worker.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once nothing is queued instead of polling, with --worker.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['worker']:
+            try:
+                count = linit.run_worker(once=options['once'], poll_interval=options['poll_interval'],
+                                         workers=options['workers'])
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(self.style.SUCCESS("Ran %d queued uploads." % count))
+            return
+        if options['year_edition'] is None or options['file'] is None:
+            raise CommandError("Give the edition and the file, or --worker.")
+
+        try:
+            edition = Linit.objects.get(year_edition=options['year_edition'])
+        except Linit.DoesNotExist:
+            raise CommandError("No Linit edition of %d" % options['year_edition'])
+        except Linit.MultipleObjectsReturned:
+            raise CommandError("There are several Linit editions of %d" % options['year_edition'])
+
+        started = time.monotonic()
+        try:
+            images = linit.ingest(edition, options['file'], options['file'], options['replace'], options['workers'],
+                                  log=self.progress)
+        except (linit.IngestError, OSError) as e:
+            raise CommandError(e)
+        self.stdout.write(
+            self.style.SUCCESS("Added %d pages to %s in %.2fs." % (len(images), edition, time.monotonic() - started)))
+
+    def progress(self, done, total):
+        if self.verbosity >= 2:
+            self.stdout.write("%d/%d pages ready" % (done, total))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in bounded chunks, meant to be run periodically from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            default=settings.SESSION_PURGE_CHUNK_SIZE,
+                            help="Number of sessions deleted per statement.")
+        parser.add_argument('--pause',
+                            type=float,
+                            default=0,
+                            help="Seconds to sleep between chunks, to go easy on a busy database.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+
+        deleted = 0
+        while True:
+            # Deleting by primary key keeps every statement bounded to one chunk
+            keys = list(expired.values_list('session_key', flat=True)[:chunk_size])
+            if not keys:
+                break
+            count, _ = Session.objects.filter(session_key__in=keys).delete()
+            deleted += count
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS("Deleted %d expired sessions." % deleted))
@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from main import querylog
+
+
+class Command(BaseCommand):
+    help = "Print the query fingerprints that cost the most time, read from the slow-query log."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help="Number of fingerprints to print.")
+        parser.add_argument('--sort', choices=['total', 'count', 'max'], default='total',
+                            help="Order by total time, number of executions or slowest execution.")
+        parser.add_argument('--view', help="Only count queries of this view, e.g. main:alumnibyyear-list.")
+        parser.add_argument('--slow', action='store_true',
+                            help="Print the slowest captured statements with their EXPLAIN output instead.")
+        parser.add_argument('--file', help="Log file to read, defaults to QUERYLOG_FILE.")
+
+    def handle(self, *args, **options):
+        records = querylog.read_records(options['file'])
+        if options['slow']:
+            self.print_slow(records, options)
+            return
+
+        offenders = querylog.top(records, options['sort'], options['view'])
+        if not offenders:
+            self.stdout.write("The slow-query log is empty, is QUERYLOG_ENABLED set?")
+            return
+        for stats in offenders[:options['limit']]:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING("%s  %s" % (stats['fingerprint'], stats['view'])) +
+                "  count=%d total=%.3fs avg=%.1fms max=%.1fms" %
+                (stats['count'], stats['total'], stats['total'] * 1000 / stats['count'], stats['max'] * 1000))
+            self.stdout.write("    %s" % stats['sql'])
+
+    def print_slow(self, records, options):
+        slow = [
+            record for record in records
+            if record.get('type') == 'slow' and (not options['view'] or record['view'] == options['view'])
+        ]
+        slow.sort(key=lambda record: record['duration'], reverse=True)
+        for record in slow[:options['limit']]:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING("%s  %s" % (record['fingerprint'], record['view'])) + "  %.1fms at %s" %
+                (record['duration'] * 1000, datetime.datetime.fromtimestamp(record['time']).isoformat(' ', 'seconds')))
+            self.stdout.write("    %s" % record['sql'])
+            if record.get('param_types'):
+                self.stdout.write("    parameter types: %s" % (record['param_types'], ))
+            for line in (record['explain'] or '').splitlines():
+                self.stdout.write("    | %s" % line)
@@ -0,0 +1,35 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import seed
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with deterministic synthetic content for load testing. "
+            "Meant for throwaway databases, the rows are not removed again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small',
+                            help="Default row counts, 100, 10k or 100k events, alumni, timeline entries, comments...")
+        for name in seed.counts_for('small'):
+            parser.add_argument('--%s' % name.replace('_', '-'), type=int, dest=name,
+                                help="Number of %s, overrides --scale." % name.replace('_', ' '))
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated data.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT batch.")
+        parser.add_argument('--force', action='store_true', help="Run even with DEBUG off.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("DEBUG is off, this looks like a production database. Use --force to seed it anyway.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size should be at least 1.")
+
+        counts = seed.counts_for(options['scale'])
+        for name in counts:
+            if options[name] is not None:
+                counts[name] = options[name]
+
+        created = seed.seed(random.Random(options['seed']), counts, options['batch_size'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS("Created %d rows." % sum(created.values())))
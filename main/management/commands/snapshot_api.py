@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import snapshot
+
+
+class Command(BaseCommand):
+    help = ("Render every public GET endpoint of the site to static JSON files under SNAPSHOT_ROOT, "
+            "rewriting only the files whose content changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', action='append', dest='prefixes',
+                            help="Only the endpoints below this path, e.g. /api/events/. Repeat for several.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        prefixes = ['/']
+        if options['prefixes']:
+            prefixes = ['/%s/' % prefix.strip('/') for prefix in options['prefixes']]
+        paths = [path for path in snapshot.all_paths() if path.startswith(tuple(prefixes))]
+        unknown = [prefix for prefix in prefixes if not any(path.startswith(prefix) for path in paths)]
+        if unknown:
+            raise CommandError("No public endpoints below %s" % ', '.join(unknown))
+        counts = snapshot.export(paths, prefixes, log=self.log)
+        summary = "%(written)d written, %(unchanged)d unchanged, %(removed)d removed" % counts
+        summary += " in %.1fs." % (time.monotonic() - started)
+        if counts['failed']:
+            self.stdout.write(self.style.WARNING("%s %d failed, their last snapshots are kept." %
+                                                 (summary, counts['failed'])))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def log(self, path, status):
+        if status != 200:
+            self.stdout.write(self.style.WARNING("%s answered %d, not exported" % (path, status)))
+        elif self.verbosity > 1:
+            self.stdout.write(path)
@@ -0,0 +1,283 @@
+"""Per-view request metrics in the Prometheus text exposition format.
+
+`main.middleware.MetricsMiddleware` records, per resolved view and method, the request
+count, a latency histogram, response bytes, database queries and their time, and the
+time spent in serializers. Counters are kept in process; with METRICS_DIR set every
+gunicorn worker also flushes its counters to a file there and `/metrics` adds them up.
+When a worker exits the gunicorn master folds its counters into `retired.json` and drops
+its gauges, see `retire_worker()`.
+"""
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Upper bounds of the latency histogram in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name, type, help, field of the per-view counters
+COUNTERS = (
+    ('glug_http_requests_total', 'counter', 'Requests handled.', 'requests'),
+    ('glug_http_response_size_bytes_total', 'counter', 'Bytes of response bodies sent.', 'response_bytes'),
+    ('glug_db_queries_total', 'counter', 'Database queries run.', 'queries'),
+    ('glug_db_query_duration_seconds_total', 'counter', 'Time spent running database queries.', 'query_seconds'),
+    ('glug_serializer_duration_seconds_total', 'counter', 'Time spent serializing responses.', 'serializer_seconds'),
+)
+
+# Callables yielding process wide metrics as (name, type, help, labels, value)
+COLLECTORS = ('glug_website.db.pool.samples', 'main.async_views.samples')
+
+RETIRED_FILE = 'retired.json'
+WORKER_FILE = re.compile(r'^worker-(\d+)\.json$')
+
+_lock = threading.Lock()
+_views = {}
+_local = threading.local()
+_last_flush = 0.0
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def new_stats():
+    return {
+        'requests': 0,
+        'duration_sum': 0.0,
+        'buckets': [0] * len(BUCKETS),
+        'response_bytes': 0,
+        'queries': 0,
+        'query_seconds': 0.0,
+        'serializer_seconds': 0.0,
+    }
+
+
+def start_request():
+    """Reset the per-request tallies of the current thread"""
+    _local.request = {'queries': 0, 'query_seconds': 0.0, 'serializer_seconds': 0.0}
+
+
+def current():
+    return getattr(_local, 'request', None)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """`connection.execute_wrapper()` hook counting the queries of the current request"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        tally = current()
+        if tally is not None:
+            tally['queries'] += 1
+            tally['query_seconds'] += time.perf_counter() - start
+
+
+@contextmanager
+def serializer_timer():
+    tally = current()
+    if tally is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tally['serializer_seconds'] += time.perf_counter() - start
+
+
+def record(view, method, duration, response_bytes):
+    """Add a finished request and the tallies of the current thread to the counters"""
+    tally = current() or {}
+    _local.request = None
+    with _lock:
+        stats = _views.setdefault((view, method), new_stats())
+        stats['requests'] += 1
+        stats['duration_sum'] += duration
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                stats['buckets'][i] += 1
+                break
+        stats['response_bytes'] += response_bytes
+        stats['queries'] += tally.get('queries', 0)
+        stats['query_seconds'] += tally.get('query_seconds', 0.0)
+        stats['serializer_seconds'] += tally.get('serializer_seconds', 0.0)
+    maybe_flush()
+
+
+def snapshot():
+    with _lock:
+        return {key: dict(stats, buckets=list(stats['buckets'])) for key, stats in _views.items()}
+
+
+def collector_samples():
+    return [[name, kind, help_text, labels, value]
+            for path in COLLECTORS for name, kind, help_text, labels, value in import_string(path)()]
+
+
+def worker_file(pid=None, directory=None):
+    return os.path.join(directory or metrics_dir(), 'worker-%d.json' % (pid or os.getpid()))
+
+
+def write_file(path, flushed):
+    """Replace a metrics file atomically so readers never see half a file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as tmp_file:
+        json.dump(flushed, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def read_file(path):
+    try:
+        with open(path) as flushed:
+            return json.load(flushed)
+    except (OSError, ValueError):
+        # A worker that exited while we were listing the directory
+        return None
+
+
+def flush():
+    """Write this process' counters to METRICS_DIR"""
+    global _last_flush
+    if not metrics_dir():
+        return
+    _last_flush = time.monotonic()
+    os.makedirs(metrics_dir(), exist_ok=True)
+    rows = [[view, method, stats] for (view, method), stats in snapshot().items()]
+    write_file(worker_file(), {'views': rows, 'samples': collector_samples()})
+
+
+def maybe_flush():
+    if metrics_dir() and time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+atexit.register(flush)
+
+
+def merge(into, stats):
+    for field, value in stats.items():
+        if field == 'buckets':
+            into['buckets'] = [a + b for a, b in zip(into['buckets'], value)]
+        else:
+            into[field] += value
+
+
+def add_sample(samples, name, kind, help_text, labels, value):
+    key = (name, tuple(sorted(labels.items())))
+    if key in samples:
+        samples[key][2] += value
+    else:
+        samples[key] = [kind, help_text, value]
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire_worker(pid, directory=None):
+    """Fold the counters of an exited worker into the retired file, dropping its gauges.
+
+    Run by the gunicorn master from `child_exit`, before a new worker can reuse the pid and
+    start its counters over in the same file.
+    """
+    directory = directory or metrics_dir()
+    path = worker_file(pid, directory)
+    flushed = read_file(path)
+    if flushed is None:
+        return
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    retired = read_file(retired_path) or {'views': [], 'samples': []}
+
+    views = {}
+    for view, method, stats in retired['views'] + flushed['views']:
+        merge(views.setdefault((view, method), new_stats()), stats)
+    samples = {}
+    for sample in retired['samples'] + [sample for sample in flushed['samples'] if sample[1] == 'counter']:
+        add_sample(samples, *sample)
+    write_file(retired_path, {
+        'views': [[view, method, stats] for (view, method), stats in views.items()],
+        'samples': [[name, kind, help_text, dict(labels), value]
+                    for (name, labels), (kind, help_text, value) in samples.items()],
+    })
+    os.remove(path)
+
+
+def collect():
+    """Counters of this process, plus those flushed by the other workers when METRICS_DIR is set.
+
+    Returns the per-view counters and the collector samples, summed over the workers.
+    """
+    views = snapshot()
+    samples = {}
+    for sample in collector_samples():
+        add_sample(samples, *sample)
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return views, samples
+    own = worker_file()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or path == own:
+            continue
+        flushed = read_file(path)
+        if flushed is None:
+            continue
+        # Gauges of a worker that is gone, and not retired yet, describe nothing anymore
+        worker = WORKER_FILE.match(name)
+        gone = worker is not None and not is_running(int(worker.group(1)))
+        for view, method, stats in flushed['views']:
+            merge(views.setdefault((view, method), new_stats()), stats)
+        for sample in flushed['samples']:
+            if not (gone and sample[1] == 'gauge'):
+                add_sample(samples, *sample)
+    return views, samples
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exposition():
+    """All metrics in the Prometheus text format"""
+    views, samples = collect()
+    views = sorted(views.items())
+    lines = []
+    for name, kind, help_text, field in COUNTERS:
+        lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, kind)]
+        for (view, method), stats in views:
+            lines.append('%s{view="%s",method="%s"} %s' % (name, escape(view), method, stats[field]))
+
+    name = 'glug_http_request_duration_seconds'
+    lines += ['# HELP %s Request latency.' % name, '# TYPE %s histogram' % name]
+    for (view, method), stats in views:
+        labels = 'view="%s",method="%s"' % (escape(view), method)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, stats['requests']))
+        lines.append('%s_sum{%s} %s' % (name, labels, stats['duration_sum']))
+        lines.append('%s_count{%s} %d' % (name, labels, stats['requests']))
+
+    described = set()
+    for (name, labels), (kind, help_text, value) in sorted(samples.items()):
+        if name not in described:
+            described.add(name)
+            lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, kind)]
+        labels = ','.join('%s="%s"' % (label, escape(str(label_value))) for label, label_value in labels)
+        lines.append('%s{%s} %s' % (name, labels, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,108 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import InterfaceError, OperationalError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from glug_website.db import router
+from main import metrics, querylog
+
+
+def client_identity(request):
+    """What a client sends with each of its requests: its token, else its session, else its address"""
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return 'authorization:%s' % authorization
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return 'session:%s' % session_key
+    return 'address:%s' % BaseThrottle().get_ident(request)
+
+
+def view_name(request):
+    match = request.resolver_match
+    return (match.view_name or match._func_path) if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    """Records request metrics per resolved view, see main/metrics.py"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.query_wrapper))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        metrics.record(view_name(request), request.method, duration, size)
+        return response
+
+
+class QueryLogMiddleware:
+    """Feeds the statements of every request to the slow-query log, see main/querylog.py"""
+
+    def __init__(self, get_response):
+        if not querylog.querylog_setting('QUERYLOG_ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        querylog.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(querylog.query_wrapper))
+                return self.get_response(request)
+        finally:
+            querylog.finish_request()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        querylog.set_view(view_name(request))
+
+
+class ReplicaMiddleware:
+    """Lets safe requests to the API viewsets read from the replica, see glug_website/db/router.py"""
+
+    def __init__(self, get_response):
+        if router.replica_alias() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        router.start_request(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = router.end_request()
+        if wrote or request.method not in SAFE_METHODS:
+            # Read your own writes from the primary until the replica has caught up
+            router.pin(client_identity(request))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF marks the views of viewsets with their actions
+        if (request.method in SAFE_METHODS and getattr(view_func, 'actions', None) is not None
+                and not router.is_pinned(client_identity(request)) and router.available(router.replica_alias())):
+            router.start_request(True)
+            request.replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        if not (isinstance(exception, (OperationalError, InterfaceError)) and router.reading_from_replica()):
+            return None
+        # Only reads ran, try again on the primary
+        router.mark_down(router.replica_alias())
+        router.use_primary()
+        view_func, view_args, view_kwargs = request.replica_view
+        return view_func(request, *view_args, **view_kwargs)
@@ -0,0 +1,17 @@
+class SparseFieldsetMixin:
+    """Loads only the columns behind the fields asked for with `?fields=`, `?omit=` and `?expand=`.
+
+    Works with serializers based on `main.serializers.DynamicFieldsModelSerializer`.
+    """
+    fieldset_params = ('fields', 'omit', 'expand')
+    # Model fields the view itself reads, e.g. to group results
+    fieldset_always_load = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not any(self.request.query_params.get(param) for param in self.fieldset_params):
+            return queryset
+        serializer = self.get_serializer()
+        if not hasattr(serializer, 'narrow'):
+            return queryset
+        return serializer.narrow(queryset, self.fieldset_always_load)
@@ -27,6 +27,9 @@ class Event(models.Model):
     identifier = models.CharField(max_length=64, unique=True, help_text="Unique Identifier for events")
     title = models.CharField(max_length=255)
     event_image = models.ImageField(upload_to='event_images/', null=True, blank=True, validators=[validate_image_size])
+    event_image_placeholder = models.TextField(blank=True, default='', editable=False)
+    event_image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    event_image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     description = models.TextField( blank=True, null=True)
     # description = RichTextField(blank=True, null=True)
     # description = MarkdownField(rendered_field='rendered', validator=VALIDATOR_STANDARD)
@@ -97,17 +100,20 @@ class Event(models.Model):
     def __str__(self):
         return self.identifier
 
-    def save(self, *args, **kwargs):
+    def apply_rules(self):
+        """Field rules enforced on save, bulk imports that skip save() call this themselves"""
         if self.status == "DRAFT":
             self.show = False
 
         if self.event_type == "ONLINE":
             self.venue = None
-            
+
         # Update BTS timestamp if any BTS content is added/modified
         if (self.bts_description or self.bts_image or self.bts_video) and not self.bts_uploaded_at:
             self.bts_uploaded_at = timezone.now()
-            
+
+    def save(self, *args, **kwargs):
+        self.apply_rules()
         super().save(*args, **kwargs)
 
         if self.add_to_timeline and not Timeline.objects.filter(event_name=self.title).exists():
@@ -121,6 +127,29 @@ def year_choices():
     cuur_year = datetime.date.today().year
     return [(y, y) for y in range(cuur_year, cuur_year + 4 + 1)]
 
+
+class YearChoices:
+    """`year_choices()` worked out again whenever the choices are read, so they follow the calendar"""
+
+    def __iter__(self):
+        return iter(year_choices())
+
+
+class PassoutYearField(models.IntegerField):
+    """Year offered from this year to four years ahead.
+
+    The choices change every year, they are left out of migrations so `makemigrations` doesn't make a new one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', YearChoices())
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('choices', None)
+        return name, path, args, kwargs
+
 class Facad(models.Model):
     """Faculty Advisor model"""
     post = models.CharField(max_length=100)
@@ -151,6 +180,9 @@ class Alumni(models.Model):
     alias = models.CharField(max_length=64, blank=True, null=True)
     bio = models.TextField(max_length=512, blank=True, null=True)
     image = models.ImageField(upload_to='alumni_images/', blank=True, null=True, validators=[validate_image_size])
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     email = models.EmailField(blank=True, null=True)
     phone_number = models.CharField(max_length=14, blank=True, null=True)
     degree_name = models.CharField(max_length=64, choices=DEGREE)
@@ -196,7 +228,7 @@ class Profile(models.Model):
     email = models.EmailField(blank=True, null=True)
     phone_number = models.CharField(max_length=14, blank=True, null=True)
     degree_name = models.CharField(max_length=64, choices=DEGREE)
-    passout_year = models.IntegerField(choices=year_choices(), default=2018)
+    passout_year = PassoutYearField(default=2018)
     position = models.CharField(max_length=255, blank=True, null=True)
     convert_to_alumni = models.BooleanField(default=False)
 
@@ -217,7 +249,8 @@ class Profile(models.Model):
                 class AlumniSerializer(serializers.ModelSerializer):
                     class Meta:
                      model = Alumni
-                     fields = '__all__'
+                     # Profiles have no placeholders, the new alumni gets its own when saved
+                     exclude = ('image_placeholder', 'image_width', 'image_height')
 
                 # Converting the Profile instance to Alumni instance
                 alumni_data = AlumniSerializer(self).data
@@ -243,6 +276,12 @@ class CarouselImage(models.Model):
                                      validators=[validate_image_size],
                                      blank=True,
                                      null=True)
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    mobile_image_placeholder = models.TextField(blank=True, default='', editable=False)
+    mobile_image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    mobile_image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     heading = models.CharField(max_length=255, blank=True, null=True)
     sub_heading = models.TextField(max_length=1024, blank=True, null=True)
 
@@ -330,6 +369,44 @@ class LinitImage(models.Model):
     image = models.ImageField(upload_to='linit_magzine_images/', blank=True, null=True)
 
 
+class LinitIngest(models.Model):
+    """An uploaded edition waiting for `manage.py ingest_linit --worker` to add its pages"""
+    STATUS = (
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    linit = models.ForeignKey(Linit, on_delete=models.CASCADE, related_name='ingests')
+    filename = models.CharField(max_length=255, help_text="Name of the uploaded ZIP or PDF.")
+    path = models.CharField(max_length=1024, help_text="Copy of the upload in LINIT_UPLOAD_DIR, removed once done.")
+    replace = models.BooleanField(default=False, help_text="Remove the pages the edition had.")
+
+    status = models.CharField(max_length=16, choices=STATUS, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    # Renewed as pages get ready, a RUNNING job not renewed for LINIT_INGEST_TIMEOUT seconds lost its worker
+    heartbeat = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'heartbeat'])]
+
+    def __str__(self):
+        return '%s into %s' % (self.filename, self.linit)
+
+    @property
+    def seconds(self):
+        if self.started and self.finished:
+            return round((self.finished - self.started).total_seconds(), 1)
+        return None
+
+
 class SpecialToken(models.Model):
     """This is intended for special use cases,
         where a feature needs to be an
@@ -375,6 +452,9 @@ class Timeline(models.Model):
 class TechBytes(models.Model):
     title = models.CharField(max_length=128)
     image = models.ImageField(upload_to='tb_images/', null=True, blank=True, validators=[validate_image_size])
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     body = models.TextField(blank=True, null=True)
     link = models.URLField(max_length=255, blank=True, null=True, help_text="Optional external link for the post")
     pub_date = models.DateTimeField(auto_now=True)
@@ -410,6 +490,9 @@ class Config(models.Model):
 class Sponsor(models.Model):
     name = models.CharField(max_length=255)
     logo = models.ImageField(upload_to='sponsors/', validators=[validate_image_size])
+    logo_placeholder = models.TextField(blank=True, default='', editable=False)
+    logo_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    logo_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     website = models.URLField(blank=True, null=True)
 
     def __str__(self):
@@ -418,9 +501,25 @@ class Sponsor(models.Model):
 class CTF(models.Model):
     name = models.CharField(max_length=255)
     photo = models.ImageField(upload_to='ctf/', validators=[validate_image_size])
+    photo_placeholder = models.TextField(blank=True, default='', editable=False)
+    photo_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    photo_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     link = models.URLField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class MediaBlob(models.Model):
+    """Content of uploaded files, every media file with this content is a hard link to it"""
+    digest = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the content")
+    name = models.CharField(max_length=255, help_text="Storage name of the blob")
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0, help_text="Media files linked to the blob")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Names linked to an existing blob share its old mtime, this is when the last one came or went
+    linked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,107 @@
+"""Low quality placeholders of the images shown on the site.
+
+A placeholder is a data URI of the image scaled down to PLACEHOLDER_SIZE pixels, a WebP of
+about a hundred bytes the frontend shows blurred while the image loads, together with the
+width and height of the image so the page can keep its box from the start. They are worked
+out once when an image is saved and stored next to it in `<field>_placeholder`,
+`<field>_width` and `<field>_height`. Images stored without `save()`, before this or by
+`bulk_create()`, are filled in by `manage.py backfill_placeholders`.
+"""
+import base64
+import io
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import pre_save
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Image fields with placeholders, by model
+FIELDS = {
+    'main.CarouselImage': ('image', 'mobile_image'),
+    'main.Event': ('event_image', ),
+    'main.Alumni': ('image', ),
+    'main.CTF': ('photo', ),
+    'main.TechBytes': ('image', ),
+    'main.Sponsor': ('logo', ),
+}
+# EXIF orientations that turn the image on its side
+ROTATED = (5, 6, 7, 8)
+ORIENTATION_TAG = 0x0112
+
+
+def columns(name):
+    """Model fields holding the placeholder, width and height of image field `name`"""
+    return '%s_placeholder' % name, '%s_width' % name, '%s_height' % name
+
+
+def size():
+    return getattr(settings, 'PLACEHOLDER_SIZE', 16)
+
+
+def compute(source, max_size=16):
+    """(data URI, width, height) of an image, `source` is a path or an open file"""
+    with Image.open(source) as image:
+        width, height = image.size
+        if image.getexif().get(ORIENTATION_TAG) in ROTATED:
+            width, height = height, width
+        # JPEGs are decoded at a fraction of their size right away
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if features.check('webp'):
+            image.save(buffer, 'WEBP', quality=40)
+            content_type = 'image/webp'
+        else:
+            image.save(buffer, 'PNG', optimize=True)
+            content_type = 'image/png'
+    return 'data:%s;base64,%s' % (content_type, base64.b64encode(buffer.getvalue()).decode()), width, height
+
+
+def compute_path(path, max_size=16):
+    """(`compute()`, None) for the worker processes of the backfill, (None, error) when the file can't be read"""
+    try:
+        return compute(path, max_size), None
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def for_file(field_file):
+    """`compute()` of a stored file or of one that is about to be saved"""
+    if field_file._committed:
+        with field_file.storage.open(field_file.name, 'rb') as stored:
+            return compute(stored, size())
+    upload = field_file.file
+    upload.seek(0)
+    try:
+        return compute(upload, size())
+    finally:
+        upload.seek(0)
+
+
+def update(sender, instance, **kwargs):
+    """Work out the placeholders of new images before `instance` is written"""
+    for name in FIELDS[sender._meta.label]:
+        field_file = getattr(instance, name)
+        placeholder_column, width_column, height_column = columns(name)
+        if not field_file:
+            values = ('', None, None)
+        elif not field_file._committed or not getattr(instance, placeholder_column):
+            try:
+                values = for_file(field_file)
+            except Exception:
+                logger.warning("No placeholder for %s of %s", field_file.name, instance, exc_info=True)
+                continue
+        else:
+            continue
+        for column, value in zip(columns(name), values):
+            setattr(instance, column, value)
+
+
+def connect_signals():
+    for label in FIELDS:
+        pre_save.connect(update, sender=apps.get_model(label), dispatch_uid='main.placeholders.%s' % label)
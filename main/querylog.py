@@ -0,0 +1,223 @@
+"""Slow-query log grouping the SQL of each view by fingerprint.
+
+`main.middleware.QueryLogMiddleware` times every statement of a request through
+`connection.execute_wrapper()`. Statements are reduced to fingerprints, the SQL with
+literals and parameter lists taken out, and counted per view with their total and
+maximum time. Every QUERYLOG_FLUSH_INTERVAL seconds the counts are appended as JSON
+lines to the rotating QUERYLOG_FILE, and statements slower than QUERYLOG_SLOW_MS are
+logged right away together with their EXPLAIN output. Parameter values are never
+logged, only their types, and quoted literals are taken out of EXPLAIN output, as they
+can hold passwords, tokens and addresses. `manage.py querylog_top` reads the log back and
+prints the worst offenders.
+"""
+import atexit
+import glob
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULTS = {
+    'QUERYLOG_ENABLED': False,
+    'QUERYLOG_SLOW_MS': 100,
+    'QUERYLOG_FLUSH_INTERVAL': 60,
+    'QUERYLOG_MAX_BYTES': 10 * 1024 * 1024,
+    'QUERYLOG_BACKUP_COUNT': 5,
+}
+
+record_logger = logging.getLogger('main.querylog.records')
+record_logger.propagate = False
+_handler_lock = threading.Lock()
+
+QUOTED_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+NORMALIZE = (
+    (QUOTED_LITERAL, '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+'), r'\1'),
+    (re.compile(r'\s+'), ' '),
+)
+
+_lock = threading.Lock()
+_totals = {}
+_local = threading.local()
+_last_flush = time.monotonic()
+
+
+def querylog_setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def log_file():
+    return getattr(settings, 'QUERYLOG_FILE', None) or os.path.join(settings.BASE_DIR, 'logs/querylog.jsonl')
+
+
+def fingerprint(sql):
+    """The statement with its literals taken out and a short id for it"""
+    normalized = sql
+    for pattern, replacement in NORMALIZE:
+        normalized = pattern.sub(replacement, normalized)
+    normalized = normalized.strip()
+    return hashlib.md5(normalized.encode()).hexdigest()[:12], normalized
+
+
+def add_handler():
+    """Attach the rotating file handler once, whichever thread logs first"""
+    with _handler_lock:
+        if record_logger.handlers:
+            return
+        os.makedirs(os.path.dirname(log_file()), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(log_file(),
+                                                       maxBytes=querylog_setting('QUERYLOG_MAX_BYTES'),
+                                                       backupCount=querylog_setting('QUERYLOG_BACKUP_COUNT'))
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        record_logger.setLevel(logging.INFO)
+        record_logger.addHandler(handler)
+
+
+def write(record):
+    if not record_logger.handlers:
+        add_handler()
+    record_logger.info(json.dumps(record, default=str))
+
+
+def param_types(params):
+    """Type names of the parameters of a statement, their values stay out of the log"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def explain(connection, sql, params):
+    """EXPLAIN output of a SELECT, None for other statements or when the database refuses"""
+    if not sql.lstrip().upper().startswith('SELECT') or connection.needs_rollback:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), sql), params)
+            plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+            # Plans repeat the values the statement filters on
+            return QUOTED_LITERAL.sub("'?'", plan)
+    except Exception as e:
+        return 'EXPLAIN failed: %s' % e
+
+
+def start_request():
+    _local.view = 'unresolved'
+    _local.queries = {}
+    _local.explaining = False
+
+
+def set_view(view):
+    _local.view = view
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """`connection.execute_wrapper()` hook timing the statements of the current request"""
+    queries = getattr(_local, 'queries', None)
+    if queries is None or _local.explaining:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        key, normalized = fingerprint(sql)
+        stats = queries.setdefault(key, {'sql': normalized, 'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += duration
+        stats['max'] = max(stats['max'], duration)
+
+        if duration * 1000 >= querylog_setting('QUERYLOG_SLOW_MS'):
+            _local.explaining = True
+            try:
+                plan = None if many else explain(context['connection'], sql, params)
+            finally:
+                _local.explaining = False
+            write({
+                'type': 'slow',
+                'time': time.time(),
+                'view': _local.view,
+                'fingerprint': key,
+                'sql': sql,
+                'param_types': param_types(params) if not many else None,
+                'duration': duration,
+                'explain': plan,
+            })
+
+
+def finish_request():
+    """Add the statements of the current request to the per-view totals"""
+    queries = getattr(_local, 'queries', None) or {}
+    view = _local.view
+    _local.queries = None
+    with _lock:
+        for key, stats in queries.items():
+            totals = _totals.setdefault((view, key), {'sql': stats['sql'], 'count': 0, 'total': 0.0, 'max': 0.0})
+            totals['count'] += stats['count']
+            totals['total'] += stats['total']
+            totals['max'] = max(totals['max'], stats['max'])
+    if time.monotonic() - _last_flush >= querylog_setting('QUERYLOG_FLUSH_INTERVAL'):
+        flush()
+
+
+def flush():
+    """Append the totals since the last flush to the log and start counting again"""
+    global _last_flush, _totals
+    with _lock:
+        totals, _totals = _totals, {}
+        _last_flush = time.monotonic()
+    now = time.time()
+    for (view, key), stats in totals.items():
+        write(dict(stats, type='stats', time=now, view=view, fingerprint=key, pid=os.getpid()))
+
+
+atexit.register(flush)
+
+
+def read_records(path=None):
+    """Records of the log and its rotated backups, oldest first"""
+    path = path or log_file()
+    backups = [name for name in glob.glob(path + '.*') if name.rsplit('.', 1)[1].isdigit()]
+    # RotatingFileHandler keeps the oldest lines in the highest numbered backup
+    backups.sort(key=lambda name: int(name.rsplit('.', 1)[1]), reverse=True)
+    for name in backups + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name) as records:
+            for line in records:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def top(records, sort='total', view=None):
+    """Sum the stats records per view and fingerprint, worst first"""
+    summed = {}
+    for record in records:
+        if record.get('type') != 'stats' or (view and record['view'] != view):
+            continue
+        stats = summed.setdefault((record['view'], record['fingerprint']), {
+            'view': record['view'],
+            'fingerprint': record['fingerprint'],
+            'sql': record['sql'],
+            'count': 0,
+            'total': 0.0,
+            'max': 0.0,
+        })
+        stats['count'] += record['count']
+        stats['total'] += record['total']
+        stats['max'] = max(stats['max'], record['max'])
+    return sorted(summed.values(), key=lambda stats: stats[sort], reverse=True)
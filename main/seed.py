@@ -0,0 +1,365 @@
+"""Synthetic site content for benchmarks and load tests.
+
+Everything is generated from a seeded `random.Random` and written with `bulk_create`
+in batches, so the same seed always gives the same rows and large volumes stay fast.
+Unique identifiers and usernames are numbered on from the seeded rows already there, and
+Linit editions take the years not taken yet, so seeding again adds rows.
+`bulk_create()` skips `Model.save()`, the generators fill in what `save()` would.
+Image fields all point at a few placeholder images, generated once and shared.
+"""
+import datetime
+import io
+import itertools
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from blog.models import Comment, Post, reading_stats
+from mailer.models import MailSent
+from main.models import CTF, Alumni, Event, Linit, LinitImage, Profile, Project, TechBytes, Timeline
+
+# Rows of each model created per scale by `seed()`
+SCALES = {
+    'small': 100,
+    'medium': 10000,
+    'large': 100000,
+}
+
+# Generated rows are prefixed so they are easy to tell from (and delete next to) real content
+PREFIX = 'seed'
+
+# Dates are spread around a fixed day so a seed gives the same rows whenever it runs
+ANCHOR = datetime.datetime(2025, 1, 1, 12, tzinfo=datetime.timezone.utc)
+
+WORDS = ('linux', 'kernel', 'open', 'source', 'workshop', 'python', 'git', 'hackathon', 'talk', 'shell', 'network',
+         'security', 'container', 'compiler', 'editor', 'desktop', 'server', 'community', 'release', 'install',
+         'debug', 'package', 'license', 'freedom', 'terminal', 'script', 'web', 'database', 'cloud', 'meetup')
+FIRST_NAMES = ('Aarav', 'Ananya', 'Rohan', 'Priya', 'Arjun', 'Sneha', 'Vikram', 'Kavya', 'Rahul', 'Ishita', 'Aditya',
+               'Neha', 'Karan', 'Pooja', 'Siddharth', 'Meera')
+LAST_NAMES = ('Sharma', 'Verma', 'Gupta', 'Singh', 'Das', 'Roy', 'Iyer', 'Nair', 'Reddy', 'Mehta', 'Bose', 'Kumar')
+
+
+def counts_for(scale):
+    """Rows per model for one of `SCALES`"""
+    rows = SCALES[scale]
+    return {
+        'events': rows,
+        'timeline': rows,
+        'alumni': rows,
+        'profiles': max(1, rows // 10),
+        'projects': max(1, rows // 10),
+        'techbytes': max(1, rows // 10),
+        'ctf': max(1, rows // 100),
+        # One edition a year, LinitPages looks them up by year
+        'linit': max(1, min(20, rows // 10)),
+        'linit_pages': rows,
+        'posts': max(1, rows // 10),
+        'comments': rows,
+        'campaigns': max(1, rows // 10),
+    }
+
+# Share of the comments that are replies to another comment
+REPLY_SHARE = 0.3
+# Comment.parent_id is a SmallIntegerField, only comments with smaller ids can be replied to
+MAX_PARENT_ID = 32767
+
+# name: (size, background colour) of the shared placeholder images
+PLACEHOLDERS = {
+    'wide': ((1200, 630), (52, 73, 94)),
+    'square': ((400, 400), (22, 160, 133)),
+    'page': ((620, 877), (236, 240, 241)),
+}
+
+
+def sentence(rng, low=4, high=10):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def paragraphs(rng, count):
+    return '\n\n'.join('%s.' % sentence(rng, 12, 30) for _ in range(count))
+
+
+def moment(rng, past_days, future_days=0):
+    return ANCHOR + datetime.timedelta(days=rng.randint(-past_days, future_days), minutes=rng.randint(0, 24 * 60))
+
+
+def passout_year(rng):
+    # Recent batches are the largest
+    return ANCHOR.year - 1 - min(int(rng.expovariate(0.25)), 15)
+
+
+def placeholder(kind):
+    """Storage name of a placeholder image, generated on first use"""
+    name = '%s/placeholder-%s.png' % (PREFIX, kind)
+    if not default_storage.exists(name):
+        size, colour = PLACEHOLDERS[kind]
+        image = Image.new('RGB', size, colour)
+        ImageDraw.Draw(image).text((size[0] // 10, size[1] // 2), 'GLUG %s placeholder' % kind, fill=(255, 255, 255))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return name
+
+
+def next_number(model, field, stem):
+    """First number not used yet by the generated `<stem><number>` values of a unique field"""
+    values = model.objects.filter(**{'%s__startswith' % field: stem}).values_list(field, flat=True)
+    numbers = (value[len(stem):] for value in values.iterator())
+    return max((int(number) for number in numbers if number.isdigit()), default=-1) + 1
+
+
+def maybe(rng, share, value):
+    return value if rng.random() < share else None
+
+
+def in_batches(objs, batch_size):
+    objs = iter(objs)
+    while True:
+        batch = list(itertools.islice(objs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def create(model, objs, batch_size):
+    created = 0
+    for batch in in_batches(objs, batch_size):
+        # One commit per batch instead of one per INSERT statement
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def events(rng, count):
+    image = placeholder('wide')
+    start = next_number(Event, 'identifier', '%s-event-' % PREFIX)
+    for i in range(start, start + count):
+        timing = moment(rng, 6 * 365, 60)
+        status = 'FINAL' if rng.random() < 0.9 else 'DRAFT'
+        event_type = rng.choice(Event.TYPE)[0]
+        yield Event(identifier='%s-event-%d' % (PREFIX, i),
+                    title=sentence(rng, 2, 6),
+                    description=paragraphs(rng, rng.randint(1, 4)),
+                    event_image=maybe(rng, 0.7, image),
+                    event_type=event_type,
+                    venue=None if event_type == 'ONLINE' else 'Seminar hall %d' % rng.randint(1, 5),
+                    url='https://example.com/%s-event-%d' % (PREFIX, i) if event_type == 'ONLINE' else None,
+                    event_timing=timing,
+                    status=status,
+                    show=status == 'FINAL',
+                    featured=rng.random() < 0.05,
+                    upcoming=timing > ANCHOR)
+
+
+def timeline(rng, count):
+    for _ in range(count):
+        yield Timeline(event_name=sentence(rng, 2, 6),
+                       detail=paragraphs(rng, 1),
+                       event_time=moment(rng, 3 * 365).date())
+
+
+def alumni(rng, count):
+    image = placeholder('square')
+    for _ in range(count):
+        yield Alumni(first_name=rng.choice(FIRST_NAMES),
+                     last_name=rng.choice(LAST_NAMES),
+                     bio=sentence(rng, 8, 20),
+                     image=maybe(rng, 0.5, image),
+                     degree_name=rng.choice(Alumni.DEGREE)[0],
+                     passout_year=passout_year(rng),
+                     position=sentence(rng, 2, 4) if rng.random() < 0.6 else None)
+
+
+def create_profiles(rng, count, batch_size):
+    """Members with their users, created user batch by user batch as profiles need the user ids"""
+    image = placeholder('square')
+    start = next_number(User, 'username', '%s-member-' % PREFIX)
+    created = 0
+    for batch in in_batches(range(start, start + count), batch_size):
+        usernames = ['%s-member-%d' % (PREFIX, i) for i in batch]
+        with transaction.atomic():
+            # An unusable password, the same '!' prefix set_unusable_password() stores
+            User.objects.bulk_create([User(username=username, password='!', is_staff=True) for username in usernames])
+            # bulk_create() only sets primary keys on PostgreSQL, read them back
+            user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+            Profile.objects.bulk_create([
+                Profile(first_name=rng.choice(FIRST_NAMES),
+                        last_name=rng.choice(LAST_NAMES),
+                        user_id=user_ids[username],
+                        bio=sentence(rng, 8, 20),
+                        image=maybe(rng, 0.8, image),
+                        degree_name=rng.choice(Profile.DEGREE)[0],
+                        passout_year=ANCHOR.year + rng.randint(0, 3)) for username in usernames
+            ])
+        created += len(batch)
+    return created
+
+
+def projects(rng, count):
+    image = placeholder('wide')
+    start = next_number(Project, 'identifier', '%s-project-' % PREFIX)
+    for i in range(start, start + count):
+        yield Project(identifier='%s-project-%d' % (PREFIX, i),
+                      title=sentence(rng, 2, 5),
+                      description=paragraphs(rng, rng.randint(1, 3)),
+                      gitlink='https://github.com/example/%s-project-%d' % (PREFIX, i),
+                      image=maybe(rng, 0.6, image))
+
+
+def techbytes(rng, count):
+    image = placeholder('wide')
+    for i in range(count):
+        yield TechBytes(title=sentence(rng, 2, 6)[:128],
+                        image=maybe(rng, 0.8, image),
+                        body=paragraphs(rng, rng.randint(1, 5)),
+                        link=maybe(rng, 0.3, 'https://example.com/%s-techbytes-%d' % (PREFIX, i)))
+
+
+def ctfs(rng, count):
+    image = placeholder('square')
+    for i in range(count):
+        yield CTF(name='%s CTF %d' % (sentence(rng, 1, 3), i),
+                  photo=image,
+                  link=maybe(rng, 0.7, 'https://ctftime.org/event/%d' % rng.randint(1, 3000)),
+                  description=paragraphs(rng, 1))
+
+
+def linits(rng, count):
+    image = placeholder('wide')
+    # LinitPages looks editions up by year, a year must not get a second one
+    taken = set(Linit.objects.values_list('year_edition', flat=True))
+    years = (year for year in itertools.count(ANCHOR.year, -1) if year not in taken)
+    for year in itertools.islice(years, count):
+        yield Linit(title='Linit %d' % year, description=sentence(rng, 10, 25), image=image, year_edition=year)
+
+
+def linit_pages(rng, count):
+    # The seeded editions are the ones with the placeholder cover
+    editions = list(Linit.objects.filter(image=placeholder('wide')).order_by('-year_edition').values_list('id',
+                                                                                                        flat=True))
+    if not editions:
+        return
+    image = placeholder('page')
+    # Magazines of about the same length, in page order
+    for i in range(count):
+        yield LinitImage(linit_year_id=editions[i * len(editions) // count], image=image)
+
+
+def author():
+    user, created = User.objects.get_or_create(username='%s-author' % PREFIX, defaults={'password': '!'})
+    return user
+
+
+def posts(rng, count):
+    user = author()
+    image = placeholder('wide')
+    # A pool of bodies keeps reading_stats() off the per-row path
+    bodies = []
+    for _ in range(min(count, 50)):
+        body = ''.join('<p>%s.</p>' % sentence(rng, 20, 60) for _ in range(rng.randint(2, 12)))
+        bodies.append((body, ) + reading_stats(body))
+    start = next_number(Post, 'identifier', '%s-post-' % PREFIX)
+    for i in range(start, start + count):
+        body, excerpt, word_count, reading_time = rng.choice(bodies)
+        yield Post(identifier='%s-post-%d' % (PREFIX, i),
+                   title=sentence(rng, 3, 8),
+                   author_user=user,
+                   author_name=user.username,
+                   thumbnail_image=maybe(rng, 0.7, image),
+                   content_body=body,
+                   excerpt=excerpt,
+                   word_count=word_count,
+                   reading_time=reading_time,
+                   date_to_show=moment(rng, 3 * 365),
+                   show=rng.random() < 0.95,
+                   featured=rng.random() < 0.05)
+
+
+def comment(rng, post_id, parent_id=0):
+    return Comment(post_id=post_id,
+                   parent_id=parent_id,
+                   user_social_id=str(rng.randint(10**8, 10**9)),
+                   user_social_name='%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+                   data=sentence(rng, 3, 30))
+
+
+def top_level_comments(rng, post_ids, count):
+    for _ in range(count):
+        # A few posts draw most of the discussion
+        yield comment(rng, post_ids[min(int(rng.paretovariate(1.2)) - 1, len(post_ids) - 1)])
+
+
+def replies(rng, parents, count):
+    for _ in range(count):
+        parent_id, post_id = rng.choice(parents)
+        yield comment(rng, post_id, parent_id)
+
+
+def create_comments(rng, count, batch_size):
+    """Comments on the seeded posts, REPLY_SHARE of them replies to earlier comments"""
+    seeded = Comment.objects.filter(post__identifier__startswith='%s-post-' % PREFIX)
+    post_ids = list(Post.objects.filter(identifier__startswith='%s-post-' % PREFIX).order_by('id').values_list(
+        'id', flat=True))
+    if not post_ids:
+        return 0
+    reply_count = int(count * REPLY_SHARE)
+    created = create(Comment, top_level_comments(rng, post_ids, count - reply_count), batch_size)
+
+    parents = list(
+        seeded.filter(parent_id=0, id__lte=MAX_PARENT_ID).order_by('id').values_list('id', 'post_id')[:count])
+    if not parents:
+        return created + create(Comment, top_level_comments(rng, post_ids, reply_count), batch_size)
+    return created + create(Comment, replies(rng, parents, reply_count), batch_size)
+
+
+def campaigns(rng, count):
+    user = author()
+    for i in range(count):
+        queued = moment(rng, 2 * 365)
+        recipients = rng.randint(1, 500)
+        campaign = MailSent(subject=sentence(rng, 3, 8),
+                            body=paragraphs(rng, 2),
+                            from_email='noreply@example.com',
+                            to='%s-group-%d' % (PREFIX, i % 10),
+                            status='SENT',
+                            recipient_count=recipients,
+                            sent_count=recipients,
+                            batch_count=1,
+                            batches_done=1,
+                            sent_by=user,
+                            time=queued,
+                            finished=queued + datetime.timedelta(minutes=rng.randint(1, 30)))
+        campaign.update_search_keys()
+        yield campaign
+
+
+def seed(rng, counts, batch_size=1000, log=None):
+    """Create `counts` rows per model, returns the number of rows created per model"""
+    created = {}
+    steps = (
+        ('events', lambda count: create(Event, events(rng, count), batch_size)),
+        ('timeline', lambda count: create(Timeline, timeline(rng, count), batch_size)),
+        ('alumni', lambda count: create(Alumni, alumni(rng, count), batch_size)),
+        ('profiles', lambda count: create_profiles(rng, count, batch_size)),
+        ('projects', lambda count: create(Project, projects(rng, count), batch_size)),
+        ('techbytes', lambda count: create(TechBytes, techbytes(rng, count), batch_size)),
+        ('ctf', lambda count: create(CTF, ctfs(rng, count), batch_size)),
+        ('linit', lambda count: create(Linit, linits(rng, count), batch_size)),
+        ('linit_pages', lambda count: create(LinitImage, linit_pages(rng, count), batch_size)),
+        ('posts', lambda count: create(Post, posts(rng, count), batch_size)),
+        ('comments', lambda count: create_comments(rng, count, batch_size)),
+        ('campaigns', lambda count: create(MailSent, campaigns(rng, count), batch_size)),
+    )
+    for name, step in steps:
+        if not counts.get(name):
+            continue
+        started = timezone.now()
+        created[name] = step(counts[name])
+        if log:
+            log("%s: %d rows in %.1fs" % (name, created[name], (timezone.now() - started).total_seconds()))
+    return created
@@ -1,22 +1,140 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
 from main.models import Config, Event,CTF, Sponsor,Profile, Facad, Alumni, About, Project, Contact, Activity, CarouselImage, Linit, Timeline, TechBytes, DevPost
+from main import metrics, placeholders
 import datetime
 import markdown
 
 
-class UserSerializer(serializers.ModelSerializer):
+def _param_set(params, name):
+    return {field.strip() for field in params.get(name, '').split(',') if field.strip()}
+
+
+def placeholder_sources(image):
+    """`Meta.field_sources` entry of an `ImagePlaceholderField`"""
+    return (image, ) + placeholders.columns(image)
+
+
+class ImagePlaceholderField(serializers.Field):
+    """Placeholder data URI, width and height of image field `image`, see main/placeholders.py"""
+
+    def __init__(self, image, **kwargs):
+        self.image = image
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        placeholder, width, height = (getattr(obj, column) for column in placeholders.columns(self.image))
+        if not getattr(obj, self.image) or not placeholder:
+            return None
+        return {'placeholder': placeholder, 'width': width, 'height': height}
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """Model serializer with sparse fieldsets and opt-in expansion driven by the query string.
+
+    `?fields=a,b` keeps only the listed fields, `?omit=a,b` drops fields and `?expand=x`
+    adds the nested fields declared in `Meta.expandable_fields` as
+    `{'name': (SerializerClass, {kwargs})}`. Only the top level serializer of a response
+    reacts to them, so fields that are not asked for are never computed.
+
+    `Meta.field_sources` maps method fields to the model fields they read and
+    `Meta.always_load` lists model fields that are read whatever is requested,
+    which lets `narrow()` load nothing but the needed columns.
+    """
+
+    def is_top_level(self):
+        # Nested serializers share the root's context but not its fieldset
+        return self.parent is None or (isinstance(self.parent, serializers.ListSerializer)
+                                       and self.parent.parent is None)
+
+    def fieldset_params(self):
+        request = self.context.get('request')
+        if request is None or not self.is_top_level():
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        return _param_set(params, 'fields'), _param_set(params, 'omit'), _param_set(params, 'expand')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        params = self.fieldset_params()
+        if params is None:
+            return fields
+        requested, omitted, expanded = params
+
+        for name, (serializer_class, kwargs) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expanded:
+                fields[name] = serializer_class(**kwargs)
+        if requested:
+            for name in list(fields):
+                if name not in requested and name not in expanded:
+                    del fields[name]
+        for name in omitted:
+            fields.pop(name, None)
+        return fields
+
+    def to_representation(self, instance):
+        if not self.is_top_level():
+            return super().to_representation(instance)
+        # Nested serializers run inside their parent's timer
+        with metrics.serializer_timer():
+            return super().to_representation(instance)
+
+    def narrow(self, queryset, always_load=()):
+        """Restrict a queryset to the columns and relations the current fields read, plus `always_load`"""
+        opts = self.Meta.model._meta
+        field_sources = getattr(self.Meta, 'field_sources', {})
+        columns = set(getattr(self.Meta, 'always_load', ())) | set(always_load)
+        select_related = set()
+        prefetch_related = set()
+
+        for name, field in self.fields.items():
+            if name in field_sources:
+                paths = field_sources[name]
+            elif isinstance(field, serializers.SerializerMethodField):
+                paths = []
+            elif field.source == '*':
+                # Reads the whole object, there is nothing to narrow
+                return queryset
+            else:
+                paths = [field.source.replace('.', '__')]
+
+            for path in paths:
+                head = path.split('__')[0]
+                try:
+                    model_field = opts.get_field(head)
+                except FieldDoesNotExist:
+                    # A property or method of the model, it might read any column
+                    return queryset
+                if model_field.is_relation and not (model_field.concrete and not model_field.many_to_many):
+                    # Reverse relations and many to many fields are prefetched whole
+                    prefetch_related.add(head)
+                    continue
+                if model_field.is_relation and (path != head or isinstance(field, serializers.BaseSerializer)):
+                    select_related.add(head)
+                columns.add(path)
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset.only(*columns) if columns else queryset.only(opts.pk.name)
+
+
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'is_staff')
 
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(DynamicFieldsModelSerializer):
     """Event fields serializer"""
     show_bool = serializers.SerializerMethodField('check_show')
     description_markdown = serializers.SerializerMethodField()
     bts_image_url = serializers.SerializerMethodField()
     bts_video_url = serializers.SerializerMethodField()
+    event_image_placeholder = ImagePlaceholderField('event_image')
 
     def check_show(self, obj):
         if obj.show == False:
@@ -55,16 +173,29 @@ class EventSerializer(serializers.ModelSerializer):
             return self.context['request'].build_absolute_uri(obj.bts_video.url)
         return None
 
+    def to_representation(self, obj):
+        # Hidden events are blanked even when show_bool isn't requested
+        self.check_show(obj)
+        return super().to_representation(obj)
+
     class Meta:
         model = Event
         fields = (
             'show_bool', 'id', 'identifier', 'title', 'description', 'description_markdown', 
-            'venue', 'url', 'event_timing', 'facebook_link', 'event_image', 'status', 
+            'venue', 'url', 'event_timing', 'facebook_link', 'event_image', 'event_image_placeholder', 'status', 
             'featured', 'upcoming', 'bts_description', 'bts_image', 'bts_image_url', 
             'bts_video', 'bts_video_url', 'bts_uploaded_at'
         )
-
-class ProfileSerializer(serializers.ModelSerializer):
+        always_load = ('show', )
+        field_sources = {
+            'show_bool': ('show', ),
+            'description_markdown': ('description', ),
+            'bts_image_url': ('bts_image', ),
+            'bts_video_url': ('bts_video', ),
+            'event_image_placeholder': placeholder_sources('event_image'),
+        }
+
+class ProfileSerializer(DynamicFieldsModelSerializer):
     """Profile serializer"""
     # Using Metod field to get a field value of OnetoOneFiled
     user_name = serializers.SerializerMethodField('get_username')
@@ -84,28 +215,39 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ('id', 'user_name', 'first_name', 'last_name', 'alias', 'bio', 'year_name', 'position', 'email',
                   'image', 'degree_name', 'git_link', 'facebook_link', 'reddit_link', 'linkedin_link')
-
-class FacadSerializer(serializers.ModelSerializer):
+        field_sources = {
+            'user_name': ('user__username', ),
+            'year_name': ('passout_year', ),
+        }
+        expandable_fields = {
+            'user': (UserSerializer, {'read_only': True}),
+        }
+
+class FacadSerializer(DynamicFieldsModelSerializer):
     """Faculty Advisor serializer"""
     class Meta:
         model = Facad
         fields = ('id', 'post', 'first_name', 'last_name', 'linkedin_link', 'email', 'image')
 
-class AlumniSerializer(serializers.ModelSerializer):
+class AlumniSerializer(DynamicFieldsModelSerializer):
     """Alumni Profile serializer"""
+    image_placeholder = ImagePlaceholderField('image')
+
     class Meta:
         model = Alumni
         fields = ('id', 'first_name', 'last_name', 'alias', 'bio', 'passout_year', 'position', 'email',
-                  'image', 'degree_name', 'git_link', 'facebook_link', 'twitter_link', 'reddit_link', 'linkedin_link')
+                  'image', 'image_placeholder', 'degree_name', 'git_link', 'facebook_link', 'twitter_link',
+                  'reddit_link', 'linkedin_link')
+        field_sources = {'image_placeholder': placeholder_sources('image')}
 
 
-class AboutSerializer(serializers.ModelSerializer):
+class AboutSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = About
         fields = ('identifier', 'heading', 'content')
 
 
-class ProjectSerializers(serializers.ModelSerializer):
+class ProjectSerializers(DynamicFieldsModelSerializer):
     description_markdown = serializers.SerializerMethodField()
 
     def get_description_markdown(self, obj):
@@ -116,37 +258,47 @@ class ProjectSerializers(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = ('id', 'identifier', 'title', 'description', 'description_markdown', 'gitlink')
+        field_sources = {'description_markdown': ('description', )}
 
 
-class ContactSerializers(serializers.ModelSerializer):
+class ContactSerializers(DynamicFieldsModelSerializer):
     class Meta:
         model = Contact
         fields = ('id', 'name', 'email', 'phone_number', 'message')
 
 
-class ActivitySerializers(serializers.ModelSerializer):
+class ActivitySerializers(DynamicFieldsModelSerializer):
     class Meta:
         model = Activity
         fields = ('title', 'description', 'image')
 
 
-class CarouselImageSerializers(serializers.ModelSerializer):
+class CarouselImageSerializers(DynamicFieldsModelSerializer):
+    image_placeholder = ImagePlaceholderField('image')
+    mobile_image_placeholder = ImagePlaceholderField('mobile_image')
+
     class Meta:
         model = CarouselImage
-        fields = ('identifier', 'image', 'mobile_image', 'heading', 'sub_heading')
+        fields = ('identifier', 'image', 'image_placeholder', 'mobile_image', 'mobile_image_placeholder', 'heading',
+                  'sub_heading')
+        field_sources = {
+            'image_placeholder': placeholder_sources('image'),
+            'mobile_image_placeholder': placeholder_sources('mobile_image'),
+        }
 
 
-class LinitSerializers(serializers.ModelSerializer):
+class LinitSerializers(DynamicFieldsModelSerializer):
     class Meta:
         model = Linit
         fields = ('title', 'description', 'image', 'year_edition')
 
 
-class TimelineSerializers(serializers.ModelSerializer):
+class TimelineSerializers(DynamicFieldsModelSerializer):
     detail_markdown = serializers.SerializerMethodField()
     class Meta:
         model = Timeline
         fields = ('id', 'event_name', 'detail', 'detail_markdown', 'event_time')
+        field_sources = {'detail_markdown': ('detail', )}
 
     def get_detail_markdown(self, obj):
         if obj.detail:
@@ -154,8 +306,9 @@ class TimelineSerializers(serializers.ModelSerializer):
         return None
 
 
-class TechBytesSerializers(serializers.ModelSerializer):
+class TechBytesSerializers(DynamicFieldsModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_placeholder = ImagePlaceholderField('image')
 
     def get_image_url(self, obj):
         if obj.image:
@@ -164,23 +317,25 @@ class TechBytesSerializers(serializers.ModelSerializer):
 
     class Meta:
         model = TechBytes
-        fields = ('id', 'title', 'image', 'image_url', 'body', 'link', 'pub_date')
+        fields = ('id', 'title', 'image', 'image_url', 'image_placeholder', 'body', 'link', 'pub_date')
+        field_sources = {'image_url': ('image', ), 'image_placeholder': placeholder_sources('image')}
 
 
-class DevPostSerializers(serializers.ModelSerializer):
+class DevPostSerializers(DynamicFieldsModelSerializer):
     class Meta:
         model = DevPost
         fields = '__all__'
 
 
-class ConfigSerializers(serializers.ModelSerializer):
+class ConfigSerializers(DynamicFieldsModelSerializer):
     class Meta:
         model = Config
         fields = ('key', 'value', 'enable')
 
 
-class SponsorSerializer(serializers.ModelSerializer):
+class SponsorSerializer(DynamicFieldsModelSerializer):
     logo_url = serializers.SerializerMethodField()
+    logo_placeholder = ImagePlaceholderField('logo')
 
     def get_logo_url(self, obj):
         if obj.logo:
@@ -189,11 +344,13 @@ class SponsorSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Sponsor  # This will now work
-        fields = ('id', 'name', 'logo', 'logo_url', 'website')
+        fields = ('id', 'name', 'logo', 'logo_url', 'logo_placeholder', 'website')
+        field_sources = {'logo_url': ('logo', ), 'logo_placeholder': placeholder_sources('logo')}
 
 
-class CTFSerializer(serializers.ModelSerializer):
+class CTFSerializer(DynamicFieldsModelSerializer):
     photo_url = serializers.SerializerMethodField()
+    photo_placeholder = ImagePlaceholderField('photo')
 
     def get_photo_url(self, obj):
         if obj.photo:
@@ -202,4 +359,5 @@ class CTFSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CTF
-        fields = ('id', 'name', 'photo', 'photo_url', 'link', 'description', 'created_at')
\ No newline at end of file
+        fields = ('id', 'name', 'photo', 'photo_url', 'photo_placeholder', 'link', 'description', 'created_at')
+        field_sources = {'photo_url': ('photo', ), 'photo_placeholder': placeholder_sources('photo')}
@@ -0,0 +1,319 @@
+"""Static JSON snapshots of the public API.
+
+Every GET endpoint of a DRF view in the URLconf that anonymous clients may read, lists and
+details, is rendered the way an anonymous request gets it and written to SNAPSHOT_ROOT as
+`<url path>/index.json`, with a gzipped copy next to it. The front proxy can serve those
+without the app and fall back to Django when a file is missing. Files are only rewritten when
+their content changed, and the files of endpoints that are gone, deleted objects or views that
+answer 404 or 410, are removed. Rendering is never throttled, and an endpoint that fails for now
+keeps its last snapshot.
+
+With SNAPSHOT_ENABLED, saving or deleting an object re-renders its detail and the lists of its
+model SNAPSHOT_DELAY seconds after the commit, bulk writes call `bulk_changed()` for the same.
+Changes nothing reports (related objects, `QuerySet.update()`, the passing of time) are picked
+up by the next `manage.py snapshot_api`.
+"""
+import functools
+import gzip
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.test import RequestFactory
+from django.urls import URLResolver, get_resolver
+from rest_framework.generics import GenericAPIView
+from rest_framework.request import Request
+from rest_framework.routers import APIRootView
+from rest_framework.views import APIView
+
+from main import throttling
+from main.async_views import PublicReadApplication, http_scope
+
+logger = logging.getLogger(__name__)
+
+# Models shown by endpoints without a queryset of their own
+EXTRA_MODELS = {
+    '/api/get_count/': ('main.Alumni', 'main.Profile', 'main.Event', 'main.Project'),
+}
+# Public, but only answer with a query string, which snapshots don't have
+EXCLUDED = {'/api/linit-pages/'}
+ARGUMENT = re.compile(r'\(\?P<(\w+)>[^)]*\)|<(?:\w+:)?(\w+)>')
+INDEX = 'index.json'
+# pks looked up per query by bulk_changed(), below SQLite's limit of query parameters
+BULK_LOOKUPS = 500
+# Statuses of endpoints whose snapshot is removed
+GONE = (404, 410)
+
+_application = None
+_pending = set()
+_pending_lock = threading.Lock()
+_timer = None
+
+
+def root():
+    return getattr(settings, 'SNAPSHOT_ROOT', os.path.join(settings.BASE_DIR, 'snapshot/'))
+
+
+# `path` is a list path, or a detail path with a `{lookup_kwarg}` placeholder
+Route = namedtuple('Route', 'path view model lookup_field lookup_kwarg')
+
+
+def url_patterns(patterns=None, prefix=''):
+    """(path template, view callback) of every URL pattern below `patterns`, the whole URLconf by default"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern).lstrip('^').rstrip('$')
+        if isinstance(pattern, URLResolver):
+            yield from url_patterns(pattern.url_patterns, route)
+        else:
+            yield '/' + ARGUMENT.sub(lambda match: '{%s}' % (match.group(1) or match.group(2)), route), pattern.callback
+
+
+def anonymous_view(callback, path):
+    """The view of `callback` set up for an anonymous GET request of `path`"""
+    request = Request(RequestFactory().get(path))
+    request.user = AnonymousUser()
+    view = callback.cls(**callback.initkwargs)
+    actions = getattr(callback, 'actions', None)
+    if actions:
+        view.action_map = actions
+        view.action = actions['get']
+    view.request = request
+    view.args, view.kwargs = (), {}
+    view.format_kwarg = None
+    return view
+
+
+def is_public(view):
+    return all(permission.has_permission(view.request, view) for permission in view.get_permissions())
+
+
+@functools.lru_cache(maxsize=None)
+def routes():
+    """Every GET endpoint of a DRF view anonymous clients may read, with at most the lookup in its path"""
+    found = []
+    for path, callback in url_patterns():
+        view_class = getattr(callback, 'cls', None)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, APIRootView):
+            continue
+        actions = getattr(callback, 'actions', None)
+        if (actions is not None and 'get' not in actions) or 'get' not in view_class.http_method_names:
+            continue
+        if actions is None and not hasattr(view_class, 'get'):
+            continue
+        if path in EXCLUDED:
+            continue
+        view = anonymous_view(callback, path)
+        lookup_field = getattr(view, 'lookup_field', 'pk')
+        lookup_kwarg = getattr(view, 'lookup_url_kwarg', None) or lookup_field
+        # Format suffixes and paths with more than the lookup can't be listed
+        arguments = set(re.findall(r'{(\w+)}', path))
+        if arguments - {lookup_kwarg}:
+            continue
+        if not arguments:
+            lookup_kwarg = None
+        if not is_public(view):
+            continue
+        model = view.get_queryset().model if isinstance(view, GenericAPIView) else None
+        found.append(Route(path, view, model, lookup_field, lookup_kwarg))
+    return tuple(found)
+
+
+def detail_paths(route):
+    for value in route.view.get_queryset().values_list(route.lookup_field, flat=True).iterator():
+        yield route.path.format(**{route.lookup_kwarg: value})
+
+
+def all_paths():
+    for route in routes():
+        if route.lookup_kwarg is None:
+            yield route.path
+        else:
+            yield from detail_paths(route)
+
+
+def paths_for(instance):
+    """Endpoints showing `instance`"""
+    label = instance._meta.label
+    for route in routes():
+        if route.model is not None and route.model._meta.label == label:
+            if route.lookup_kwarg is None:
+                yield route.path
+            else:
+                yield route.path.format(**{route.lookup_kwarg: getattr(instance, route.lookup_field)})
+        elif label in EXTRA_MODELS.get(route.path, ()):
+            yield route.path
+
+
+def render(path):
+    """Status and body of an anonymous JSON request for `path`"""
+    global _application
+    if _application is None:
+        _application = PublicReadApplication(ASGIHandler())
+    url = urlsplit(getattr(settings, 'WARMUP_URL', 'http://localhost:8000'))
+    headers = [(b'host', url.netloc.encode()), (b'accept', b'application/json')]
+    if url.scheme == 'https':
+        headers.append((b'x-forwarded-proto', b'https'))
+    # Every render comes from this host, the throttles would soon answer 429 for all of them
+    with throttling.disabled():
+        status, headers, body = _application.render(http_scope(path, headers=headers))
+    return status, body
+
+
+def file_for(path):
+    return os.path.join(root(), path.strip('/'), INDEX)
+
+
+def replace(file_path, content):
+    """Write `content` to `file_path` atomically, a proxy never serves half a file"""
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, file_path)
+
+
+def write(path, body):
+    """Store the snapshot of `path`, False when it already had this content"""
+    file_path = file_for(path)
+    try:
+        with open(file_path, 'rb') as existing:
+            if existing.read() == body:
+                return False
+    except OSError:
+        pass
+    # No timestamp in the gzip header, the same body always gives the same file
+    replace(file_path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+    replace(file_path, body)
+    return True
+
+
+def remove(path):
+    """Remove the snapshot of `path`, False when there was none"""
+    file_path = file_for(path)
+    removed = False
+    for name in (file_path, file_path + '.gz'):
+        try:
+            os.remove(name)
+            removed = True
+        except FileNotFoundError:
+            pass
+    try:
+        os.removedirs(os.path.dirname(file_path))
+    except OSError:
+        # Not empty, e.g. a list that still has its details below it
+        pass
+    return removed
+
+
+def stored_paths():
+    for directory, dirnames, filenames in os.walk(root()):
+        if INDEX in filenames:
+            yield '/%s/' % os.path.relpath(directory, root()).replace(os.sep, '/')
+
+
+def export(paths, prune=(), log=None):
+    """Render `paths` and update their snapshots, removing those of every other path starting with one of `prune`.
+
+    Only endpoints that are gone (404 or 410) lose their snapshot, one that failed for now, e.g.
+    with a 429 or 5xx, keeps the last good one. Returns the number of written, unchanged,
+    removed and failed files.
+    """
+    counts = {'written': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+    kept = set()
+    for path in paths:
+        status, body = render(path)
+        if status == 200:
+            kept.add(path)
+            counts['written' if write(path, body) else 'unchanged'] += 1
+        elif status in GONE:
+            if remove(path):
+                counts['removed'] += 1
+        else:
+            kept.add(path)
+            counts['failed'] += 1
+        if log:
+            log(path, status)
+    if prune:
+        for path in set(stored_paths()) - kept:
+            if path.startswith(tuple(prune)) and remove(path):
+                counts['removed'] += 1
+    return counts
+
+
+def flush():
+    global _timer
+    with _pending_lock:
+        paths = sorted(_pending)
+        _pending.clear()
+        _timer = None
+    try:
+        counts = export(paths)
+        logger.info("Snapshots of %d endpoints updated: %s", len(paths), counts)
+    except Exception:
+        logger.exception("Updating the snapshots failed")
+    finally:
+        # Timer threads don't end requests, nothing else would close their connections
+        connections.close_all()
+
+
+def schedule(paths):
+    global _timer
+    with _pending_lock:
+        _pending.update(paths)
+        # Changes saved together, e.g. from one admin action, are rendered once
+        if _timer is None:
+            _timer = threading.Timer(getattr(settings, 'SNAPSHOT_DELAY', 5), flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+def changed(sender, instance, **kwargs):
+    paths = list(paths_for(instance))
+    if paths:
+        transaction.on_commit(lambda: schedule(paths))
+
+
+def bulk_changed(model, pks):
+    """Schedule the endpoints of objects written without signals, by `bulk_create()` or `bulk_update()`.
+
+    Objects created without getting their pk back, e.g. on SQLite, only update the lists, their
+    details have no snapshot yet and are answered by Django.
+    """
+    if not getattr(settings, 'SNAPSHOT_ENABLED', False):
+        return
+    pks = [pk for pk in pks if pk is not None]
+    label = model._meta.label
+    paths = set()
+    for route in routes():
+        if route.model is not None and route.model._meta.label == label:
+            if route.lookup_kwarg is None:
+                paths.add(route.path)
+                continue
+            for start in range(0, len(pks), BULK_LOOKUPS):
+                values = route.view.get_queryset().filter(pk__in=pks[start:start + BULK_LOOKUPS])
+                paths.update(route.path.format(**{route.lookup_kwarg: value})
+                             for value in values.values_list(route.lookup_field, flat=True))
+        elif label in EXTRA_MODELS.get(route.path, ()):
+            paths.add(route.path)
+    if paths:
+        transaction.on_commit(lambda: schedule(paths))
+
+
+def connect_signals():
+    if not getattr(settings, 'SNAPSHOT_ENABLED', False):
+        return
+    post_save.connect(changed, dispatch_uid='main.snapshot.save')
+    post_delete.connect(changed, dispatch_uid='main.snapshot.delete')
@@ -0,0 +1,125 @@
+"""Media storage that keeps one copy of each file content.
+
+Uploads are stored under their usual `upload_to` names, so URLs and paths look as before,
+but every name is a hard link to a blob named by the SHA-256 of the content under
+`blobs/`. Uploading a poster that is already stored, for an event and again for the
+timeline, adds a name and no data. `MediaBlob` keeps the number of names linked to each
+blob, read from the link count of its file, and the blob goes with its last name. Files
+stored before are left as they are until `manage.py dedupe_media` links them to their blobs.
+
+Hard links need the names and blobs on one filesystem, where linking fails the file is
+simply kept as a copy.
+"""
+import hashlib
+import logging
+import os
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.utils.crypto import get_random_string
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """SHA-256 and size of the file at `path`"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as stored:
+        for chunk in iter(lambda: stored.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def blob_name(digest):
+    return '%s/%s/%s' % (BLOB_DIR, digest[:2], digest)
+
+
+def is_blob(name):
+    return name.replace('\\', '/').startswith(BLOB_DIR + '/')
+
+
+def media_files(root):
+    """`os.DirEntry` of every file below `root`, the blobs left out"""
+    if not os.path.isdir(root):
+        return
+    blobs = os.path.join(root, BLOB_DIR)
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path != blobs:
+                        directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.endswith('.tmp'):
+                    yield entry
+
+
+def link(source, path):
+    """Make `path` a hard link to `source`, replacing it atomically"""
+    tmp_path = '%s.%s.tmp' % (path, get_random_string(8))
+    os.link(source, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+def references(blob_path):
+    """Names linked to a blob, every link but the blob's own"""
+    return os.stat(blob_path).st_nlink - 1
+
+
+def record(digest, size, refcount):
+    """Store the reference count of the blob of `digest`, forgetting it when there are none"""
+    MediaBlob = apps.get_model('main', 'MediaBlob')
+    if refcount > 0:
+        MediaBlob.objects.update_or_create(digest=digest,
+                                           defaults={
+                                               'name': blob_name(digest),
+                                               'size': size,
+                                               'refcount': refcount
+                                           })
+    else:
+        MediaBlob.objects.filter(digest=digest).delete()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        if is_blob(name):
+            return name
+        path = self.path(name)
+        digest, size = file_digest(path)
+        blob_path = self.path(blob_name(digest))
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            try:
+                # New content, the file just written becomes the blob
+                os.link(path, blob_path)
+            except FileExistsError:
+                link(blob_path, path)
+        except OSError:
+            logger.warning("Could not link %s to its blob, keeping a copy", name, exc_info=True)
+            return name
+        record(digest, size, references(blob_path))
+        return name
+
+    def delete(self, name):
+        path = self.path(name)
+        if is_blob(name) or not os.path.isfile(path):
+            return super().delete(name)
+        digest, size = file_digest(path)
+        blob_path = self.path(blob_name(digest))
+        linked = os.path.exists(blob_path) and os.path.samefile(path, blob_path)
+        super().delete(name)
+        if linked:
+            refcount = references(blob_path)
+            if refcount == 0:
+                super().delete(blob_name(digest))
+            record(digest, size, refcount)
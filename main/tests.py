@@ -1,3 +1,610 @@
-from django.test import TestCase
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from blog.models import Comment, Post
+from glug_website.db import pool, router
+from glug_website.db.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from main.async_views import PublicReadApplication, StreamingASGIHandler, http_scope
+from main import archive, imports, linit, snapshot, storage, throttling
+from main.models import Alumni, Event, Linit, LinitIngest, MediaBlob
+
+_aliases = itertools.count()
+
+
+def new_alias():
+    """An alias of its own per test, pools and stats are kept per alias for the whole process"""
+    return 'pool-test-%d' % next(_aliases)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.alias = new_alias()
+        self.opened = []
+
+    def connect(self):
+        raw_connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.opened.append(raw_connection)
+        return raw_connection
+
+    def stats(self):
+        return pool._stats[self.alias]
+
+    def test_released_connection_is_reused(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=2, max_age=300, timeout=1)
+        first, opened = connection_pool.acquire(self.connect)
+        connection_pool.release(first, opened)
+        second, _ = connection_pool.acquire(self.connect)
+        self.assertIs(second, first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual((self.stats()['opened'], self.stats()['reused']), (1, 1))
+
+    def test_in_use_and_idle_counters(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=3, max_age=300, timeout=1)
+        checked_out = [connection_pool.acquire(self.connect) for _ in range(3)]
+        self.assertEqual((connection_pool.in_use, len(connection_pool.idle)), (3, 0))
+        for raw_connection, opened in checked_out[:2]:
+            connection_pool.release(raw_connection, opened)
+        self.assertEqual((connection_pool.in_use, len(connection_pool.idle)), (1, 2))
+        connection_pool.acquire(self.connect)
+        self.assertEqual((connection_pool.in_use, len(connection_pool.idle)), (2, 1))
+
+        pool._pools[(self.alias, os.getpid())] = connection_pool
+        try:
+            gauges = {(name, labels['alias']): value for name, kind, help_text, labels, value in pool.samples()
+                      if kind == 'gauge'}
+        finally:
+            del pool._pools[(self.alias, os.getpid())]
+        self.assertEqual(gauges[('glug_db_pool_connections_in_use', self.alias)], 2)
+        self.assertEqual(gauges[('glug_db_pool_connections_idle', self.alias)], 1)
+
+    def test_broken_connection_is_evicted(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=1, max_age=300, timeout=1)
+        raw_connection, opened = connection_pool.acquire(self.connect)
+        connection_pool.release(raw_connection, opened)
+        # The server dropped it while it was idle
+        raw_connection.close()
+
+        replacement, _ = connection_pool.acquire(self.connect)
+        self.assertIsNot(replacement, raw_connection)
+        self.assertTrue(pool.check(replacement))
+        self.assertEqual(self.stats()['health_check_failures'], 1)
+        self.assertEqual(self.stats()['closed'], 1)
+        self.assertEqual((connection_pool.in_use, len(connection_pool.idle)), (1, 0))
+
+    def test_connection_past_max_age_is_replaced(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=1, max_age=300, timeout=1)
+        raw_connection, opened = connection_pool.acquire(self.connect)
+        connection_pool.release(raw_connection, opened - 301)
+        self.assertEqual(connection_pool.idle, [])
+        self.assertIsNot(connection_pool.acquire(self.connect)[0], raw_connection)
+
+    def test_unusable_connection_is_not_returned(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=1, max_age=300, timeout=1)
+        raw_connection, opened = connection_pool.acquire(self.connect)
+        connection_pool.release(raw_connection, opened, reusable=False)
+        self.assertEqual((connection_pool.in_use, len(connection_pool.idle)), (0, 0))
+        self.assertFalse(pool.check(raw_connection))
+
+    def test_full_pool_times_out(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=1, max_age=300, timeout=0.05)
+        connection_pool.acquire(self.connect)
+        with self.assertRaises(pool.PoolExhausted):
+            connection_pool.acquire(self.connect)
+        self.assertEqual(self.stats()['waits'], 1)
+        self.assertEqual(connection_pool.in_use, 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        connection_pool = pool.ConnectionPool(self.alias, size=1, max_age=300, timeout=0.05)
+        with self.assertRaises(sqlite3.OperationalError):
+            connection_pool.acquire(lambda: sqlite3.connect('/nonexistent/directory/db.sqlite3'))
+        self.assertEqual(connection_pool.in_use, 0)
+        connection_pool.acquire(self.connect)
+
+
+class PooledBackendTests(SimpleTestCase):
+    """The SQLite stand-in of the PostgreSQL backend, checking out of and back into the pool"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.alias = new_alias()
+        self.settings_dict = dict(connections['default'].settings_dict,
+                                  NAME=os.path.join(self.directory, 'pool.sqlite3'),
+                                  POOL_SIZE=2,
+                                  POOL_MAX_AGE=300,
+                                  POOL_TIMEOUT=1,
+                                  HEALTH_CHECKS=True,
+                                  CONN_MAX_AGE=0)
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        pool.close_idle_pools()
+        pool._pools.pop((self.alias, os.getpid()), None)
+        shutil.rmtree(self.directory)
+
+    def wrapper(self):
+        """A connection as another thread would get it"""
+        wrapper = PooledSQLiteWrapper(self.settings_dict, self.alias)
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def pool(self):
+        return pool.get_pool(self.alias, self.settings_dict)
+
+    def test_closed_connection_goes_back_to_the_pool(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw_connection = first.connection
+        self.assertEqual(self.pool().in_use, 1)
+        first.close()
+        self.assertIsNone(first.connection)
+        self.assertEqual((self.pool().in_use, len(self.pool().idle)), (0, 1))
+
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(second.connection, raw_connection)
+        self.assertEqual(pool._stats[self.alias]['opened'], 1)
+
+    def test_connections_in_use_are_not_shared(self):
+        first, second = self.wrapper(), self.wrapper()
+        first.ensure_connection()
+        second.ensure_connection()
+        self.assertIsNot(first.connection, second.connection)
+        self.assertEqual(self.pool().in_use, 2)
+
+    def test_broken_pooled_connection_is_replaced(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw_connection = first.connection
+        first.close()
+        raw_connection.close()
+
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIsNot(second.connection, raw_connection)
+        self.assertEqual(pool._stats[self.alias]['health_check_failures'], 1)
+
+    def test_open_transaction_is_not_returned(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        first.set_autocommit(False)
+        first.close()
+        self.assertEqual((self.pool().in_use, len(self.pool().idle)), (0, 0))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Two SQLite databases, the second one standing in for the replica with rows of its own"""
+    replica = 'replica'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        replica_settings = dict(connections['default'].settings_dict,
+                                NAME=os.path.join(cls.directory, 'replica.sqlite3'),
+                                POOL_SIZE=0)
+        # Added after the test case set up its databases, the tests manage this one themselves
+        connections.databases[cls.replica] = replica_settings
+        cls.settings_override = override_settings(DATABASES=dict(settings.DATABASES, **{cls.replica: replica_settings}),
+                                                  DB_REPLICA_ALIAS=cls.replica,
+                                                  DB_REPLICA_STICKY_SECONDS=10)
+        cls.settings_override.enable()
+        call_command('migrate', database=cls.replica, run_syncdb=True, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.databases[cls.replica]
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        router._down_until.clear()
+        self.user = User.objects.create_superuser('writer', 'writer@example.com', 'password')
+        self.post = Post.objects.create(identifier='post', title="Post", author_user=self.user, content_body="Body")
+        Comment.objects.create(post=self.post, data="on the primary")
+        User.objects.using(self.replica).create(pk=self.user.pk, username='writer')
+        Post.objects.using(self.replica).create(pk=self.post.pk, identifier='post', title="Post",
+                                                author_user_id=self.user.pk, content_body="Body")
+        Comment.objects.using(self.replica).create(post_id=self.post.pk, data="on the replica")
+
+    def tearDown(self):
+        for model in (Token, Comment, Post, User):
+            model.objects.using(self.replica).all().delete()
+
+    def comments(self, client, **headers):
+        return [comment['data'] for comment in client.get('/blog/comments/', **headers).json()]
+
+    def test_router_sends_reads_to_the_replica_only_during_replica_requests(self):
+        db_router = router.ReplicaRouter()
+        self.assertEqual(db_router.db_for_read(Comment), 'default')
+        router.start_request(True)
+        try:
+            self.assertEqual(db_router.db_for_read(Comment), self.replica)
+            self.assertEqual(db_router.db_for_write(Comment), 'default')
+            # Reads after a write see it
+            self.assertEqual(db_router.db_for_read(Comment), 'default')
+        finally:
+            self.assertTrue(router.end_request())
+        self.assertEqual(db_router.db_for_read(Comment), 'default')
+
+    def test_public_reads_come_from_the_replica(self):
+        self.assertEqual(self.comments(Client()), ["on the replica"])
+
+    def test_admin_reads_stay_on_the_primary(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get('/admin/blog/comment/')
+        self.assertContains(response, "on the primary")
+        self.assertNotContains(response, "on the replica")
+
+    def test_writer_reads_its_own_writes_from_the_primary(self):
+        writer = Client()
+        writer.force_login(self.user)
+        response = writer.post('/blog/comments/', {'post': self.post.pk, 'data': "new", 'user_social_id': '1'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.comments(writer), ["on the primary", "new"])
+
+        # Other clients, here an anonymous one from the same address, still read from the replica
+        self.assertEqual(self.comments(Client()), ["on the replica"])
+
+        # The pin runs out after DB_REPLICA_STICKY_SECONDS
+        cache.clear()
+        self.assertEqual(self.comments(writer), ["on the replica"])
+
+    def test_pin_follows_the_authorization_header(self):
+        token = Token.objects.create(user=self.user)
+        Token.objects.using(self.replica).create(key=token.key, user_id=self.user.pk)
+        authorization = 'Token %s' % token.key
+        response = Client().post('/blog/comments/', {'post': self.post.pk, 'data': "new", 'user_social_id': '1'},
+                                 HTTP_AUTHORIZATION=authorization)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.comments(Client(), HTTP_AUTHORIZATION=authorization), ["on the primary", "new"])
+        self.assertEqual(self.comments(Client()), ["on the replica"])
+
+    def test_failing_replica_falls_back_to_the_primary(self):
+        router.mark_down(self.replica)
+        self.assertEqual(self.comments(Client()), ["on the primary"])
+
+
+class AsgiExportTests(TransactionTestCase):
+
+    def test_export_is_streamed_outside_the_event_loop(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        Alumni.objects.bulk_create(Alumni(first_name='Alumnus %d' % number, passout_year=2000 + number)
+                                   for number in range(12))
+        client = Client()
+        client.force_login(user)
+        cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+        scope = http_scope('/api/export/alumni/', 'format=jsonl',
+                           headers=[(b'host', b'localhost'), (b'cookie', cookie.encode())])
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        # Several chunks, each one a query
+        with override_settings(EXPORT_CHUNK_SIZE=5):
+            async_to_sync(PublicReadApplication(StreamingASGIHandler()))(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(len(body.splitlines()), 12)
+        self.assertFalse(messages[-1].get('more_body', False))
+
+
+class GcMediaTests(TransactionTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=os.path.join(self.directory, 'media'),
+                                                   MEDIA_GC_QUARANTINE_DIR=os.path.join(self.directory, 'quarantine'))
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def gc_media(self, *args):
+        call_command('gc_media', *args, grace_hours=1, stdout=open(os.devnull, 'w'))
+
+    def age(self, name):
+        old = time.time() - 7200
+        os.utime(default_storage.path(name), (old, old))
+
+    def test_name_linked_to_an_old_blob_is_kept_for_the_grace_period(self):
+        default_storage.save('posters/old.png', ContentFile(b'poster'))
+        self.age('posters/old.png')
+        # The blob row was saved when the name was linked, hours after the content was
+        new_name = default_storage.save('posters/new.png', ContentFile(b'poster'))
+        self.gc_media()
+        self.assertTrue(default_storage.exists(new_name))
+
+        MediaBlob.objects.update(linked_at=MediaBlob.objects.get().linked_at - timedelta(hours=2))
+        self.gc_media()
+        self.assertFalse(default_storage.exists(new_name))
+        self.assertFalse(default_storage.exists('posters/old.png'))
+        self.assertEqual(MediaBlob.objects.count(), 0)
+
+    def test_quarantine_keeps_the_blob_counts(self):
+        default_storage.save('posters/kept.png', ContentFile(b'poster'))
+        default_storage.save('posters/orphan.png', ContentFile(b'poster'))
+        self.age('posters/orphan.png')
+        MediaBlob.objects.update(linked_at=MediaBlob.objects.get().linked_at - timedelta(hours=2))
+        Post.objects.create(identifier='post', title="Post", author_user=User.objects.create(username='author'),
+                            content_body="Body", thumbnail_image='posters/kept.png')
+        self.gc_media('--quarantine')
+
+        with open(os.path.join(self.directory, 'quarantine', 'posters', 'orphan.png'), 'rb') as quarantined:
+            self.assertEqual(quarantined.read(), b'poster')
+        self.assertFalse(default_storage.exists('posters/orphan.png'))
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.refcount, 1)
+        self.assertEqual(storage.references(default_storage.path(blob.name)), 1)
+
+
+class LinitIngestTests(TransactionTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=os.path.join(self.directory, 'media'),
+                                                   LINIT_UPLOAD_DIR=os.path.join(self.directory, 'uploads'),
+                                                   LINIT_INGEST_TIMEOUT=60)
+        self.settings_override.enable()
+        self.edition = Linit.objects.create(title="Linit 2024", year_edition=2024)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def upload(self, pages=2):
+        content = BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            for number in range(1, pages + 1):
+                page = BytesIO()
+                Image.new('RGB', (40, 60), 'white').save(page, 'PNG')
+                archive.writestr('page%d.png' % number, page.getvalue())
+        return SimpleUploadedFile('linit.zip', content.getvalue())
+
+    def test_one_job_per_edition_at_a_time(self):
+        job = linit.queue(self.edition, self.upload())
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertTrue(os.path.isfile(job.path))
+        self.assertIsNone(linit.queue(self.edition, self.upload()))
+        self.assertEqual(os.listdir(os.path.dirname(job.path)), [os.path.basename(job.path)])
+
+    def test_worker_adds_the_pages(self):
+        job = linit.queue(self.edition, self.upload(pages=3))
+        self.assertEqual(linit.run_worker(once=True, workers=1), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done, job.total, job.attempts), ('DONE', 3, 3, 1))
+        self.assertIsNotNone(job.seconds)
+        self.assertEqual(self.edition.linitimage_set.count(), 3)
+        self.assertFalse(os.path.exists(job.path))
+        self.assertFalse(linit.is_active(linit.latest_job(self.edition)))
+
+    def test_job_of_a_silent_worker_is_taken_over(self):
+        job = linit.queue(self.edition, self.upload())
+        self.assertEqual(linit.claim().pk, job.pk)
+        self.assertIsNone(linit.claim())
+
+        for attempt in range(linit.MAX_ATTEMPTS - 1):
+            LinitIngest.objects.update(heartbeat=timezone.now() - timedelta(seconds=61))
+            self.assertEqual(linit.claim().pk, job.pk)
+        self.assertEqual(LinitIngest.objects.get().attempts, linit.MAX_ATTEMPTS)
+
+        # A file that keeps killing its worker is given up
+        LinitIngest.objects.update(heartbeat=timezone.now() - timedelta(seconds=61))
+        self.assertIsNone(linit.claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertFalse(os.path.exists(job.path))
+
+
+class AlumniByYearTests(TransactionTestCase):
+
+    def test_alumni_are_grouped_by_passout_year(self):
+        for first_name, passout_year in (("Ada", 2019), ("Bo", 2020), ("Cy", 2019)):
+            Alumni.objects.create(first_name=first_name, passout_year=passout_year)
+        data = Client().get('/api/alumni-by-year/', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(list(data), ['2020', '2019'])
+        self.assertEqual([alumnus['first_name'] for alumnus in data['2019']], ["Ada", "Cy"])
+        self.assertIn('image_placeholder', data['2020'][0])
+
+        data = Client().get('/api/alumni-by-year/?fields=first_name', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data['2020'], [{'first_name': "Bo"}])
+
+
+class SnapshotTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        rest_framework = dict(settings.REST_FRAMEWORK,
+                              DEFAULT_THROTTLE_RATES=dict(settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                                                          **{'comments.read': '5/min'}))
+        self.settings_override = override_settings(SNAPSHOT_ROOT=self.directory, REST_FRAMEWORK=rest_framework)
+        self.settings_override.enable()
+        user = User.objects.create(username='author')
+        self.post = Post.objects.create(identifier='post', title="Post", author_user=user, content_body="Body")
+        self.comments = Comment.objects.bulk_create(Comment(post=self.post, data="Comment %d" % number)
+                                                    for number in range(12))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_more_renders_than_the_read_rate_allows(self):
+        paths = ['/blog/comments/'] + ['/blog/comments/%d/' % comment.pk for comment in Comment.objects.all()]
+        counts = snapshot.export(paths, ['/blog/comments/'])
+        self.assertEqual((counts['written'], counts['failed']), (13, 0))
+        self.assertEqual(len(list(snapshot.stored_paths())), 13)
+        # Clients are still limited
+        statuses = {Client().get('/blog/comments/').status_code for _ in range(6)}
+        self.assertEqual(statuses, {200, 429})
+
+    def test_failed_render_keeps_the_last_snapshot(self):
+        first, second = ['/blog/comments/%d/' % comment.pk for comment in Comment.objects.all()[:2]]
+        snapshot.export([first, second])
+        Comment.objects.filter(pk=second.split('/')[-2]).delete()
+
+        with mock.patch('main.snapshot.render', return_value=(503, b'')):
+            counts = snapshot.export([first], ['/blog/comments/'])
+        self.assertEqual(counts['failed'], 1)
+        # The failed path is kept, the one not rendered at all is pruned
+        self.assertEqual(set(snapshot.stored_paths()), {first})
+
+        # A deleted object answers 404 and loses its snapshot
+        snapshot.write(second, b'{}')
+        self.assertEqual(snapshot.export([second])['removed'], 1)
+
+
+class SnapshotBulkWriteTests(TransactionTestCase):
+
+    def test_import_schedules_the_endpoints_it_changed(self):
+        event = Event.objects.create(identifier='install-fest', title="Install Fest", event_type='TALK', status='FINAL')
+        stream = StringIO('identifier,title,event_type,status,add_to_timeline,event_timing\n'
+                          'install-fest,Install Fest 2024,TALK,FINAL,1,2024-03-01 10:00\n'
+                          'hackathon,Hackathon,WORKSHOP,FINAL,0,\n')
+        with override_settings(SNAPSHOT_ENABLED=True), mock.patch('main.snapshot.schedule') as schedule:
+            report = imports.import_rows('events', 'csv', stream)
+        self.assertEqual((report.counts['created'], report.counts['updated']), (1, 1))
+        scheduled = set().union(*(call.args[0] for call in schedule.call_args_list))
+        self.assertLessEqual({'/api/events/', '/api/events/install-fest/', '/api/upcoming-events/%d/' % event.pk,
+                              '/api/get_count/', '/api/timeline/', '/api/timeline_monthly/'}, scheduled)
+
+    def test_nothing_is_scheduled_without_snapshots(self):
+        with mock.patch('main.snapshot.schedule') as schedule:
+            imports.import_rows('alumni', 'csv', StringIO('first_name,passout_year\nAda,2020\n'))
+        self.assertFalse(schedule.called)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_is_capped_at_the_capacity(self):
+        results = []
+        start = threading.Barrier(20)
+
+        def client():
+            start.wait()
+            results.append(throttling.take_token('burst', '5/min'))
+
+        threads = [threading.Thread(target=client) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        allowed = results.count(None)
+        self.assertGreaterEqual(allowed, 1)
+        self.assertLessEqual(allowed, 5)
+
+    def test_request_is_denied_while_the_bucket_is_locked(self):
+        cache.add('throttle:locked:lock', 1, throttling.LOCK_TIMEOUT)
+        self.assertEqual(throttling.take_token('locked', '5/min'), throttling.LOCK_RETRY_AFTER)
+        self.assertIsNone(cache.get('throttle:locked'))
+
+        cache.delete('throttle:locked:lock')
+        self.assertIsNone(throttling.take_token('locked', '5/min'))
+        tokens, refilled_at = cache.get('throttle:locked')
+        self.assertEqual(round(tokens), 4)
+
+
+class SessionTests(TransactionTestCase):
+
+    def create_session(self, user=None, expire_date=None):
+        store = SessionStore()
+        if user is not None:
+            store['_auth_user_id'] = str(user.pk)
+        store.create()
+        if expire_date is not None:
+            Session.objects.filter(session_key=store.session_key).update(expire_date=expire_date)
+        return store.session_key
+
+    def test_change_list_decodes_the_page_in_one_pass(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        users = [User.objects.create_user('user%d' % i) for i in range(5)]
+        for user in users + [None, None]:
+            self.create_session(user)
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:sessions_session_changelist')
+        client.get(url)
+
+        # The users of every session on the page come from a single query
+        with mock.patch.object(Session, 'get_decoded', side_effect=AssertionError("decoded one by one")):
+            with self.assertNumQueries(6):
+                response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sessions = response.context['cl'].result_list
+        self.assertEqual({str(session.session_user) for session in sessions if session.session_user},
+                         {user.username for user in users} | {'admin'})
+        model_admin = response.context['cl'].model_admin
+        for session in sessions:
+            self.assertEqual(model_admin._session_data(session), session.decoded_data)
+
+    def test_purge_deletes_expired_sessions_in_chunks(self):
+        past = timezone.now() - timedelta(days=1)
+        expired = {self.create_session(expire_date=past) for _ in range(5)}
+        live = {self.create_session() for _ in range(2)}
+
+        with mock.patch.object(Session.objects, 'filter', wraps=Session.objects.filter) as session_filter:
+            call_command('purge_sessions', chunk_size=2, stdout=open(os.devnull, 'w'))
+        remaining = set(Session.objects.values_list('session_key', flat=True))
+        self.assertEqual(remaining, live)
+        self.assertFalse(expired & remaining)
+        # 3 chunks of at most 2 sessions deleted by key
+        chunks = [call.kwargs['session_key__in'] for call in session_filter.call_args_list
+                  if 'session_key__in' in call.kwargs]
+        self.assertEqual([len(keys) for keys in chunks], [2, 2, 1])
+
+
+class LogArchiveTests(SimpleTestCase):
+
+    def test_pending_batch_is_archived_as_written(self):
+        records = {'2020-01': [{'id': 1, 'object_repr': "Café", 'change_message': ''}]}
+        with tempfile.TemporaryDirectory() as archive_dir, self.settings(LOG_ARCHIVE_DIR=archive_dir):
+            archive.write_pending(records)
+            with open(archive.pending_path(), encoding='utf-8') as pending:
+                self.assertEqual(pending.read(), archive.dumps({'month': '2020-01', 'record': records['2020-01'][0]}))
+            archive.flush_pending(skip_archived=True)
+            self.assertFalse(os.path.exists(archive.pending_path()))
+            self.assertEqual(archive.search("café", ['2020-01']), records['2020-01'])
@@ -0,0 +1,166 @@
+"""Rate limiting for the public write paths, kept in the shared cache.
+
+Every client gets a token bucket holding up to `num` tokens of the configured rate, refilled
+continuously at `num` tokens per period. A request takes a token, so bursts are capped at
+`num` whenever they happen. The bucket is one cache entry of (tokens, last refill time),
+updated under a short cache lock, so enforcement never touches the database. A request that
+can't get the lock in time is denied rather than let through. Rates live in
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] as `<scope>.read` and `<scope>.write`, a missing
+rate means no limit.
+"""
+import contextlib
+import functools
+import hashlib
+import math
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Seconds a bucket lock is held at most, should its holder die
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_WAIT = 0.005
+# Seconds a request denied for want of the lock is told to wait
+LOCK_RETRY_AFTER = 1
+
+_local = threading.local()
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60)"""
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+@contextlib.contextmanager
+def bucket_lock(key):
+    """Hold the lock of a bucket while it is read and written back, yields whether it was acquired.
+
+    add() is atomic on every backend.
+    """
+    lock_key = '%s:lock' % key
+    locked = False
+    for attempt in range(LOCK_ATTEMPTS):
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if locked:
+            break
+        time.sleep(LOCK_WAIT)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def take_token(bucket, rate):
+    """Take a token from `bucket`, returns None when allowed or the seconds until the next token"""
+    capacity, duration = parse_rate(rate)
+    per_second = capacity / duration
+    key = 'throttle:%s' % bucket
+    with bucket_lock(key) as locked:
+        if not locked:
+            # Updating the bucket unlocked could lose tokens others took, a burst is exactly when that counts
+            return LOCK_RETRY_AFTER
+        now = time.time()
+        # A bucket missing from the cache is a full one, it is full again `duration` after its last use
+        tokens, refilled_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - refilled_at) * per_second)
+        if tokens < 1:
+            return (1 - tokens) / per_second
+        cache.set(key, (tokens - 1, now), duration + 1)
+    return None
+
+
+def bucket_name(scope, kind, ident):
+    # Hashed so any identity makes a valid memcached key
+    return '%s:%s:%s' % (scope, kind, hashlib.md5(ident.encode()).hexdigest())
+
+
+@contextlib.contextmanager
+def disabled():
+    """No limits for the requests this thread serves meanwhile, e.g. the snapshots of every endpoint.
+
+    Per thread rather than clearing DEFAULT_THROTTLE_RATES, the server goes on limiting its clients.
+    """
+    previous = getattr(_local, 'disabled', False)
+    _local.disabled = True
+    try:
+        yield
+    finally:
+        _local.disabled = previous
+
+
+def rate_for(scope, method):
+    if getattr(_local, 'disabled', False):
+        return None
+    return api_settings.DEFAULT_THROTTLE_RATES.get('%s.%s' % (scope, 'read' if method in SAFE_METHODS else 'write'))
+
+
+class BucketThrottle(BaseThrottle):
+    """Base for throttles that limit the view's `throttle_scope` per client identity"""
+    kind = None
+
+    def get_bucket_ident(self, request):
+        """Identity the bucket belongs to, None when the request should not be limited by this throttle"""
+        raise NotImplementedError('.get_bucket_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = getattr(view, 'throttle_scope', None)
+        rate = rate_for(scope, request.method) if scope else None
+        ident = self.get_bucket_ident(request) if rate else None
+        if ident is None:
+            return True
+
+        self.retry_after = take_token(bucket_name(scope, self.kind, ident), rate)
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPBucketThrottle(BucketThrottle):
+    """One bucket per client IP"""
+    kind = 'ip'
+
+    def get_bucket_ident(self, request):
+        return self.get_ident(request)
+
+
+class SocialIdBucketThrottle(BucketThrottle):
+    """One bucket per `user_social_id` a write is posted as, whatever IP it comes from"""
+    kind = 'social'
+
+    def get_bucket_ident(self, request):
+        if request.method in SAFE_METHODS:
+            return None
+        # A JSON list or string body has no user_social_id, it is limited by the client IP instead
+        if not isinstance(request.data, dict):
+            return self.get_ident(request)
+        social_id = request.data.get('user_social_id')
+        return str(social_id) if social_id else None
+
+
+def throttle(scope):
+    """Apply the IP bucket of `scope` to a plain Django view"""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            rate = rate_for(scope, request.method)
+            ident = IPBucketThrottle().get_ident(request)
+            if rate and ident:
+                retry_after = take_token(bucket_name(scope, 'ip', ident), rate)
+                if retry_after is not None:
+                    response = HttpResponse("Too many requests, try again later.", status=429)
+                    response['Retry-After'] = str(math.ceil(retry_after))
+                    return response
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
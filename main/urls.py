@@ -38,5 +38,6 @@ urlpatterns += [
     path('accounts/changeprofile/', views.change_profile, name='changerofile'),
     path('get_count/', views.GetCount.as_view(), name="get_count"),
     path('linit-pages/', views.LinitPages.as_view(), name="linit-pages"),
+    path('export/<slug:dataset>/', views.export_dataset, name="export"),
 ]
 
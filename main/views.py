@@ -1,13 +1,21 @@
+import hmac
 from calendar import month_name
 from datetime import date
+from django.conf import settings
 from django.shortcuts import render
 from rest_framework import viewsets, generics
 from django.contrib.auth.models import User
 from main.models import Config, Event, Profile, CTF,Facad, Alumni, About, Project, Contact, Activity, CarouselImage, Linit, Timeline, LinitImage, TechBytes, DevPost
-from main import serializers
+from main import cache as api_cache, exports, serializers, warmup
+from main.metrics import exposition
+from main.mixins import SparseFieldsetMixin
+from main.throttling import throttle
 from main.forms import ProfileForm, ProfileChangeForm, MemberRegistrationForm
-from django.http import HttpResponseRedirect
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse,
+                         StreamingHttpResponse)
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.urls import reverse
 from rest_framework.views import APIView
@@ -16,6 +24,47 @@ from rest_framework.permissions import AllowAny
 from collections import defaultdict
 
 
+def metrics(request):
+    """Request metrics for Prometheus, for bearers of METRICS_TOKEN only"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404
+    sent = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(sent.encode(), ('Bearer %s' % token).encode()):
+        return HttpResponse("Unauthorized", status=401)
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def ready(request):
+    """Readiness probe, ready once the warm-up of this process is done"""
+    if not warmup.is_ready() and not warmup.warm_up(blocking=False):
+        return JsonResponse({'status': 'warming up'}, status=503)
+    return JsonResponse({'status': 'ready'})
+
+
+def export_dataset(request, dataset):
+    """Stream a dataset as CSV or JSON lines, `?format=`, `?columns=` and column lookups as filters"""
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        allowed = exports.get_dataset(dataset).allowed(request.user)
+    except exports.ExportError:
+        raise Http404
+    if not allowed:
+        raise PermissionDenied
+    params = [(key, value) for key, values in request.GET.lists() if key not in ('format', 'columns')
+              for value in values]
+    try:
+        content_type, filename, chunks = exports.export(dataset, request.GET.get('format', 'csv'),
+                                                        request.GET.get('columns'), params)
+    except exports.ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+@throttle('register')
 def register(request):
     if request.method == "POST":
         # form = UserCreationForm(request.POST)
@@ -77,15 +126,10 @@ class GetCount(APIView):
     permission_classes = (AllowAny, )
 
     def get(self, request, format=None):
-        alumni = len(Alumni.objects.all())
-        members = len(Profile.objects.all())
-        events = len(Event.objects.all())
-        projects = len(Project.objects.all())
+        return Response(api_cache.counts())
 
-        return Response({"members": members, "alumni": alumni, "events": events, "projects": projects})
 
-
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all().order_by('-event_timing')
     serializer_class = serializers.EventSerializer
     lookup_field = 'identifier'
@@ -97,12 +141,12 @@ event_list = EventViewSet.as_view({'get': 'list'})
 event_detail = EventViewSet.as_view({'get': 'retrieve'})
 
 
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Profile.objects.all()
     serializer_class = serializers.ProfileSerializer
     http_method_names = ['get']
 
-class FacadViewSet(viewsets.ModelViewSet):
+class FacadViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows faculty advisors to be viewed or edited.
     """
@@ -110,16 +154,17 @@ class FacadViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.FacadSerializer
     http_method_names = ['get']
 
-class AlumniViewSet(viewsets.ModelViewSet):
+class AlumniViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Alumni.objects.all().order_by('-passout_year', 'first_name')
     serializer_class = serializers.AlumniSerializer
     http_method_names = ['get']
 
 
 # ViewSets define the view behavior.
-class AlumniByYearViewSet(viewsets.ModelViewSet):
+class AlumniByYearViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = serializers.AlumniSerializer
     http_method_names = ['get']
+    fieldset_always_load = ('passout_year', )
     #  We use the get_queryset() method instead of assigning a fixed queryset attribute 
     # such that the queryset is updated dynamically each time the view is accessed.
     def get_queryset(self):
@@ -128,60 +173,62 @@ class AlumniByYearViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         data = defaultdict(list)
-        queryset = self.get_queryset()
-        for alumni in queryset:
-            data[alumni.passout_year].append(self.serializer_class(alumni).data)
+        queryset = self.filter_queryset(self.get_queryset())
+        # One serializer for the whole list, building one per alumnus cost more than the rows themselves
+        alumni = list(queryset)
+        for alumnus, item in zip(alumni, self.get_serializer(alumni, many=True).data):
+            data[alumnus.passout_year].append(item)
         return Response(data)
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = serializers.UserSerializer
 
 
-class UserList(generics.ListAPIView):
+class UserList(SparseFieldsetMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = serializers.UserSerializer
 
 
-class UserDetail(generics.RetrieveAPIView):
+class UserDetail(SparseFieldsetMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = serializers.UserSerializer
     lookup_field = 'username'
 
 
-class AboutViewSet(viewsets.ModelViewSet):
+class AboutViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = About.objects.all()
     serializer_class = serializers.AboutSerializer
     lookup_field = 'identifier'
     http_method_names = ['get']
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = serializers.ProjectSerializers
     lookup_field = 'identifier'
     http_method_names = ['get']
 
 
-class ContactViewSet(viewsets.ModelViewSet):
+class ContactViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Contact.objects.all()
     serializer_class = serializers.ContactSerializers
     http_method_names = ['get']
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Activity.objects.all()
     serializer_class = serializers.ActivitySerializers
     http_method_names = ['get']
 
 
-class CarouselImageViewSet(viewsets.ModelViewSet):
+class CarouselImageViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = CarouselImage.objects.all()
     serializer_class = serializers.CarouselImageSerializers
     http_method_names = ['get']
 
 
-class LinitViewSet(viewsets.ModelViewSet):
+class LinitViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Linit.objects.all()
     serializer_class = serializers.LinitSerializers
     http_method_names = ['get']
@@ -193,22 +240,24 @@ class LinitPages(APIView):
     def get(self, request, format=None):
         year = request.GET['year']
         linit = Linit.objects.get(year_edition=int(year))
-        linit_images = LinitImage.objects.filter(linit_year=linit)
+        linit_images = LinitImage.objects.filter(linit_year=linit).order_by('pk')
         links = []
         for image in linit_images:
             links.append(request.build_absolute_uri(image.image.url))
         return Response({'links': links})
 
 
-class TimelineViewSet(viewsets.ModelViewSet):
+class TimelineViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Timeline.objects.all().order_by('-event_time')
     serializer_class = serializers.TimelineSerializers
     http_method_names = ['get']
 
-class MonthlyTimelineViewSet(viewsets.ModelViewSet):
+class MonthlyTimelineViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Timeline.objects.all()
     serializer_class = serializers.TimelineSerializers
     http_method_names = ['get']
+    fieldset_always_load = ('event_time', )
+
     def get_queryset(self):
         queryset = super().get_queryset()
         return queryset.order_by('-event_time')
@@ -220,7 +269,7 @@ class MonthlyTimelineViewSet(viewsets.ModelViewSet):
         for obj in queryset:
             
                 month_year = obj.event_time.strftime("%B %Y")
-                result.setdefault(month_year, []).append(serializers.TimelineSerializers(obj).data)
+                result.setdefault(month_year, []).append(self.get_serializer(obj).data)
         return result
 
     def list(self, request, *args, **kwargs):
@@ -228,29 +277,34 @@ class MonthlyTimelineViewSet(viewsets.ModelViewSet):
         grouped_by_month_year = self.group_by_month_year(queryset)
         return Response(grouped_by_month_year)
 
-class UpcomingEventViewSet(viewsets.ModelViewSet):
+class UpcomingEventViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all().filter(upcoming=True)
     serializer_class = serializers.EventSerializer
     http_method_names = ['get']
 
 
-class TechBytesViewSet(viewsets.ModelViewSet):
+class TechBytesViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = TechBytes.objects.all()
     serializer_class = serializers.TechBytesSerializers
     http_method_names = ['get']
 
-class DevPostViewSet(viewsets.ModelViewSet):
+class DevPostViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = DevPost.objects.all()
     serializer_class = serializers.DevPostSerializers
     http_method_names = ['get']
 
 
-class ConfigViewSet(viewsets.ModelViewSet):
+class ConfigViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Config.objects.all()
     serializer_class = serializers.ConfigSerializers
     http_method_names = ['get']
 
-class CTFViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        # Read by every page of the frontend, the rows come from the cache
+        serializer = self.get_serializer(api_cache.configs(), many=True)
+        return Response(serializer.data)
+
+class CTFViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = CTF.objects.all().order_by('-created_at')
     serializer_class = serializers.CTFSerializer
     http_method_names = ['get']  # Read-only API
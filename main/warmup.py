@@ -0,0 +1,69 @@
+"""Warm-up of a fresh server process.
+
+Fills what the first requests would otherwise pay for: the cached configs and counts, in
+ASGI mode the cached responses of the public reads, which only that mode serves, and the
+imports and database connection behind them.
+The production server runs it in the gunicorn master before forking the workers, see
+glug_website/gunicorn_conf.py, so they start warm and share that memory. `/ready` reports
+whether it is done, and tries again when it failed.
+"""
+import logging
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+from main import cache as api_cache
+from main.async_views import PublicReadApplication, http_scope
+
+logger = logging.getLogger(__name__)
+
+# Accept headers of the frontend's requests, the defaults of axios and fetch
+ACCEPT = ('application/json, text/plain, */*', '*/*')
+
+_lock = threading.Lock()
+_ready = False
+
+
+def is_ready():
+    return _ready
+
+
+def scopes():
+    """Requests for every public read as the clients of WARMUP_URL send them"""
+    url = urlsplit(getattr(settings, 'WARMUP_URL', 'http://localhost:8000'))
+    for prefix, group in api_cache.PUBLIC_READS:
+        for accept in ACCEPT:
+            # Browsers send an Origin with cross-origin requests only
+            for origin in ('', '%s://%s' % (url.scheme, url.netloc)):
+                headers = [(b'host', url.netloc.encode()), (b'accept', accept.encode())]
+                if url.scheme == 'https':
+                    headers.append((b'x-forwarded-proto', b'https'))
+                if origin:
+                    headers.append((b'origin', origin.encode()))
+                yield http_scope(prefix, headers=headers)
+
+
+def warm_up(blocking=True):
+    """Warm this process up once, whether it is warm. Without `blocking` gives up while another thread is at it."""
+    global _ready
+    if not _lock.acquire(blocking):
+        return False
+    try:
+        if _ready:
+            return True
+        api_cache.configs()
+        api_cache.counts()
+        if getattr(settings, 'SERVER_MODE', 'wsgi') == 'asgi' and api_cache.enabled():
+            application = PublicReadApplication(ASGIHandler())
+            for scope in scopes():
+                if not application.prime(scope):
+                    logger.warning("Warm-up could not cache %s for %s", scope['path'],
+                                   dict(scope['headers'])[b'host'])
+        _ready = True
+    except Exception:
+        logger.exception("Warm-up failed")
+    finally:
+        _lock.release()
+    return _ready